@@ -23,18 +23,44 @@ __path__ = __import__("pkgutil").extend_path(__path__, __name__)
 
 import sys
 
+from .content_digest import ContentDigest
+from .stage_timed_out import StageTimedOut
+from .wave_tracker import WaveTracker
+from .deadline import Deadline
+from .async_git import AsyncGit
+from .release_journal import ReleaseJournal
 from .repository_folder_helper import RepositoryFolderHelper
+from .git_attributes import GitAttributes
+from .repository_watcher import RepositoryWatcher
+from .sha256_cache import Sha256Cache
+from .sha256_prefetcher import Sha256Prefetcher
+from .version_allocator import VersionAllocator
+from .listener_logging import ListenerLogging
+from .listener_profiler import ListenerProfiler
 from .artifact_event_listener import ArtifactEventListener
+from .commit_batcher import CommitBatcher
 from .commit import Commit
 from .commit_push import CommitPush
 from .commit_tag import CommitTag
+from .flake_template_cache import FlakeTemplateCache
 from .abstract_artifact import AbstractArtifact
 from .architectural_role import ArchitecturalRole
+from .dependency_graph import DependencyGraph
+from .stage_history import StageHistory
+from .critical_path_scheduler import CriticalPathScheduler
 from .hexagonal_layer import HexagonalLayer
 from .pescio_space import PescioSpace
 from .python_package import PythonPackage
+from .classification_index import ClassificationIndex
+from .artifact_record import ArtifactRecord
+from .compact_artifact_registry import CompactArtifactRegistry
+from .registry_snapshot import RegistrySnapshot
 from .stage_input_update import StageInputUpdate
+from .stage_pipeline import StagePipeline
+from .shard_coordinator import ShardCoordinator
+from .flake_lock_updater import FlakeLockUpdater
 from .tag_push import TagPush
+from .release_train import ReleaseTrain
 
 # vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
 # Local Variables:
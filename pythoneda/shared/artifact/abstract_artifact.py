@@ -23,6 +23,8 @@ import abc
 from .commit import Commit
 from .commit_push import CommitPush
 from .commit_tag import CommitTag
+from .deadline import Deadline
+from .dependency_graph import DependencyGraph
 from pythoneda.shared import Event, EventListener, listen, PrimaryPort
 from pythoneda.shared.artifact.events import (
     ChangeStaged,
@@ -32,10 +34,14 @@ from pythoneda.shared.artifact.events import (
     TagPushed,
 )
 from pythoneda.shared.git import GitRepo
+from .listener_logging import ListenerLogging
+from .listener_profiler import ListenerProfiler
 from pythoneda.shared.nix.flake import NixFlake, NixFlakeInput
 from .repository_folder_helper import RepositoryFolderHelper
 from .stage_input_update import StageInputUpdate
+from .stage_timed_out import StageTimedOut
 from .tag_push import TagPush
+from .wave_tracker import WaveTracker
 from typing import Callable, List
 
 
@@ -107,6 +113,8 @@ class AbstractArtifact(NixFlake, EventListener, abc.ABC):
             copyrightYear,
             copyrightHolder,
         )
+        # so input cycles are known before any event runs into them.
+        DependencyGraph.instance().register(self)
 
     @classmethod
     @property
@@ -260,6 +268,31 @@ class AbstractArtifact(NixFlake, EventListener, abc.ABC):
         """
         pass
 
+    async def within_wave_of(self, event: Event, listener) -> Event:
+        """
+        Lets given listener react to given event, bounded by the deadline of its wave,
+        and profiled if enabled.
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        :param listener: The listener.
+        :type listener: pythoneda.shared.artifact.ArtifactEventListener
+        :return: The event the listener emits, or None if it got stuck.
+        :rtype: pythoneda.shared.Event
+        """
+        # chain every event to its wave, so the laps of a cycle share it.
+        WaveTracker.instance().wave_of(event)
+        with Deadline.for_wave_of(event):
+            try:
+                return await ListenerProfiler.instance().listen(listener, event)
+            except StageTimedOut as err:
+                AbstractArtifact.logger().error(
+                    "%s gave up on %s: %s",
+                    listener.__class__.__name__,
+                    ListenerLogging.brief(event),
+                    err,
+                )
+                return None
+
     async def commit_after_ChangeStaged(
         self, event: ChangeStaged
     ) -> StagedChangesCommitted:
@@ -272,12 +305,14 @@ class AbstractArtifact(NixFlake, EventListener, abc.ABC):
         of this artifact.
         :rtype: pythoneda.shared.artifact.events.StagedChangesCommitted
         """
-        Artifact.logger().debug("5. ChangeStaged -> StagedChangesCommitted")
+        AbstractArtifact.logger().debug("5. ChangeStaged -> StagedChangesCommitted")
         result = None
         dep = self.extract_input(event)
         if dep is not None:
-            Artifact.logger().debug(f"ChangeStaged for {dep}")
-            result = await Commit(self.repository_folder).listen(event)
+            AbstractArtifact.logger().debug("ChangeStaged for %s", dep)
+            result = await self.within_wave_of(
+                event, Commit(self.repository_folder)
+            )
         return result
 
     async def push_commit_after_StagedChangesCommitted(
@@ -294,21 +329,23 @@ class AbstractArtifact(NixFlake, EventListener, abc.ABC):
         proceed = self.event_refers_to_me(event)
 
         if proceed:
-            Artifact.logger().debug(
+            AbstractArtifact.logger().debug(
                 "1. StagedChangesCommitted -> CommittedChangesPushed"
             )
         else:
             dep = self.extract_input(event)
             if dep is not None:
-                Artifact.logger().debug(
+                AbstractArtifact.logger().debug(
                     "11. StagedChangesCommitted -> CommittedChangesPushed"
                 )
                 proceed = True
         if proceed:
-            Artifact.logger().debug(
-                f"StagedChangesCommitted for {self.repository_folder}"
+            AbstractArtifact.logger().debug(
+                "StagedChangesCommitted for %s", self.repository_folder
+            )
+            result = await self.within_wave_of(
+                event, CommitPush(self.repository_folder)
             )
-            result = await CommitPush(self.repository_folder).listen(event)
 
         return result
 
@@ -326,21 +363,23 @@ class AbstractArtifact(NixFlake, EventListener, abc.ABC):
         proceed = self.event_refers_to_me(event)
 
         if proceed:
-            Artifact.logger().debug(
+            AbstractArtifact.logger().debug(
                 "2. CommittedChangesPushed -> CommittedChangesTagged"
             )
         else:
             dep = self.extract_input(event)
             if dep is not None:
-                Artifact.logger().debug(
+                AbstractArtifact.logger().debug(
                     "7. CommittedChangesPushed -> CommittedChangesTagged"
                 )
                 proceed = True
         if proceed:
-            Artifact.logger().debug(
-                f"CommittedChangesPushed for {self.repository_folder}"
+            AbstractArtifact.logger().debug(
+                "CommittedChangesPushed for %s", self.repository_folder
+            )
+            result = await self.within_wave_of(
+                event, CommitTag(self.repository_folder)
             )
-            result = await CommitTag(self.repository_folder).listen(event)
         return result
 
     async def push_tag_after_CommittedChangesTagged(
@@ -358,17 +397,19 @@ class AbstractArtifact(NixFlake, EventListener, abc.ABC):
         proceed = self.event_refers_to_me(event)
 
         if proceed:
-            Artifact.logger().debug("3. CommittedChangesTagged -> TagPushed")
+            AbstractArtifact.logger().debug("3. CommittedChangesTagged -> TagPushed")
         else:
             dep = self.extract_input(event)
             if dep is not None:
-                Artifact.logger().debug("8. CommittedChangesTagged -> TagPushed")
+                AbstractArtifact.logger().debug("8. CommittedChangesTagged -> TagPushed")
                 proceed = True
         if proceed:
-            Artifact.logger().debug(
-                f"CommittedChangesTagged for {self.repository_folder}"
+            AbstractArtifact.logger().debug(
+                "CommittedChangesTagged for %s", self.repository_folder
+            )
+            result = await self.within_wave_of(
+                event, TagPush(self.repository_folder)
             )
-            result = await TagPush(self.repository_folder).listen(event)
         return result
 
     async def maybe_update_flake_after_TagPushed(
@@ -387,15 +428,34 @@ class AbstractArtifact(NixFlake, EventListener, abc.ABC):
         proceed = self.event_refers_to_me(event)
 
         if proceed:
-            Artifact.logger().debug("4. TagPushed -> ChangeStaged")
+            AbstractArtifact.logger().debug("4. TagPushed -> ChangeStaged")
         else:
             dep = self.extract_input(event)
             if dep is not None:
-                Artifact.logger().debug("9. TagPushed -> ChangeStaged")
+                AbstractArtifact.logger().debug("9. TagPushed -> ChangeStaged")
                 proceed = True
 
+        if proceed and DependencyGraph.instance().in_same_cycle(
+            self.__class__.url, event.repository_url
+        ):
+            AbstractArtifact.logger().error(
+                "%s and %s are in an input cycle: not updating %s",
+                self.__class__.url,
+                event.repository_url,
+                self.repository_folder,
+            )
+            proceed = False
+
         if proceed:
-            result = await StageInputUpdate(self.repository_folder).listen(event)
+            # an input cycle we don't know of would bring the same tag back to us.
+            proceed = WaveTracker.instance().first_visit(
+                event, self.repository_folder, event.repository_url
+            )
+
+        if proceed:
+            result = await self.within_wave_of(
+                event, StageInputUpdate(self.repository_folder)
+            )
 
         return result
 
@@ -19,22 +19,25 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
+from .async_git import AsyncGit
+from .content_digest import ContentDigest
+from .deadline import Deadline
+from .git_attributes import GitAttributes
+from .release_journal import ReleaseJournal
 from .repository_folder_helper import RepositoryFolderHelper
+from .repository_watcher import RepositoryWatcher
+from .sha256_cache import Sha256Cache
+from .sha256_prefetcher import Sha256Prefetcher
+from .stage_timed_out import StageTimedOut
+from .version_allocator import VersionAllocator
+import asyncio
 import os
 from pythoneda.shared import attribute, BaseObject
-from pythoneda.shared.git import (
-    GitAdd,
-    GitAddFailed,
-    GitCheckAttr,
-    GitCheckAttrFailed,
-    GitCommit,
-    GitCommitFailed,
-    GitRepo,
-    GitTag,
-    GitTagFailed,
-    Version,
-)
+from pythoneda.shared.git import GitRepo, Version
+import re
 import subprocess
+import threading
+from typing import Dict, Iterable, Tuple
 
 
 class ArtifactEventListener(BaseObject):
@@ -50,6 +53,16 @@ class ArtifactEventListener(BaseObject):
         - None
     """
 
+    _version_pattern = re.compile(r'(\bversion\s*=\s*")([^"]*)(")')
+    _sha256_pattern = re.compile(r'(\bsha256\s*=\s*")([^"]*)(")')
+    # pythoneda flakes fetch their own sources from org/repo.
+    _repo_pattern = re.compile(r'(\brepo\s*=\s*")([^"]*)(")')
+    _def_folders = {}
+    _def_folders_lock = threading.Lock()
+    _decision_space_suffix = "-artifact"
+    # the journal steps of tag_flake_in, keyed by version.
+    _tag_flake_steps = ("update_version_in_flake", "commit_version", "tag_version")
+
     def __init__(self, folder: str):
         """
         Creates a new ArtifactEventListener instance.
@@ -77,6 +90,24 @@ class ArtifactEventListener(BaseObject):
         """
         return self._enabled
 
+    @classmethod
+    def _remote_url_entry(cls, folder: str) -> Tuple[str, str]:
+        """
+        Retrieves the remote url of given folder, and the decision-space url it's the
+        artifact space of.
+        :param folder: The repository folder.
+        :type folder: str
+        :return: The remote url, and the decision-space url (None if the remote url
+        is not an artifact space).
+        :rtype: Tuple[str, str]
+        """
+        url = RepositoryFolderHelper.remote_url(folder)
+        suffix = cls._decision_space_suffix
+        decision_space_url = None
+        if url is not None and url.endswith(suffix):
+            decision_space_url = url[: -len(suffix)]
+        return url, decision_space_url
+
     @property
     def repository_url(self) -> str:
         """
@@ -84,7 +115,7 @@ class ArtifactEventListener(BaseObject):
         :return: Such url.
         :rtype: str
         """
-        return GitRepo.from_folder(self.repository_folder).remote_url
+        return self._remote_url_entry(self.repository_folder)[0]
 
     def refers_to_my_decision_space(self, url: str) -> bool:
         """
@@ -94,7 +125,7 @@ class ArtifactEventListener(BaseObject):
         :return: True if it refers to the decision space.
         :rtype: bool
         """
-        return self.repository_url == f"{url}-artifact"
+        return self._remote_url_entry(self.repository_folder)[1] == url
 
     def own_flake(self, folder: str) -> bool:
         """
@@ -131,14 +162,14 @@ class ArtifactEventListener(BaseObject):
         """
         result = None
         home_path = os.environ.get("HOME")
-        completed_process = subprocess.run(
-            [f"{home_path}/bin/extract-nix-flake-version.sh", "-f", flake],
-            check=False,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            cwd=os.path.dirname(flake),
-        )
+        try:
+            completed_process = Deadline.run(
+                "retrieve_version_in_flake",
+                [f"{home_path}/bin/extract-nix-flake-version.sh", "-f", flake],
+                os.path.dirname(flake),
+            )
+        except StageTimedOut:
+            return result
         if completed_process.returncode == 0:
             result = completed_process.stdout
         else:
@@ -149,23 +180,52 @@ class ArtifactEventListener(BaseObject):
 
         return result
 
-    async def update_version_in_flake(self, version: str, flake: str) -> bool:
+    async def update_version_in_flake(
+        self, version: str, flake: str, sourceFolder: str = None
+    ) -> bool:
         """
         Updates the version in given flake file.
         :param version: The new version.
         :type version: str
         :param flake: The flake file.
         :type flake: str
+        :param sourceFolder: The repository whose sources the flake packages, and
+        that gets tagged. Defaults to the flake's own repository.
+        :type sourceFolder: str
         :return: True if the flake could be updated.
         :rtype: bool
         """
+        source_folder = sourceFolder or os.path.dirname(flake)
+        url = self._remote_url_entry(source_folder)[0]
+        rev = self.revision_to_hash(source_folder, version)
+        cache = Sha256Cache.instance()
+        if url is not None and rev is not None:
+            # the prefetch started when the version was allocated may be done already.
+            sha256 = await Sha256Prefetcher.instance().lookup(url, version, rev)
+            if sha256 is not None and self.write_version_and_sha256_in_flake(
+                version, sha256, flake
+            ):
+                ArtifactEventListener.logger().debug(
+                    "Reused prefetched sha256 of %s %s (%s) in %s",
+                    url,
+                    version,
+                    rev,
+                    flake,
+                )
+                return True
         result = True
         home_path = os.environ.get("HOME")
         try:
             ArtifactEventListener.logger().debug(
-                f"Running {home_path}/bin/update-sha256-nix-flake.sh -f {flake} -V {version} in {os.path.dirname(flake)}"
+                "Running %s/bin/update-sha256-nix-flake.sh -f %s -V %s in %s",
+                home_path,
+                flake,
+                version,
+                os.path.dirname(flake),
             )
-            subprocess.run(
+            await asyncio.to_thread(
+                Deadline.run,
+                "update_version_in_flake",
                 [
                     f"{home_path}/bin/update-sha256-nix-flake.sh",
                     "-f",
@@ -173,51 +233,331 @@ class ArtifactEventListener(BaseObject):
                     "-V",
                     version,
                 ],
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                cwd=os.path.dirname(flake),
+                os.path.dirname(flake),
+                "nix",
+                True,
             )
         except subprocess.CalledProcessError as err:
             ArtifactEventListener.logger().error(err.stdout)
             ArtifactEventListener.logger().error(err.stderr)
             result = False
+        except StageTimedOut:
+            result = False
+
+        if result and url is not None and rev is not None:
+            sha256 = self.retrieve_sha256_in_flake(flake)
+            if sha256 is not None:
+                cache.put(Sha256Prefetcher.source_url(url, version), rev, sha256)
+
+        return result
+
+    def resolve_revision(self, folder: str, ref: str = "HEAD") -> str:
+        """
+        Retrieves the commit given reference points to.
+        :param folder: The repository folder.
+        :type folder: str
+        :param ref: HEAD, or a full reference such as refs/tags/0.0.1.
+        :type ref: str
+        :return: The commit hash, or None if it cannot be resolved.
+        :rtype: str
+        """
+        result = RepositoryFolderHelper.resolve_ref(folder, ref)
+        if result is None:
+            ArtifactEventListener.logger().debug("Cannot resolve %s in %s", ref, folder)
+        return result
+
+    def revision_to_hash(self, folder: str, tag: str) -> str:
+        """
+        Retrieves the commit whose sources get hashed for given tag: the tagged one,
+        or HEAD while the tag is still being created.
+        :param folder: The repository folder.
+        :type folder: str
+        :param tag: The tag.
+        :type tag: str
+        :return: The commit hash, or None if it cannot be resolved.
+        :rtype: str
+        """
+        result = self.resolve_revision(folder, f"refs/tags/{tag}")
+        if result is None:
+            result = self.resolve_revision(folder)
+        return result
 
+    def prefetch_sha256(self, tag: str, folder: str):
+        """
+        Starts hashing the sources of given repository at given tag in the background,
+        so they're ready by the time its flake gets updated.
+        :param tag: The tag.
+        :type tag: str
+        :param folder: The repository folder.
+        :type folder: str
+        """
+        url = self._remote_url_entry(folder)[0]
+        rev = self.revision_to_hash(folder, tag)
+        if url is not None and rev is not None:
+            Sha256Prefetcher.instance().prefetch(url, tag, rev, folder)
+
+    def tagged_revision(self, folder: str, tag: str) -> Tuple[str, str]:
+        """
+        Retrieves what the dependents of given repository lock at given tag: the
+        repository actually tagged (itself, or its def repository) and the tagged commit.
+        The tagger and the dependents both derive the prefetch key from it.
+        :param folder: The repository folder.
+        :type folder: str
+        :param tag: The tag.
+        :type tag: str
+        :return: The tagged folder and commit, or None if either cannot be found.
+        :rtype: Tuple[str, str]
+        """
+        tagged_folder = self.tagged_folder(folder)
+        if tagged_folder is None:
+            return None
+        rev = self.resolve_revision(tagged_folder, f"refs/tags/{tag}")
+        if rev is None:
+            return None
+        return tagged_folder, rev
+
+    def prefetch_tagged_sha256(self, url: str, tag: str, folder: str):
+        """
+        Starts hashing what the dependents of given repository lock at given tag, in the
+        background, so the hash is ready by the time they get updated.
+        :param url: The url the dependents know the repository by.
+        :type url: str
+        :param tag: The tag.
+        :type tag: str
+        :param folder: The repository folder.
+        :type folder: str
+        """
+        tagged = self.tagged_revision(folder, tag)
+        if tagged is not None:
+            tagged_folder, rev = tagged
+            Sha256Prefetcher.instance().prefetch(url, tag, rev, tagged_folder)
+
+    @classmethod
+    def _scopes_of(cls, content: str, offsets: Iterable[int]) -> Dict[int, int]:
+        """
+        Retrieves the innermost attribute set or let block each given offset is in.
+        Strings and comments are skipped.
+        :param content: The nix code.
+        :type content: str
+        :param offsets: The offsets.
+        :type offsets: Iterable[int]
+        :return: The offset where the scope of each offset opens (-1 for the top level,
+        None within strings and comments).
+        :rtype: Dict[int, int]
+        """
+        pending = set(offsets)
+        result = {}
+        stack = []
+        position = 0
+        length = len(content)
+        while position < length and pending:
+            if position in pending:
+                result[position] = stack[-1][0] if stack else -1
+                pending.discard(position)
+            char = content[position]
+            if char == "#":
+                end = content.find("\n", position)
+                position = length if end < 0 else end
+            elif content.startswith("/*", position):
+                end = content.find("*/", position + 2)
+                position = length if end < 0 else end + 1
+            elif char == '"':
+                position += 1
+                while position < length and content[position] != '"':
+                    position += 2 if content[position] == "\\" else 1
+            elif content.startswith("''", position):
+                position += 2
+                while position < length:
+                    if content.startswith(("'''", "''$", "''\\"), position):
+                        position += 3
+                    elif content.startswith("''", position):
+                        position += 1
+                        break
+                    else:
+                        position += 1
+            elif char == "{":
+                stack.append((position, "{"))
+            elif char == "}":
+                while stack and stack.pop()[1] != "{":
+                    pass
+            elif char.isalpha() and (
+                position == 0 or not cls._is_identifier(content[position - 1])
+            ):
+                end = position
+                while end < length and cls._is_identifier(content[end]):
+                    end += 1
+                word = content[position:end]
+                if word == "let":
+                    stack.append((position, "let"))
+                elif word == "in" and stack and stack[-1][1] == "let":
+                    stack.pop()
+                position = end - 1
+            position += 1
+        # whatever is left was inside a string or a comment.
+        for offset in pending:
+            result[offset] = None
         return result
 
-    async def tag_flake_in(self, version: Version, folder: str) -> bool:
+    @classmethod
+    def _is_identifier(cls, char: str) -> bool:
+        """
+        Checks whether given character can be part of a nix identifier.
+        :param char: The character.
+        :type char: str
+        :return: True in such case.
+        :rtype: bool
+        """
+        return char.isalnum() or char in "_-'"
+
+    @classmethod
+    def own_attributes(cls, content: str) -> Tuple[re.Match, re.Match]:
+        """
+        Finds the version and sha256 of the artifact itself in given flake: the only block
+        assigning both (and its repo, if several do), so the ones of inputs or other
+        derivations are left alone.
+        :param content: The flake contents.
+        :type content: str
+        :return: The matches of the version and the sha256, or None if there's no such
+        block, or more than one.
+        :rtype: Tuple[re.Match, re.Match]
+        """
+        versions = list(cls._version_pattern.finditer(content))
+        sha256s = list(cls._sha256_pattern.finditer(content))
+        repos = list(cls._repo_pattern.finditer(content))
+        scopes = cls._scopes_of(
+            content, [match.start() for match in versions + sha256s + repos]
+        )
+        candidates = {}
+        for kind, matches in ((0, versions), (1, sha256s), (2, repos)):
+            for match in matches:
+                if scopes[match.start()] is None:
+                    continue
+                entry = candidates.setdefault(scopes[match.start()], ([], [], []))
+                entry[kind].append(match)
+        own = [
+            entry
+            for entry in candidates.values()
+            if len(entry[0]) == 1 and len(entry[1]) == 1
+        ]
+        if len(own) > 1:
+            # other derivations may pin a version and sha256 of their own.
+            own = [entry for entry in own if entry[2]]
+        return (own[0][0][0], own[0][1][0]) if len(own) == 1 else None
+
+    def retrieve_sha256_in_flake(self, flake: str) -> str:
+        """
+        Retrieves the sha256 of the artifact declared in given flake.
+        :param flake: The flake file.
+        :type flake: str
+        :return: The sha256, or None if the flake does not declare it.
+        :rtype: str
+        """
+        with open(flake, "r", encoding="utf-8") as file:
+            own = self.__class__.own_attributes(file.read())
+        return None if own is None else own[1].group(2)
+
+    def write_version_and_sha256_in_flake(
+        self, version: str, sha256: str, flake: str
+    ) -> bool:
+        """
+        Updates the version and the sha256 of the artifact in given flake, in-process.
+        :param version: The new version.
+        :type version: str
+        :param sha256: The new sha256.
+        :type sha256: str
+        :param flake: The flake file.
+        :type flake: str
+        :return: True if both could be updated.
+        :rtype: bool
+        """
+        with open(flake, "r", encoding="utf-8") as file:
+            content = file.read()
+        own = self.__class__.own_attributes(content)
+        if own is None:
+            ArtifactEventListener.logger().debug(
+                "Cannot tell the version and sha256 of the artifact in %s", flake
+            )
+            return False
+        # replace from the end, so the offsets of the other match still hold.
+        for match, value in sorted(
+            ((own[0], version), (own[1], sha256)),
+            key=lambda pair: pair[0].start(),
+            reverse=True,
+        ):
+            content = content[: match.start(2)] + value + content[match.end(2) :]
+        with open(flake, "w", encoding="utf-8") as file:
+            file.write(content)
+        RepositoryWatcher.own_write(flake)
+        return True
+
+    async def tag_flake_in(
+        self, version: Version, folder: str, sourceFolder: str = None
+    ) -> bool:
         """
         Updates the version and commits and tags the changes in the flake under given folder.
         :param version: The new version.
         :type version: pythoneda.shared.git.Version
         :param folder: The flake folder.
         :type folder: str
+        :param sourceFolder: The repository whose sources the flake packages.
+        Defaults to the flake folder.
+        :type sourceFolder: str
         :return: True if the operation succeeds; False otherwise.
         :rtype: bool
         """
         result = False
         flake = os.path.join(folder, "flake.nix")
+        journal = ReleaseJournal.for_folder(folder)
+        key = version.value
+        # taggers of this folder take turns: other versions left behind will never finish.
+        journal.supersede(key, ArtifactEventListener._tag_flake_steps)
         # if there's a flake, change and commit the version change before tagging.
-        version_updated = await self.update_version_in_flake(version.value, flake)
+        done = journal.completed("update_version_in_flake", key)
+        if done is not None and done.get("flake") == ContentDigest.of_file(flake):
+            ArtifactEventListener.logger().info(
+                "Reusing version %s already set in %s", version.value, flake
+            )
+            version_updated = True
+        else:
+            journal.begin("update_version_in_flake", key, {"flake": flake})
+            version_updated = await self.update_version_in_flake(
+                version.value, flake, sourceFolder or folder
+            )
+            if version_updated:
+                journal.complete(
+                    "update_version_in_flake",
+                    key,
+                    {"flake": ContentDigest.of_file(flake)},
+                )
         if version_updated:
+            git = AsyncGit.instance()
             try:
-                ArtifactEventListener.logger().debug("Updating version in {folder}")
-                GitAdd(folder).add(flake)
-                GitCommit(folder).commit(f"Updated version to {version.value}")
-                GitTag(folder).create_tag(
-                    version, f"Updated version to {version.value}"
+                ArtifactEventListener.logger().debug("Updating version in %s", folder)
+                if journal.completed("commit_version", key) is None:
+                    journal.begin("commit_version", key)
+                    await git.add(folder, flake)
+                    await git.commit(folder, f"Updated version to {version.value}")
+                    journal.complete("commit_version", key)
+                journal.begin("tag_version", key)
+                await git.create_tag(
+                    folder, version, f"Updated version to {version.value}"
                 )
+                journal.close(key)
                 result = True
-            except GitAddFailed as err:
-                ArtifactEventListener.logger().error("Could not stage changes")
-                ArtifactEventListener.logger().error(err)
-            except GitCommitFailed as err:
-                ArtifactEventListener.logger().error("Could not commit staged changes")
-                ArtifactEventListener.logger().error(err)
-            except GitTagFailed as err:
-                ArtifactEventListener.logger().error("Could not create tag")
-                ArtifactEventListener.logger().error(err)
+            except subprocess.CalledProcessError as err:
+                ArtifactEventListener.logger().error(
+                    "Could not tag %s: git %s failed in %s",
+                    version.value,
+                    err.cmd[1],
+                    folder,
+                )
+                ArtifactEventListener.logger().error(err.stderr)
+            except StageTimedOut as err:
+                ArtifactEventListener.logger().error(
+                    "Could not tag %s: stuck in %s", version.value, err.stage
+                )
+            if not result:
+                journal.abort("tag_version", key)
         return result
 
     async def tag(self, folder: str) -> Version:
@@ -228,25 +568,44 @@ class ArtifactEventListener(BaseObject):
         :return: The tagged version.
         :rtype: pythoneda.shared.git.Version
         """
-        git_repo = GitRepo.from_folder(folder)
-        result = git_repo.increase_patch(True)
-        # check if there's a flake in the root folder.
-        if self.own_flake(folder):
-            if not await self.tag_flake_in(result, folder):
-                result = None
-        else:
-            def_folder = self.find_def_repository_folder(folder)
-            if def_folder is None:
-                ArtifactEventListener.logger().error(
-                    f"Could not find def repository for {folder}"
-                )
+        tagged_folder = self.tagged_folder(folder)
+        if tagged_folder is None:
+            ArtifactEventListener.logger().error(
+                "Could not find def repository for %s", folder
+            )
+            return None
+        git = AsyncGit.instance()
+        allocator = VersionAllocator.for_folder(tagged_folder)
+        # other workers tagging this repository wait until we are done, and skip
+        # the version until TagPush pushes it.
+        async with allocator.allocate(
+            lambda: git.increase_patch(folder), keep=True
+        ) as version:
+            result = version
+            if result is None:
+                return result
+            # hash the sources while the flake is being prepared.
+            self.prefetch_sha256(result.value, folder)
+            if not await self.tag_flake_in(result, tagged_folder, folder):
                 result = None
-            else:
-                if not await self.tag_flake_in(result, def_folder):
-                    result = None
+        if result is None:
+            await allocator.release(version.value)
 
         return result
 
+    def tagged_folder(self, folder: str) -> str:
+        """
+        Retrieves the repository whose flake gets tagged for given one: itself, if it
+        has its own flake, or its def repository.
+        :param folder: The repository folder.
+        :type folder: str
+        :return: The folder of the tagged repository, or None if not found.
+        :rtype: str
+        """
+        if self.own_flake(folder):
+            return folder
+        return self.find_def_repository_folder(folder)
+
     def find_def_repository_folder(self, folder: str) -> str:
         """
         Retrieves the folder of the repository with the definition of the repository cloned in given folder.
@@ -256,11 +615,21 @@ class ArtifactEventListener(BaseObject):
         :rtype: str
         """
         result = None
-        try:
-            url = GitCheckAttr(folder).check_attr("def", ".gitattributes")
-            result = RepositoryFolderHelper.find_out_repository_folder(folder, url)
-        except GitCheckAttrFailed as err:
-            ArtifactEventListener.logger().error(err)
+        key = os.path.abspath(folder)
+        url = GitAttributes(folder).check_attr("def", ".gitattributes")
+        if url is None or url in ("set", "unset"):
+            ArtifactEventListener.logger().error(
+                "No def attribute for .gitattributes in %s", folder
+            )
+            return result
+        with ArtifactEventListener._def_folders_lock:
+            cached = ArtifactEventListener._def_folders.get(key, None)
+        if cached is not None and cached[0] == url and os.path.isdir(cached[1]):
+            return cached[1]
+        result = RepositoryFolderHelper.find_out_repository_folder(folder, url)
+        if result is not None:
+            with ArtifactEventListener._def_folders_lock:
+                ArtifactEventListener._def_folders[key] = (url, result)
         return result
 
     @classmethod
@@ -0,0 +1,205 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/artifact_record.py
+
+This file declares the ArtifactRecord class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from .architectural_role import ArchitecturalRole
+from .hexagonal_layer import HexagonalLayer
+from .pescio_space import PescioSpace
+from typing import Tuple
+
+
+class ArtifactRecord:
+    """
+    Read-only, slotted view of an artifact stored in a CompactArtifactRegistry.
+
+    Class name: ArtifactRecord
+
+    Responsibilities:
+        - Expose the metadata of one artifact without owning a copy of it.
+
+    Collaborators:
+        - pythoneda.shared.artifact.CompactArtifactRegistry
+    """
+
+    __slots__ = ("_registry", "_ordinal")
+
+    def __init__(self, registry, ordinal: int):
+        """
+        Creates a new ArtifactRecord instance.
+        :param registry: The registry holding the data.
+        :type registry: pythoneda.shared.artifact.CompactArtifactRegistry
+        :param ordinal: The position of the artifact in the registry.
+        :type ordinal: int
+        """
+        self._registry = registry
+        self._ordinal = ordinal
+
+    @property
+    def ordinal(self) -> int:
+        """
+        Retrieves the position of the artifact in the registry.
+        :return: Such position.
+        :rtype: int
+        """
+        return self._ordinal
+
+    @property
+    def url(self) -> str:
+        """
+        Retrieves the url of the artifact.
+        :return: Such url.
+        :rtype: str
+        """
+        return self._registry.string(self._ordinal, "url")
+
+    @property
+    def name(self) -> str:
+        """
+        Retrieves the name of the artifact.
+        :return: Such name.
+        :rtype: str
+        """
+        return self._registry.string(self._ordinal, "name")
+
+    @property
+    def version(self) -> str:
+        """
+        Retrieves the version of the artifact.
+        :return: Such version.
+        :rtype: str
+        """
+        return self._registry.string(self._ordinal, "version")
+
+    @property
+    def description(self) -> str:
+        """
+        Retrieves the description of the artifact.
+        :return: Such description.
+        :rtype: str
+        """
+        return self._registry.string(self._ordinal, "description")
+
+    @property
+    def homepage(self) -> str:
+        """
+        Retrieves the homepage of the artifact.
+        :return: Such homepage.
+        :rtype: str
+        """
+        return self._registry.string(self._ordinal, "homepage")
+
+    @property
+    def license_id(self) -> str:
+        """
+        Retrieves the license id of the artifact.
+        :return: Such id.
+        :rtype: str
+        """
+        return self._registry.string(self._ordinal, "license_id")
+
+    @property
+    def copyright_year(self) -> int:
+        """
+        Retrieves the copyright year of the artifact.
+        :return: Such year.
+        :rtype: int
+        """
+        return self._registry.copyright_year(self._ordinal)
+
+    @property
+    def copyright_holder(self) -> str:
+        """
+        Retrieves the copyright holder of the artifact.
+        :return: Such holder.
+        :rtype: str
+        """
+        return self._registry.string(self._ordinal, "copyright_holder")
+
+    @property
+    def folder(self) -> str:
+        """
+        Retrieves the repository folder of the artifact.
+        :return: Such folder.
+        :rtype: str
+        """
+        return self._registry.string(self._ordinal, "folder")
+
+    @property
+    def maintainers(self) -> Tuple[str, ...]:
+        """
+        Retrieves the maintainers of the artifact.
+        :return: Such maintainers.
+        :rtype: Tuple[str, ...]
+        """
+        return self._registry.strings(self._ordinal, "maintainers")
+
+    @property
+    def inputs(self) -> Tuple[str, ...]:
+        """
+        Retrieves the urls of the inputs of the artifact.
+        :return: Such urls.
+        :rtype: Tuple[str, ...]
+        """
+        return self._registry.strings(self._ordinal, "inputs")
+
+    @property
+    def pescio_space(self) -> PescioSpace:
+        """
+        Retrieves the Pescio space of the artifact, if it's a Python package.
+        :return: Such space.
+        :rtype: pythoneda.shared.artifact.PescioSpace
+        """
+        return self._registry.enum(self._ordinal, PescioSpace)
+
+    @property
+    def architectural_role(self) -> ArchitecturalRole:
+        """
+        Retrieves the architectural role of the artifact, if it's a Python package.
+        :return: Such role.
+        :rtype: pythoneda.shared.artifact.ArchitecturalRole
+        """
+        return self._registry.enum(self._ordinal, ArchitecturalRole)
+
+    @property
+    def hexagonal_layer(self) -> HexagonalLayer:
+        """
+        Retrieves the hexagonal layer of the artifact, if it's a Python package.
+        :return: Such layer.
+        :rtype: pythoneda.shared.artifact.HexagonalLayer
+        """
+        return self._registry.enum(self._ordinal, HexagonalLayer)
+
+    def __repr__(self) -> str:
+        """
+        Retrieves a representation of this record.
+        :return: Such representation.
+        :rtype: str
+        """
+        return f"ArtifactRecord({self.url}@{self.version})"
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -20,8 +20,11 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 from .abstract_artifact import AbstractArtifact
+from .compact_artifact_registry import CompactArtifactRegistry
+from .dependency_graph import DependencyGraph
 from pythoneda.shared import Repo
-from typing import List
+from .registry_snapshot import RegistrySnapshot
+from typing import Callable, Iterable, List, Tuple
 
 
 class ArtifactRepository(Repo):
@@ -32,9 +35,14 @@ class ArtifactRepository(Repo):
 
     Responsibilities:
         - Manage the persistence of Artifact instances.
+        - Load the metadata of the known artifacts from a snapshot, or else scan them and
+          snapshot them for the next start.
 
     Collaborators:
         - pythoneda.shared.Repo
+        - pythoneda.shared.artifact.CompactArtifactRegistry
+        - pythoneda.shared.artifact.DependencyGraph
+        - pythoneda.shared.artifact.RegistrySnapshot
     """
 
     def __init__(self):
@@ -42,6 +50,86 @@ class ArtifactRepository(Repo):
         Creates a new ArtifactRepository instance.
         """
         super().__init__(AbstractArtifact)
+        self._dependency_graph = DependencyGraph.instance()
+        self._registry = None
+
+    @property
+    def dependency_graph(self) -> DependencyGraph:
+        """
+        Retrieves the graph of the artifacts and their inputs.
+        :return: Such graph.
+        :rtype: pythoneda.shared.artifact.DependencyGraph
+        """
+        return self._dependency_graph
+
+    @property
+    def registry(self):
+        """
+        Retrieves the metadata of the artifacts, once loaded.
+        :return: The snapshot or registry load_registry found, or None before.
+        :rtype: pythoneda.shared.artifact.RegistrySnapshot
+        """
+        return self._registry
+
+    def load_registry(
+        self, path: str, scan: Callable[[], Iterable[Tuple[AbstractArtifact, str]]]
+    ):
+        """
+        Loads the metadata of the artifacts from the snapshot at given path. If it's
+        missing, invalid, or any repository moved since it was taken, scans the
+        repositories instead, and writes a new snapshot for the next start.
+        :param path: The snapshot file.
+        :type path: str
+        :param scan: Builds every artifact from its repository, with its folder.
+        :type scan: Callable[[], Iterable[Tuple[pythoneda.shared.artifact.AbstractArtifact, str]]]
+        :return: The snapshot, or the registry built by the scan.
+        :rtype: pythoneda.shared.artifact.RegistrySnapshot
+        """
+        snapshot = RegistrySnapshot.open(path)
+        if snapshot is not None:
+            stale = snapshot.stale()
+            if not stale:
+                self._registry = snapshot
+                return snapshot
+            ArtifactRepository.logger().info(
+                "%d repositories moved since %s was taken: scanning them all",
+                len(stale),
+                path,
+            )
+            snapshot.close()
+        registry = CompactArtifactRegistry()
+        for artifact, folder in scan():
+            registry.add(artifact, folder)
+        try:
+            RegistrySnapshot.write(path, registry)
+        except OSError as err:
+            ArtifactRepository.logger().error("Could not write %s: %s", path, err)
+        self._registry = registry
+        return registry
+
+    def dependents_of(self, url: str) -> List[Tuple[str, int]]:
+        """
+        Retrieves the artifacts affected by a change in given one.
+        :param url: The url of the artifact.
+        :type url: str
+        :return: The (key, depth) pairs of its transitive dependents, in topological order.
+        :rtype: List[Tuple[str, int]]
+        """
+        return self._dependency_graph.dependents_of(url)
+
+    def find_cycles(self) -> List[List[str]]:
+        """
+        Checks the inputs of all artifacts for cycles, which would otherwise
+        make the TagPushed -> ChangeStaged cascade re-tag forever.
+        :return: The artifacts of each cycle found.
+        :rtype: List[List[str]]
+        """
+        result = self._dependency_graph.cycles()
+        for cycle in result:
+            ArtifactRepository.logger().error(
+                f"Input cycle detected: {' -> '.join(cycle)}"
+            )
+        return result
 
     def find_by_attribute(
         self, attributeName: str, attributeValue: str
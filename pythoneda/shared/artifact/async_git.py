@@ -0,0 +1,395 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/async_git.py
+
+This file declares the AsyncGit class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from .deadline import Deadline
+import os
+from pythoneda.shared import BaseObject
+from pythoneda.shared.git import GitRepo, Version
+import subprocess
+import threading
+from typing import Any, Callable, List
+import weakref
+
+
+class AsyncGit(BaseObject):
+    """
+    Runs git off the event loop.
+
+    Class name: AsyncGit
+
+    Responsibilities:
+        - Run git commands as asyncio subprocesses, each in its own process group, so
+          Deadline can kill a stuck push together with the ssh or hooks it spawned.
+        - Run the remaining blocking wrappers in a dedicated thread pool
+          (PYTHONEDA_GIT_THREADS), so they cannot starve the loop's default executor.
+        - Serialize the operations on the same repository folder, and let independent
+          folders progress in parallel.
+        - Raise subprocess.CalledProcessError when git fails, and StageTimedOut when it
+          overruns its Deadline.
+
+    Collaborators:
+        - pythoneda.shared.artifact.Deadline
+        - pythoneda.shared.git
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, threads: int = None):
+        """
+        Creates a new AsyncGit instance.
+        :param threads: The size of the pool. Defaults to PYTHONEDA_GIT_THREADS, or
+        four threads per CPU, up to 32.
+        :type threads: int
+        """
+        super().__init__()
+        if threads is None:
+            threads = int(
+                os.environ.get(
+                    "PYTHONEDA_GIT_THREADS", min(32, 4 * (os.cpu_count() or 1))
+                )
+            )
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(threads, 1), thread_name_prefix="pythoneda-git"
+        )
+        # per loop, since asyncio locks belong to one; a folder's lock lives while in use.
+        self._locks = weakref.WeakKeyDictionary()
+        self._locks_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        """
+        Retrieves the process-wide facade.
+        :return: The facade.
+        :rtype: pythoneda.shared.artifact.AsyncGit
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    async def run(
+        self,
+        stage: str,
+        folder: str,
+        function: Callable,
+        *args,
+        operation: str = "git",
+        exclusive: bool = True,
+    ) -> Any:
+        """
+        Runs a blocking call on given repository in the pool.
+        :param stage: The stage, for reporting.
+        :type stage: str
+        :param folder: The repository folder.
+        :type folder: str
+        :param function: The blocking callable.
+        :type function: Callable
+        :param args: Its arguments.
+        :type args: List
+        :param operation: The kind of operation, to choose its timeout.
+        :type operation: str
+        :param exclusive: Whether to wait for the other exclusive operations on the folder.
+        Read-only calls can skip it.
+        :type exclusive: bool
+        :return: Whatever the call returns.
+        :rtype: Any
+        """
+        call = Deadline.call(
+            stage,
+            folder,
+            function,
+            *args,
+            operation=operation,
+            executor=self._executor,
+        )
+        if not exclusive:
+            return await call
+        async with self._lock_for(folder):
+            return await call
+
+    def _lock_for(self, folder: str) -> asyncio.Lock:
+        """
+        Retrieves the lock serializing the operations on given folder in the running loop.
+        :param folder: The repository folder.
+        :type folder: str
+        :return: The lock.
+        :rtype: asyncio.Lock
+        """
+        loop = asyncio.get_running_loop()
+        key = os.path.abspath(folder)
+        with self._locks_lock:
+            locks = self._locks.get(loop, None)
+            if locks is None:
+                locks = weakref.WeakValueDictionary()
+                self._locks[loop] = locks
+            result = locks.get(key, None)
+            if result is None:
+                result = asyncio.Lock()
+                locks[key] = result
+        return result
+
+    async def git(
+        self,
+        stage: str,
+        folder: str,
+        *args: str,
+        operation: str = "git",
+        exclusive: bool = True,
+        input: str = None,
+        check: bool = True,
+    ) -> subprocess.CompletedProcess:
+        """
+        Runs a git command on given repository, in its own process group so Deadline
+        can kill it, and whatever it spawns, if it gets stuck.
+        :param stage: The stage, for reporting.
+        :type stage: str
+        :param folder: The repository folder.
+        :type folder: str
+        :param args: The git arguments.
+        :type args: List[str]
+        :param operation: The kind of operation, to choose its timeout.
+        :type operation: str
+        :param exclusive: Whether to wait for the other exclusive operations on the folder.
+        Read-only commands can skip it.
+        :type exclusive: bool
+        :param input: What to write to its standard input, if anything.
+        :type input: str
+        :param check: Whether to raise subprocess.CalledProcessError if git fails.
+        :type check: bool
+        :return: The completed process.
+        :rtype: subprocess.CompletedProcess
+        """
+        command = Deadline.spawn(
+            stage,
+            ["git"] + list(args),
+            folder,
+            operation=operation,
+            check=check,
+            input=input,
+        )
+        if not exclusive:
+            return await command
+        async with self._lock_for(folder):
+            return await command
+
+    async def add(self, folder: str, file: str):
+        """
+        Stages given file.
+        :param folder: The repository folder.
+        :type folder: str
+        :param file: The file.
+        :type file: str
+        """
+        await self.git("add", folder, "add", "--", file)
+
+    async def commit(self, folder: str, message: str):
+        """
+        Commits the staged changes.
+        :param folder: The repository folder.
+        :type folder: str
+        :param message: The commit message.
+        :type message: str
+        """
+        await self.git("commit", folder, "commit", "-m", message)
+
+    async def create_tag(self, folder: str, version: Version, message: str):
+        """
+        Creates a tag.
+        :param folder: The repository folder.
+        :type folder: str
+        :param version: The version to tag.
+        :type version: pythoneda.shared.git.Version
+        :param message: The tag message.
+        :type message: str
+        """
+        await self.git("tag", folder, "tag", "-a", version.value, "-m", message)
+
+    async def increase_patch(self, folder: str) -> Version:
+        """
+        Computes the next patch version of given repository.
+        :param folder: The repository folder.
+        :type folder: str
+        :return: Such version.
+        :rtype: pythoneda.shared.git.Version
+        """
+        return await self.run(
+            "increase_patch", folder, GitRepo.from_folder(folder).increase_patch, True
+        )
+
+    async def push(self, folder: str):
+        """
+        Pushes the commits.
+        :param folder: The repository folder.
+        :type folder: str
+        """
+        await self.git("push", folder, "push", operation="push")
+
+    async def push_tags(self, folder: str):
+        """
+        Pushes the tags.
+        :param folder: The repository folder.
+        :type folder: str
+        """
+        await self.git("push_tags", folder, "push", "--tags", operation="push")
+
+    async def diff(self, folder: str) -> str:
+        """
+        Retrieves the diff of the changes.
+        :param folder: The repository folder.
+        :type folder: str
+        :return: The diff of the unstaged changes.
+        :rtype: str
+        """
+        return (await self.git("diff", folder, "diff")).stdout
+
+    async def staged_diff(self, folder: str, paths: List[str] = None) -> str:
+        """
+        Retrieves the diff of the staged changes, i.e. what the next commit contains.
+        :param folder: The repository folder.
+        :type folder: str
+        :param paths: The paths to restrict the diff to, or None for all.
+        :type paths: List[str]
+        :return: The diff.
+        :rtype: str
+        """
+        args = ["diff", "--cached"]
+        if paths is not None:
+            args += ["--"] + list(paths)
+        return (await self.git("diff", folder, *args)).stdout
+
+    async def not_ignored(self, folder: str, paths: List[str]) -> List[str]:
+        """
+        Filters out the paths git ignores.
+        :param folder: The repository folder.
+        :type folder: str
+        :param paths: The paths, relative to the folder. Folders end with a slash.
+        :type paths: List[str]
+        :return: The paths git does not ignore.
+        :rtype: List[str]
+        """
+        # check-ignore exits with 1 when nothing is ignored.
+        completed_process = await self.git(
+            "check_ignore",
+            folder,
+            "check-ignore",
+            "--stdin",
+            exclusive=False,
+            input="\n".join(paths),
+            check=False,
+        )
+        if completed_process.returncode > 1:
+            raise subprocess.CalledProcessError(
+                completed_process.returncode,
+                completed_process.args,
+                completed_process.stdout,
+                completed_process.stderr,
+            )
+        ignored = set(completed_process.stdout.splitlines())
+        return [path for path in paths if path not in ignored]
+
+    async def changed_paths(self, folder: str) -> List[str]:
+        """
+        Retrieves the paths that differ from the index, untracked ones included.
+        :param folder: The repository folder.
+        :type folder: str
+        :return: Such paths, relative to the folder.
+        :rtype: List[str]
+        """
+        output = (
+            await self.git(
+                "changed_paths",
+                folder,
+                "ls-files",
+                "-z",
+                "-m",
+                "-d",
+                "-o",
+                "--exclude-standard",
+                exclusive=False,
+            )
+        ).stdout
+        return sorted({path for path in output.split("\0") if path != ""})
+
+    async def ignored_directories(self, folder: str) -> List[str]:
+        """
+        Retrieves the folders git ignores as a whole.
+        :param folder: The repository folder.
+        :type folder: str
+        :return: Such folders, relative to the folder and ending with a slash.
+        :rtype: List[str]
+        """
+        output = (
+            await self.git(
+                "ignored_directories",
+                folder,
+                "ls-files",
+                "-z",
+                "-o",
+                "-i",
+                "--exclude-standard",
+                "--directory",
+                exclusive=False,
+            )
+        ).stdout
+        return sorted(path for path in output.split("\0") if path.endswith("/"))
+
+    async def remote_urls(self, folder: str) -> List[str]:
+        """
+        Retrieves the remote urls.
+        :param folder: The repository folder.
+        :type folder: str
+        :return: Such urls.
+        :rtype: List[str]
+        """
+        return await self.run(
+            "remote_urls", folder, GitRepo.remote_urls, folder, exclusive=False
+        )
+
+    async def current_branch(self, folder: str) -> str:
+        """
+        Retrieves the current branch.
+        :param folder: The repository folder.
+        :type folder: str
+        :return: Such branch.
+        :rtype: str
+        """
+        return await self.run(
+            "current_branch", folder, GitRepo.current_branch, folder, exclusive=False
+        )
+
+    def shutdown(self):
+        """
+        Stops the pool, once the running operations finish.
+        """
+        self._executor.shutdown(wait=True)
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
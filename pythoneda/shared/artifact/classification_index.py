@@ -0,0 +1,236 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/classification_index.py
+
+This file declares the ClassificationIndex class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from .architectural_role import ArchitecturalRole
+from enum import Enum
+from .hexagonal_layer import HexagonalLayer
+from .pescio_space import PescioSpace
+from pythoneda.shared import BaseObject
+from .python_package import PythonPackage
+from typing import Iterable, List
+
+
+class ClassificationIndex(BaseObject):
+    """
+    Bitset index of PythonPackage instances by Pescio space, architectural role and hexagonal layer.
+
+    Class name: ClassificationIndex
+
+    Responsibilities:
+        - Assign each package an ordinal, and keep one bitmap per enum value.
+        - Answer AND/OR/NOT queries with whole-bitmap operations instead of walking the packages.
+
+    Collaborators:
+        - pythoneda.shared.artifact.PythonPackage
+        - pythoneda.shared.artifact.PescioSpace
+        - pythoneda.shared.artifact.ArchitecturalRole
+        - pythoneda.shared.artifact.HexagonalLayer
+    """
+
+    def __init__(self, packages: Iterable[PythonPackage] = None):
+        """
+        Creates a new ClassificationIndex instance.
+        :param packages: The packages to index.
+        :type packages: Iterable[pythoneda.shared.artifact.PythonPackage]
+        """
+        super().__init__()
+        self._packages = []
+        self._ordinals = {}
+        self._bitmaps = {}
+        self._universe = 0
+        for package in packages or []:
+            self.add(package)
+
+    @property
+    def universe(self) -> int:
+        """
+        Retrieves the bitmap of all indexed packages.
+        :return: Such bitmap.
+        :rtype: int
+        """
+        return self._universe
+
+    def add(self, package: PythonPackage) -> int:
+        """
+        Indexes given package.
+        :param package: The package.
+        :type package: pythoneda.shared.artifact.PythonPackage
+        :return: The ordinal of the package.
+        :rtype: int
+        """
+        result = self._ordinals.get(id(package), None)
+        if result is None:
+            result = len(self._packages)
+            self._packages.append(package)
+            self._ordinals[id(package)] = result
+        else:
+            self._clear(result)
+        bit = 1 << result
+        for value in (
+            package.pescio_space,
+            package.architectural_role,
+            package.hexagonal_layer,
+        ):
+            if value is not None:
+                self._bitmaps[value] = self._bitmaps.get(value, 0) | bit
+        self._universe |= bit
+        return result
+
+    def remove(self, package: PythonPackage):
+        """
+        Removes given package from the index. Its ordinal is not reused.
+        :param package: The package.
+        :type package: pythoneda.shared.artifact.PythonPackage
+        """
+        ordinal = self._ordinals.pop(id(package), None)
+        if ordinal is not None:
+            self._clear(ordinal)
+            self._packages[ordinal] = None
+
+    def _clear(self, ordinal: int):
+        """
+        Clears the bit of given ordinal in every bitmap.
+        :param ordinal: The ordinal.
+        :type ordinal: int
+        """
+        mask = ~(1 << ordinal)
+        for value in self._bitmaps:
+            self._bitmaps[value] &= mask
+        self._universe &= mask
+
+    def bitmap(self, value: Enum) -> int:
+        """
+        Retrieves the bitmap of given enum value.
+        :param value: A PescioSpace, ArchitecturalRole or HexagonalLayer value.
+        :type value: enum.Enum
+        :return: The bitmap of the packages with such value.
+        :rtype: int
+        """
+        return self._bitmaps.get(value, 0)
+
+    def all_of(self, *values: Enum) -> int:
+        """
+        Retrieves the packages matching all given values.
+        :param values: The enum values.
+        :type values: List[enum.Enum]
+        :return: The bitmap.
+        :rtype: int
+        """
+        result = self._universe
+        for value in values:
+            result &= self.bitmap(value)
+        return result
+
+    def any_of(self, *values: Enum) -> int:
+        """
+        Retrieves the packages matching any of given values.
+        :param values: The enum values.
+        :type values: List[enum.Enum]
+        :return: The bitmap.
+        :rtype: int
+        """
+        result = 0
+        for value in values:
+            result |= self.bitmap(value)
+        return result
+
+    def none_of(self, *values: Enum) -> int:
+        """
+        Retrieves the packages matching none of given values.
+        :param values: The enum values.
+        :type values: List[enum.Enum]
+        :return: The bitmap.
+        :rtype: int
+        """
+        return self._universe & ~self.any_of(*values)
+
+    def all_but(self, layer: HexagonalLayer) -> int:
+        """
+        Retrieves the packages in any layer but given one: the bitmap counterpart of
+        HexagonalLayer.all_but(). Packages without a layer are left out.
+        :param layer: The layer to exclude.
+        :type layer: pythoneda.shared.artifact.HexagonalLayer
+        :return: The bitmap.
+        :rtype: int
+        """
+        return self.any_of(*layer.all_but())
+
+    def query(
+        self,
+        pescioSpace: PescioSpace = None,
+        architecturalRole: ArchitecturalRole = None,
+        hexagonalLayer: HexagonalLayer = None,
+    ) -> List[PythonPackage]:
+        """
+        Retrieves the packages matching all given criteria.
+        :param pescioSpace: The Pescio space, if any.
+        :type pescioSpace: pythoneda.shared.artifact.PescioSpace
+        :param architecturalRole: The architectural role, if any.
+        :type architecturalRole: pythoneda.shared.artifact.ArchitecturalRole
+        :param hexagonalLayer: The hexagonal layer, if any.
+        :type hexagonalLayer: pythoneda.shared.artifact.HexagonalLayer
+        :return: The matching packages.
+        :rtype: List[pythoneda.shared.artifact.PythonPackage]
+        """
+        return self.select(
+            self.all_of(
+                *[
+                    value
+                    for value in (pescioSpace, architecturalRole, hexagonalLayer)
+                    if value is not None
+                ]
+            )
+        )
+
+    def count(self, bitmap: int) -> int:
+        """
+        Retrieves how many packages given bitmap holds.
+        :param bitmap: The bitmap.
+        :type bitmap: int
+        :return: The number of packages.
+        :rtype: int
+        """
+        return bin(bitmap).count("1")
+
+    def select(self, bitmap: int) -> List[PythonPackage]:
+        """
+        Retrieves the packages of given bitmap, in ordinal order.
+        :param bitmap: The bitmap.
+        :type bitmap: int
+        :return: The packages.
+        :rtype: List[pythoneda.shared.artifact.PythonPackage]
+        """
+        result = []
+        while bitmap:
+            lowest = bitmap & -bitmap
+            result.append(self._packages[lowest.bit_length() - 1])
+            bitmap ^= lowest
+        return result
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
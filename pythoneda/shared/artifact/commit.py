@@ -20,8 +20,16 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 from .artifact_event_listener import ArtifactEventListener
-from pythoneda.shared.artifact.events import ChangeStaged, StagedChangesCommitted
-from pythoneda.shared.git import GitAdd, GitAddFailed, GitDiff, GitRepo
+from .async_git import AsyncGit
+from .commit_batcher import CommitBatcher
+from .listener_logging import ListenerLogging
+from pythoneda.shared.artifact.events import (
+    Change,
+    ChangeStaged,
+    StagedChangesCommitted,
+)
+from .stage_timed_out import StageTimedOut
+import subprocess
 from typing import List
 
 
@@ -33,8 +41,10 @@ class Commit(ArtifactEventListener):
 
     Responsibilities:
         - React to ChangeStaged events.
+        - Commit the changes staged in a repository while it's busy at once.
 
     Collaborators:
+        - pythoneda.shared.artifact.CommitBatcher
         - pythoneda.shared.artifact.events.ChangeStaged
         - pythoneda.shared.artifact.events.StagedChangesCommitted
     """
@@ -52,42 +62,100 @@ class Commit(ArtifactEventListener):
         Gets notified of a ChangeStaged event.
         :param event: The event.
         :type event: pythoneda.shared.artifact.events.ChangeStaged
-        :return: An event notifying the change has been staged.
+        :return: An event notifying the changes have been committed, or None if the
+        event joined a batch somebody else commits.
         :rtype: pythoneda.shared.artifact.events.StagedChangesCommitted
         """
         if not self.enabled:
             return None
-        CommitPush.logger().debug(f"Received {event}")
-        return await self.stage(event.files, event.repository_folder)
+        Commit.logger().debug("Received %s", ListenerLogging.brief(event))
+        return await CommitBatcher.instance().submit(
+            event.repository_folder, event, self.commit_batch
+        )
 
-    async def stage(self, files: List, folder: str) -> StagedChangesCommitted:
+    async def commit_batch(
+        self, folder: str, events: List[ChangeStaged]
+    ) -> StagedChangesCommitted:
+        """
+        Commits the changes of given events at once.
+        :param folder: The repository folder.
+        :type folder: str
+        :param events: The ChangeStaged events.
+        :type events: List[pythoneda.shared.artifact.events.ChangeStaged]
+        :return: An event notifying the changes have been committed.
+        :rtype: pythoneda.shared.artifact.events.StagedChangesCommitted
+        """
+        files = []
+        for event in events:
+            for file in event.files:
+                if file not in files:
+                    files.append(file)
+        ids = [event.id for event in events]
+        change = await self.stage(files, folder)
+        if change is None:
+            return None
+        result = None
+        message = "\n".join(
+            [f"Committed {len(files)} staged file(s)", ""]
+            + [f"Event-Id: {id}" for id in ids]
+        )
+        try:
+            git = AsyncGit.instance()
+            await git.commit(folder, message)
+            rev = await git.run(
+                "resolve_revision",
+                folder,
+                self.resolve_revision,
+                folder,
+                exclusive=False,
+            )
+            # like every other event, one cause: the one that opened the batch. The
+            # commit message lists them all.
+            result = StagedChangesCommitted(change, rev, ids[0])
+        except subprocess.CalledProcessError as err:
+            Commit.logger().error("Could not commit staged changes in %s", folder)
+            Commit.logger().error(err.stderr)
+        except StageTimedOut as err:
+            Commit.logger().error(
+                "Could not commit in %s: stuck in %s", folder, err.stage
+            )
+        return result
+
+    async def stage(self, files: List, folder: str) -> Change:
         """
         Stages the changes of given files.
         :param files: The files with the changes to stage.
         :type files: List[str]
         :param folder: The folder.
         :type folder: str
-        :return: An event notifying the change has been staged.
-        :rtype: pythoneda.shared.artifact.events.StagedChangesCommitted
+        :return: The staged change, or None if there's nothing to commit.
+        :rtype: pythoneda.shared.artifact.events.Change
         """
         result = None
         try:
-            Commit.logger().info(f"Committing changes in folder {folder}")
+            Commit.logger().info("Committing changes in folder %s", folder)
+            git = AsyncGit.instance()
             for file in files:
-                GitAdd(folder).add(file)
-            urls = GitRepo.remote_urls(folder)
-            if len(urls) > 0:
-                result = ChangeStaged(
-                    Change.from_unidiff_text(
-                        GitDiff(folder).diff(),
-                        urls[0],
-                        GitRepo.current_branch(folder),
-                        folder,
-                    )
+                await git.add(folder, file)
+            urls = await git.remote_urls(folder)
+            # the files are staged already: the working tree may have nothing left.
+            diff = await git.staged_diff(folder)
+            if diff.strip() == "":
+                Commit.logger().info("Nothing to commit in folder %s", folder)
+            elif len(urls) > 0:
+                result = Change.from_unidiff_text(
+                    diff,
+                    urls[0],
+                    await git.current_branch(folder),
+                    folder,
                 )
-        except GitAddFailed as err:
-            Commit.logger().error("Could not stage changes in {files}")
-            Commit.logger().error(err)
+        except subprocess.CalledProcessError as err:
+            Commit.logger().error("Could not stage changes in %s", files)
+            Commit.logger().error(err.stderr)
+        except StageTimedOut as err:
+            Commit.logger().error(
+                "Could not stage changes in %s: stuck in %s", folder, err.stage
+            )
         return result
 
 
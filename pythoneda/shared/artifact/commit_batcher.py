@@ -0,0 +1,179 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/commit_batcher.py
+
+This file declares the CommitBatcher class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+import os
+from pythoneda.shared import BaseObject, Event
+from .stage_timed_out import StageTimedOut
+import threading
+from typing import Awaitable, Callable, Dict, List
+import weakref
+
+
+class CommitBatcher(BaseObject):
+    """
+    Merges the changes staged in a repository while it's busy into a single commit.
+
+    Class name: CommitBatcher
+
+    Responsibilities:
+        - Open a batch with the first ChangeStaged of a repository folder, and collect the
+          ones arriving before it can be committed, i.e. while an earlier commit of the
+          folder runs, plus an optional window (PYTHONEDA_COMMIT_WINDOW seconds).
+        - Commit each batch once, and never two batches of the same folder at a time.
+        - Give up on a batch whose commit overruns its Deadline, without holding back
+          the next batches of the folder.
+
+    Collaborators:
+        - pythoneda.shared.artifact.Commit
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+    _default_window = 0.0
+
+    def __init__(self, window: float = None):
+        """
+        Creates a new CommitBatcher instance.
+        :param window: How long to wait for more changes, in seconds, besides the time the
+        folder is busy. Defaults to PYTHONEDA_COMMIT_WINDOW, or 0: an idle folder commits right away.
+        :type window: float
+        """
+        super().__init__()
+        if window is None:
+            window = float(
+                os.environ.get("PYTHONEDA_COMMIT_WINDOW", CommitBatcher._default_window)
+            )
+        self._window = max(window, 0.0)
+        self._batches: Dict[str, List[Event]] = {}
+        # per loop, since asyncio locks belong to one; a folder's lock lives while in use.
+        self._locks = weakref.WeakKeyDictionary()
+        self._locks_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        """
+        Retrieves the process-wide batcher.
+        :return: The batcher.
+        :rtype: pythoneda.shared.artifact.CommitBatcher
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    @property
+    def window(self) -> float:
+        """
+        Retrieves the batching window.
+        :return: Such window, in seconds.
+        :rtype: float
+        """
+        return self._window
+
+    async def submit(
+        self,
+        folder: str,
+        event: Event,
+        commit: Callable[[str, List[Event]], Awaitable[Event]],
+    ) -> Event:
+        """
+        Adds given event to the open batch of its folder, opening one if needed.
+        :param folder: The repository folder.
+        :type folder: str
+        :param event: The ChangeStaged event.
+        :type event: pythoneda.shared.artifact.events.ChangeStaged
+        :param commit: Commits a batch: receives the folder and its events, and returns
+        the resulting StagedChangesCommitted event.
+        :type commit: Callable[[str, List[pythoneda.shared.Event]], Awaitable[pythoneda.shared.Event]]
+        :return: The StagedChangesCommitted event for whoever opened the batch; None for
+        the events that joined it, or if the batch timed out.
+        :rtype: pythoneda.shared.artifact.events.StagedChangesCommitted
+        """
+        key = os.path.abspath(folder)
+        batch = self._batches.get(key, None)
+        if batch is not None:
+            batch.append(event)
+            CommitBatcher.logger().debug(
+                "Batched %s with %d earlier changes in %s",
+                getattr(event, "id", None),
+                len(batch) - 1,
+                key,
+            )
+            return None
+        batch = [event]
+        self._batches[key] = batch
+        try:
+            if self._window > 0:
+                await asyncio.sleep(self._window)
+            # the batch stays open while an earlier commit of the folder runs.
+            async with self._lock_for(key):
+                if self._batches.get(key, None) is batch:
+                    del self._batches[key]
+                if len(batch) > 1:
+                    CommitBatcher.logger().info(
+                        "Committing %d changes in %s at once", len(batch), key
+                    )
+                try:
+                    return await commit(key, batch)
+                except StageTimedOut as err:
+                    # the changes stay staged: the next batch of the folder commits them.
+                    CommitBatcher.logger().error(
+                        "Gave up committing %d changes in %s: stuck in %s after %.1fs",
+                        len(batch),
+                        key,
+                        err.stage,
+                        err.timeout,
+                    )
+                    return None
+        finally:
+            if self._batches.get(key, None) is batch:
+                del self._batches[key]
+
+    def _lock_for(self, key: str) -> asyncio.Lock:
+        """
+        Retrieves the lock serializing the commits of given folder in the running loop.
+        :param key: The absolute repository folder.
+        :type key: str
+        :return: The lock.
+        :rtype: asyncio.Lock
+        """
+        loop = asyncio.get_running_loop()
+        with self._locks_lock:
+            locks = self._locks.get(loop, None)
+            if locks is None:
+                locks = weakref.WeakValueDictionary()
+                self._locks[loop] = locks
+            result = locks.get(key, None)
+            if result is None:
+                result = asyncio.Lock()
+                locks[key] = result
+        return result
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
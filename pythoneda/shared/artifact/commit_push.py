@@ -20,11 +20,15 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 from .artifact_event_listener import ArtifactEventListener
+from .async_git import AsyncGit
+from .listener_logging import ListenerLogging
+from .release_journal import ReleaseJournal
 from pythoneda.shared.artifact.events import (
     StagedChangesCommitted,
     CommittedChangesPushed,
 )
-from pythoneda.shared.git import GitPush, GitPushFailed
+from .stage_timed_out import StageTimedOut
+import subprocess
 
 
 class CommitPush(ArtifactEventListener):
@@ -61,8 +65,19 @@ class CommitPush(ArtifactEventListener):
         if not self.enabled:
             return None
         result = None
-        CommitPush.logger().debug(f"Received {event}")
-        pushed = await self.push(event.change.repository_folder)
+        CommitPush.logger().debug("Received %s", ListenerLogging.brief(event))
+        folder = event.change.repository_folder
+        journal = ReleaseJournal.for_folder(folder)
+        pushed = journal.completed("push", event.commit) is not None
+        if pushed:
+            CommitPush.logger().info("Commit %s already pushed", event.commit)
+        else:
+            journal.begin("push", event.commit)
+            pushed = await self.push(folder)
+            if pushed:
+                journal.complete("push", event.commit)
+            else:
+                journal.abort("push", event.commit)
         if pushed:
             result = CommittedChangesPushed(event.change, event.commit, event.id)
         return result
@@ -76,12 +91,17 @@ class CommitPush(ArtifactEventListener):
         :rtype: bool
         """
         try:
-            CommitPush.logger().info(f"Pushing changes in folder {folder}")
-            GitPush(folder).push()
+            CommitPush.logger().info("Pushing changes in folder %s", folder)
+            await AsyncGit.instance().push(folder)
             result = True
-        except GitPushFailed as err:
+        except subprocess.CalledProcessError as err:
             CommitPush.logger().error("Could not push commits")
-            CommitPush.logger().error(err)
+            CommitPush.logger().error(err.stderr)
+            result = False
+        except StageTimedOut as err:
+            CommitPush.logger().error(
+                "Gave up pushing in %s: stuck in %s", folder, err.stage
+            )
             result = False
         return result
 # vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
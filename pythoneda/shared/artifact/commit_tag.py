@@ -20,6 +20,8 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 from .artifact_event_listener import ArtifactEventListener
+from .listener_logging import ListenerLogging
+from .release_journal import ReleaseJournal
 from pythoneda.shared.artifact.events import (
     CommittedChangesPushed,
     CommittedChangesTagged,
@@ -60,11 +62,27 @@ class CommitTag(ArtifactEventListener):
         if not self.enabled:
             return None
         result = None
-        CommitTag.logger().debug(f"Received {event.__class__}")
-        version = await self.tag(event.change.repository_folder)
-        if version is not None:
+        CommitTag.logger().debug("Received %s", ListenerLogging.brief(event))
+        folder = event.change.repository_folder
+        journal = ReleaseJournal.for_folder(folder)
+        done = journal.completed("tag", event.commit)
+        if done is None:
+            journal.begin("tag", event.commit)
+            version = await self.tag(folder)
+            tag = None if version is None else version.value
+            if tag is None:
+                journal.abort("tag", event.commit)
+            else:
+                journal.complete("tag", event.commit, {"version": tag})
+        else:
+            tag = done.get("version")
+            CommitTag.logger().info(
+                "Commit %s already tagged as %s", event.commit, tag
+            )
+        if tag is not None:
+            self.prefetch_tagged_sha256(event.change.repository_url, tag, folder)
             result = CommittedChangesTagged(
-                version.value,
+                tag,
                 event.commit,
                 event.change.repository_url,
                 event.change.branch,
@@ -72,6 +90,8 @@ class CommitTag(ArtifactEventListener):
                 event.id,
             )
         return result
+
+
 # vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
 # Local Variables:
 # mode: python
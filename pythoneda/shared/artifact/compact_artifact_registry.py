@@ -0,0 +1,435 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/compact_artifact_registry.py
+
+This file declares the CompactArtifactRegistry class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from .architectural_role import ArchitecturalRole
+from array import array
+from .artifact_record import ArtifactRecord
+from enum import Enum
+from .hexagonal_layer import HexagonalLayer
+from .pescio_space import PescioSpace
+from pythoneda.shared import BaseObject
+from .python_package import PythonPackage
+import sys
+from typing import Dict, Iterable, List, Tuple, Type
+
+
+class CompactArtifactRegistry(BaseObject):
+    """
+    Columnar, memory-compact store of artifact metadata.
+
+    Class name: CompactArtifactRegistry
+
+    Responsibilities:
+        - Store the metadata of many artifacts in typed arrays, one column per attribute.
+        - Intern every string (urls, licenses, maintainers...) once, and refer to it by id.
+        - Store enum values as small ints.
+        - Update an artifact in place when it's stored again, e.g. after a new release.
+
+    Collaborators:
+        - pythoneda.shared.artifact.AbstractArtifact
+        - pythoneda.shared.artifact.ArtifactRecord
+    """
+
+    _string_columns = (
+        "url",
+        "name",
+        "version",
+        "description",
+        "homepage",
+        "license_id",
+        "copyright_holder",
+        "folder",
+    )
+    _list_columns = ("maintainers", "inputs")
+    _enum_columns = (PescioSpace, ArchitecturalRole, HexagonalLayer)
+
+    def __init__(self):
+        """
+        Creates a new CompactArtifactRegistry instance.
+        """
+        super().__init__()
+        # id 0 stands for None.
+        self._strings = [None]
+        self._string_ids = {}
+        self._columns = {name: array("I") for name in self._string_columns}
+        self._lists = {name: array("I") for name in self._list_columns}
+        # where the items of each artifact start in its list, and how many there are.
+        self._starts = {name: array("I") for name in self._list_columns}
+        self._lengths = {name: array("I") for name in self._list_columns}
+        self._enums = {enum: array("b") for enum in self._enum_columns}
+        self._enum_values = {enum: list(enum) for enum in self._enum_columns}
+        self._copyright_years = array("H")
+        self._ordinals_by_url = {}
+
+    def __len__(self) -> int:
+        """
+        Retrieves the number of artifacts.
+        :return: Such number.
+        :rtype: int
+        """
+        return len(self._copyright_years)
+
+    def intern(self, value: str) -> int:
+        """
+        Retrieves the id of given string, storing it if it's new.
+        :param value: The string.
+        :type value: str
+        :return: Its id.
+        :rtype: int
+        """
+        if value is None:
+            return 0
+        result = self._string_ids.get(value, None)
+        if result is None:
+            result = len(self._strings)
+            self._strings.append(sys.intern(value))
+            self._string_ids[self._strings[result]] = result
+        return result
+
+    def append(
+        self,
+        url: str,
+        name: str,
+        version: str,
+        description: str = None,
+        homepage: str = None,
+        licenseId: str = None,
+        maintainers: Iterable[str] = None,
+        copyrightYear: int = 0,
+        copyrightHolder: str = None,
+        inputs: Iterable[str] = None,
+        folder: str = None,
+        pescioSpace: PescioSpace = None,
+        architecturalRole: ArchitecturalRole = None,
+        hexagonalLayer: HexagonalLayer = None,
+    ) -> int:
+        """
+        Stores an artifact.
+        :param url: The url of the artifact.
+        :type url: str
+        :param name: The name of the artifact.
+        :type name: str
+        :param version: The version of the artifact.
+        :type version: str
+        :param description: The description.
+        :type description: str
+        :param homepage: The homepage.
+        :type homepage: str
+        :param licenseId: The license id.
+        :type licenseId: str
+        :param maintainers: The maintainers.
+        :type maintainers: Iterable[str]
+        :param copyrightYear: The copyright year.
+        :type copyrightYear: int
+        :param copyrightHolder: The copyright holder.
+        :type copyrightHolder: str
+        :param inputs: The urls of the inputs.
+        :type inputs: Iterable[str]
+        :param folder: The repository folder.
+        :type folder: str
+        :param pescioSpace: The Pescio space, for Python packages.
+        :type pescioSpace: pythoneda.shared.artifact.PescioSpace
+        :param architecturalRole: The architectural role, for Python packages.
+        :type architecturalRole: pythoneda.shared.artifact.ArchitecturalRole
+        :param hexagonalLayer: The hexagonal layer, for Python packages.
+        :type hexagonalLayer: pythoneda.shared.artifact.HexagonalLayer
+        :return: The ordinal of the artifact. An artifact with the same url is updated in place.
+        :rtype: int
+        """
+        result = self._ordinals_by_url.get(self._string_ids.get(url, 0), None)
+        new = result is None
+        if new:
+            result = len(self)
+        values = {
+            "url": url,
+            "name": name,
+            "version": version,
+            "description": description,
+            "homepage": homepage,
+            "license_id": licenseId,
+            "copyright_holder": copyrightHolder,
+            "folder": folder,
+        }
+        for column, value in values.items():
+            self._store(self._columns[column], result, self.intern(value))
+        for column, items in (("maintainers", maintainers), ("inputs", inputs)):
+            self._store_list(column, result, [self.intern(item) for item in items or []])
+        for enum, value in (
+            (PescioSpace, pescioSpace),
+            (ArchitecturalRole, architecturalRole),
+            (HexagonalLayer, hexagonalLayer),
+        ):
+            self._store(
+                self._enums[enum],
+                result,
+                -1 if value is None else self._enum_values[enum].index(value),
+            )
+        # the length of this column is the number of artifacts, so it goes last.
+        self._store(self._copyright_years, result, copyrightYear or 0)
+        if new:
+            self._ordinals_by_url[self._columns["url"][result]] = result
+        return result
+
+    @staticmethod
+    def _store(column: array, ordinal: int, value: int):
+        """
+        Writes a value of a column, appending it if the artifact is new.
+        :param column: The column.
+        :type column: array.array
+        :param ordinal: The position of the artifact.
+        :type ordinal: int
+        :param value: The value.
+        :type value: int
+        """
+        if ordinal < len(column):
+            column[ordinal] = value
+        else:
+            column.append(value)
+
+    def _store_list(self, column: str, ordinal: int, ids: List[int]):
+        """
+        Writes the items of a list attribute, reusing their previous slots if they fit.
+        :param column: The attribute.
+        :type column: str
+        :param ordinal: The position of the artifact.
+        :type ordinal: int
+        :param ids: The ids of the items.
+        :type ids: List[int]
+        """
+        items = self._lists[column]
+        starts = self._starts[column]
+        lengths = self._lengths[column]
+        if ordinal < len(starts) and len(ids) <= lengths[ordinal]:
+            start = starts[ordinal]
+            items[start : start + len(ids)] = array("I", ids)
+        else:
+            start = len(items)
+            items.extend(ids)
+        self._store(starts, ordinal, start)
+        self._store(lengths, ordinal, len(ids))
+
+    def add(self, artifact, folder: str = None) -> int:
+        """
+        Stores given artifact.
+        :param artifact: The artifact.
+        :type artifact: pythoneda.shared.artifact.AbstractArtifact
+        :param folder: Its repository folder, if known.
+        :type folder: str
+        :return: The ordinal of the artifact.
+        :rtype: int
+        """
+        classified = isinstance(artifact, PythonPackage)
+        return self.append(
+            artifact.__class__.url,
+            artifact.name,
+            artifact.version,
+            artifact.description,
+            artifact.homepage,
+            artifact.license_id,
+            artifact.maintainers,
+            artifact.copyright_year,
+            artifact.copyright_holder,
+            [aux.url for aux in artifact.inputs],
+            folder,
+            artifact.pescio_space if classified else None,
+            artifact.architectural_role if classified else None,
+            artifact.hexagonal_layer if classified else None,
+        )
+
+    def record(self, ordinal: int) -> ArtifactRecord:
+        """
+        Retrieves a view of the artifact at given position.
+        :param ordinal: The position.
+        :type ordinal: int
+        :return: The view.
+        :rtype: pythoneda.shared.artifact.ArtifactRecord
+        """
+        return ArtifactRecord(self, ordinal)
+
+    def find_by_url(self, url: str) -> ArtifactRecord:
+        """
+        Retrieves the artifact with given url.
+        :param url: The url.
+        :type url: str
+        :return: Its view, or None if not found.
+        :rtype: pythoneda.shared.artifact.ArtifactRecord
+        """
+        ordinal = self._ordinals_by_url.get(self._string_ids.get(url, 0), None)
+        return None if ordinal is None else ArtifactRecord(self, ordinal)
+
+    def records(self) -> List[ArtifactRecord]:
+        """
+        Retrieves views of all artifacts.
+        :return: The views.
+        :rtype: List[pythoneda.shared.artifact.ArtifactRecord]
+        """
+        return [ArtifactRecord(self, ordinal) for ordinal in range(len(self))]
+
+    def string(self, ordinal: int, column: str) -> str:
+        """
+        Retrieves a string attribute.
+        :param ordinal: The position of the artifact.
+        :type ordinal: int
+        :param column: The attribute.
+        :type column: str
+        :return: Its value.
+        :rtype: str
+        """
+        return self._strings[self._columns[column][ordinal]]
+
+    def strings(self, ordinal: int, column: str) -> Tuple[str, ...]:
+        """
+        Retrieves a list attribute.
+        :param ordinal: The position of the artifact.
+        :type ordinal: int
+        :param column: The attribute.
+        :type column: str
+        :return: Its values.
+        :rtype: Tuple[str, ...]
+        """
+        start = self._starts[column][ordinal]
+        end = start + self._lengths[column][ordinal]
+        return tuple(self._strings[item] for item in self._lists[column][start:end])
+
+    def enum(self, ordinal: int, enum: Type[Enum]) -> Enum:
+        """
+        Retrieves an enum attribute.
+        :param ordinal: The position of the artifact.
+        :type ordinal: int
+        :param enum: The enum type.
+        :type enum: Type[enum.Enum]
+        :return: Its value, or None.
+        :rtype: enum.Enum
+        """
+        index = self._enums[enum][ordinal]
+        return None if index < 0 else self._enum_values[enum][index]
+
+    def copyright_year(self, ordinal: int) -> int:
+        """
+        Retrieves the copyright year of an artifact.
+        :param ordinal: The position of the artifact.
+        :type ordinal: int
+        :return: Such year.
+        :rtype: int
+        """
+        return self._copyright_years[ordinal]
+
+    def columns(self) -> Dict[str, array]:
+        """
+        Retrieves the raw columns, keyed by name.
+        :return: The typed arrays, including the flattened lists and where each artifact's items are.
+        :rtype: Dict[str, array.array]
+        """
+        result = {f"column.{name}": column for name, column in self._columns.items()}
+        for name in self._list_columns:
+            result[f"list.{name}"] = self._lists[name]
+            result[f"starts.{name}"] = self._starts[name]
+            result[f"lengths.{name}"] = self._lengths[name]
+        for enum, column in self._enums.items():
+            result[f"enum.{enum.__name__}"] = column
+        result["copyright_years"] = self._copyright_years
+        return result
+
+    @property
+    def string_table(self) -> List[str]:
+        """
+        Retrieves the interned strings, indexed by id. Id 0 stands for None.
+        :return: Such strings.
+        :rtype: List[str]
+        """
+        return self._strings
+
+    @property
+    def size_in_bytes(self) -> int:
+        """
+        Retrieves the memory held by this registry.
+        :return: The size, in bytes.
+        :rtype: int
+        """
+        result = sum(sys.getsizeof(value) for value in self._strings)
+        result += sys.getsizeof(self._strings) + sys.getsizeof(self._string_ids)
+        result += sys.getsizeof(self._ordinals_by_url)
+        for columns in (
+            self._columns,
+            self._lists,
+            self._starts,
+            self._lengths,
+            self._enums,
+        ):
+            result += sum(sys.getsizeof(column) for column in columns.values())
+        result += sys.getsizeof(self._copyright_years)
+        return result
+
+    @classmethod
+    def deep_size_of(cls, value, seen: set = None) -> int:
+        """
+        Estimates the memory held by given object graph.
+        :param value: The object.
+        :type value: Any
+        :param seen: The ids of the objects already accounted for.
+        :type seen: set
+        :return: The size, in bytes.
+        :rtype: int
+        """
+        if seen is None:
+            seen = set()
+        if id(value) in seen or isinstance(value, (type, Enum)):
+            return 0
+        seen.add(id(value))
+        result = sys.getsizeof(value)
+        if isinstance(value, dict):
+            result += sum(
+                cls.deep_size_of(key, seen) + cls.deep_size_of(item, seen)
+                for key, item in value.items()
+            )
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            result += sum(cls.deep_size_of(item, seen) for item in value)
+        elif hasattr(value, "__dict__"):
+            result += cls.deep_size_of(vars(value), seen)
+        return result
+
+    @classmethod
+    def benchmark(cls, artifacts: List) -> Dict[str, float]:
+        """
+        Compares the memory per artifact of given objects with their compact representation.
+        :param artifacts: The artifacts.
+        :type artifacts: List[pythoneda.shared.artifact.AbstractArtifact]
+        :return: The bytes per artifact, "before" and "after".
+        :rtype: Dict[str, float]
+        """
+        registry = cls()
+        for artifact in artifacts:
+            registry.add(artifact)
+        count = max(len(artifacts), 1)
+        return {
+            "before": cls.deep_size_of(list(artifacts)) / count,
+            "after": registry.size_in_bytes / count,
+        }
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,89 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/content_digest.py
+
+This file declares the ContentDigest class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import hashlib
+import os
+from pythoneda.shared import BaseObject
+
+
+class ContentDigest(BaseObject):
+    """
+    Computes digests of file contents.
+
+    Class name: ContentDigest
+
+    Responsibilities:
+        - Compute stable digests of files and texts.
+
+    Collaborators:
+        - None
+    """
+
+    _chunk_size = 64 * 1024
+
+    @classmethod
+    def of_bytes(cls, content: bytes) -> str:
+        """
+        Computes the digest of given bytes.
+        :param content: The content.
+        :type content: bytes
+        :return: The hex digest.
+        :rtype: str
+        """
+        return hashlib.sha256(content).hexdigest()
+
+    @classmethod
+    def of_text(cls, text: str) -> str:
+        """
+        Computes the digest of given text.
+        :param text: The text.
+        :type text: str
+        :return: The hex digest.
+        :rtype: str
+        """
+        return cls.of_bytes(text.encode("utf-8"))
+
+    @classmethod
+    def of_file(cls, path: str) -> str:
+        """
+        Computes the digest of given file.
+        :param path: The file path.
+        :type path: str
+        :return: The hex digest, or None if the file does not exist.
+        :rtype: str
+        """
+        if not os.path.isfile(path):
+            return None
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(cls._chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
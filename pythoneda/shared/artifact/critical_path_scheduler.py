@@ -0,0 +1,187 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/critical_path_scheduler.py
+
+This file declares the CriticalPathScheduler class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from .dependency_graph import DependencyGraph
+from pythoneda.shared import BaseObject, Event
+from .stage_history import StageHistory
+import threading
+from typing import Iterable, List
+
+
+class CriticalPathScheduler(BaseObject):
+    """
+    Ranks pending cascade work so the repositories that unblock the most work go first.
+
+    Class name: CriticalPathScheduler
+
+    Responsibilities:
+        - Estimate the critical path of each repository: its own release time plus the
+          longest weighted chain of dependents waiting for it.
+        - Provide the priority of each pipeline job, and the stage timings to learn from.
+
+    Collaborators:
+        - pythoneda.shared.artifact.DependencyGraph
+        - pythoneda.shared.artifact.StageHistory
+        - pythoneda.shared.artifact.StagePipeline
+    """
+
+    # re-rank only when an average moved this much.
+    _significant_change = 0.1
+
+    def __init__(self, graph: DependencyGraph, history: StageHistory = None):
+        """
+        Creates a new CriticalPathScheduler instance.
+        :param graph: The input graph of the workspace.
+        :type graph: pythoneda.shared.artifact.DependencyGraph
+        :param history: The stage durations measured so far.
+        :type history: pythoneda.shared.artifact.StageHistory
+        """
+        super().__init__()
+        self._graph = graph
+        self._history = history or StageHistory()
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    @property
+    def history(self) -> StageHistory:
+        """
+        Retrieves the stage durations.
+        :return: Such history.
+        :rtype: pythoneda.shared.artifact.StageHistory
+        """
+        return self._history
+
+    def invalidate(self):
+        """
+        Forgets the computed critical paths, e.g. after the graph changed.
+        """
+        with self._lock:
+            self._paths = {}
+
+    def invalidate_upstream_of(self, url: str):
+        """
+        Forgets the critical paths that include given repository: its own, and the ones
+        of its transitive inputs.
+        :param url: The url of the repository.
+        :type url: str
+        """
+        root = DependencyGraph.key_for(url)
+        seen = {root}
+        pending = [root]
+        while pending:
+            for input in self._graph.inputs_of(pending.pop()):
+                if input not in seen:
+                    seen.add(input)
+                    pending.append(input)
+        with self._lock:
+            for key in seen:
+                self._paths.pop(key, None)
+
+    def critical_path(self, url: str) -> float:
+        """
+        Estimates the time from releasing given repository until its last transitive dependent is released.
+        :param url: The url of the repository.
+        :type url: str
+        :return: Such estimate, in seconds.
+        :rtype: float
+        """
+        root = DependencyGraph.key_for(url)
+        with self._lock:
+            result = self._paths.get(root, None)
+        if result is not None:
+            return result
+        closure = self._graph.dependents_of(root)
+        members = {key for key, _ in closure}
+        with self._lock:
+            longest = {key: self._paths[key] for key in members if key in self._paths}
+        computed = {}
+        # deepest first, so every dependent is solved before the nodes it depends on;
+        # the ones already known are reused rather than walked again.
+        for key, _ in sorted(closure, key=lambda item: -item[1]):
+            if key in longest:
+                continue
+            tail = [
+                longest[dependent]
+                for dependent in self._graph.direct_dependents_of(key)
+                if dependent in members
+            ]
+            longest[key] = self._history.duration(key) + max(tail, default=0.0)
+            computed[key] = longest[key]
+        tail = [
+            longest[dependent]
+            for dependent in self._graph.direct_dependents_of(root)
+            if dependent in members
+        ]
+        result = self._history.duration(root) + max(tail, default=0.0)
+        computed[root] = result
+        with self._lock:
+            self._paths.update(computed)
+        return result
+
+    def rank(self, urls: Iterable[str]) -> List[str]:
+        """
+        Sorts given repositories, longest critical path first.
+        :param urls: The urls of the repositories.
+        :type urls: Iterable[str]
+        :return: The sorted urls.
+        :rtype: List[str]
+        """
+        return sorted(urls, key=lambda url: -self.critical_path(url))
+
+    def priority(self, artifact, event: Event) -> float:
+        """
+        Retrieves the priority of a pipeline job: lower runs first.
+        :param artifact: The artifact the job runs for.
+        :type artifact: pythoneda.shared.artifact.AbstractArtifact
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        :return: The priority.
+        :rtype: float
+        """
+        return -self.critical_path(artifact.__class__.url)
+
+    def record(self, artifact, stage: str, seconds: float):
+        """
+        Learns from a finished pipeline job.
+        :param artifact: The artifact the job ran for.
+        :type artifact: pythoneda.shared.artifact.AbstractArtifact
+        :param stage: The stage.
+        :type stage: str
+        :param seconds: How long it took.
+        :type seconds: float
+        """
+        url = artifact.__class__.url
+        own, default = self._history.record(url, stage, seconds)
+        if default >= self.__class__._significant_change:
+            # the estimate of every repository that never ran the stage moved.
+            self.invalidate()
+        elif own >= self.__class__._significant_change:
+            self.invalidate_upstream_of(url)
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
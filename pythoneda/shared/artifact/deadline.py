@@ -0,0 +1,313 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/deadline.py
+
+This file declares the Deadline class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+from concurrent.futures import Executor
+from contextlib import contextmanager
+import contextvars
+import functools
+import os
+from pythoneda.shared import BaseObject, Event
+import signal
+from .stage_timed_out import StageTimedOut
+import subprocess
+import time
+from typing import Any, Callable, List
+from .wave_tracker import WaveTracker
+
+
+class Deadline(BaseObject):
+    """
+    Bounds how long each operation, and each release wave as a whole, can run.
+
+    Class name: Deadline
+
+    Responsibilities:
+        - Provide per-operation timeouts, configurable via PYTHONEDA_TIMEOUT_<OPERATION>.
+        - Carry the deadline of the current wave (PYTHONEDA_WAVE_TIMEOUT) through the listeners.
+        - Run subprocesses under the tightest of both, each in its own process group,
+          and kill the group of a command that overruns it.
+
+    Collaborators:
+        - pythoneda.shared.artifact.StageTimedOut
+        - pythoneda.shared.artifact.WaveTracker
+    """
+
+    _defaults = {"git": 120.0, "push": 300.0, "nix": 900.0, "script": 900.0}
+    _wave_deadline = contextvars.ContextVar("pythoneda_wave_deadline", default=None)
+
+    @classmethod
+    def timeout_for(cls, operation: str) -> float:
+        """
+        Retrieves the timeout of given kind of operation.
+        :param operation: The operation, e.g. "git", "push", "nix" or "script".
+        :type operation: str
+        :return: The timeout in seconds, or None if unbounded.
+        :rtype: float
+        """
+        value = os.environ.get(f"PYTHONEDA_TIMEOUT_{operation.upper()}", None)
+        result = cls._defaults.get(operation, None) if value is None else float(value)
+        if result is not None and result <= 0:
+            result = None
+        return result
+
+    @classmethod
+    def wave_timeout(cls) -> float:
+        """
+        Retrieves how long a whole release wave can run.
+        :return: The timeout in seconds, or None if unbounded.
+        :rtype: float
+        """
+        value = float(os.environ.get("PYTHONEDA_WAVE_TIMEOUT", "0"))
+        return value if value > 0 else None
+
+    @classmethod
+    @contextmanager
+    def for_wave_of(cls, event: Event):
+        """
+        Makes the deadline of the wave of given event the current one,
+        for the code (and the tasks it spawns) within the block.
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        """
+        timeout = cls.wave_timeout()
+        deadline = None
+        if timeout is not None:
+            deadline = WaveTracker.instance().started_at(event) + timeout
+        token = cls._wave_deadline.set(deadline)
+        try:
+            yield deadline
+        finally:
+            cls._wave_deadline.reset(token)
+
+    @classmethod
+    def remaining(cls, operation: str, stage: str, folder: str) -> float:
+        """
+        Retrieves how long given stage can run.
+        :param operation: The kind of operation.
+        :type operation: str
+        :param stage: The stage, for reporting.
+        :type stage: str
+        :param folder: The repository folder, for reporting.
+        :type folder: str
+        :return: The timeout in seconds, or None if unbounded.
+        :rtype: float
+        """
+        result = cls.timeout_for(operation)
+        deadline = cls._wave_deadline.get()
+        if deadline is not None:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                Deadline.logger().error(f"Wave deadline passed before {stage} in {folder}")
+                raise StageTimedOut(stage, folder, 0.0)
+            result = left if result is None else min(result, left)
+        return result
+
+    @classmethod
+    def kill_group(cls, pid: int):
+        """
+        Kills the process group led by given child process. The child must not have been
+        waited for yet, so its pid (and group id) cannot have been reused.
+        :param pid: The pid of the child, started with start_new_session=True.
+        :type pid: int
+        """
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    @classmethod
+    def run(
+        cls,
+        stage: str,
+        args: List[str],
+        cwd: str,
+        operation: str = "script",
+        check: bool = False,
+        input: str = None,
+    ) -> subprocess.CompletedProcess:
+        """
+        Runs a command in its own process group, killing the group if it overruns its deadline.
+        :param stage: The stage, for reporting.
+        :type stage: str
+        :param args: The command.
+        :type args: List[str]
+        :param cwd: The working folder.
+        :type cwd: str
+        :param operation: The kind of operation.
+        :type operation: str
+        :param check: Whether to raise subprocess.CalledProcessError if the command fails.
+        :type check: bool
+        :param input: The standard input, if any.
+        :type input: str
+        :return: The completed process.
+        :rtype: subprocess.CompletedProcess
+        """
+        timeout = cls.remaining(operation, stage, cwd)
+        process = subprocess.Popen(
+            args,
+            stdin=None if input is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            cwd=cwd,
+            start_new_session=True,
+        )
+        try:
+            stdout, stderr = process.communicate(input, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            cls.kill_group(process.pid)
+            process.communicate()
+            Deadline.logger().error(
+                "%s got stuck in %s running %s: killed after %.1fs",
+                stage,
+                cwd,
+                " ".join(args),
+                timeout,
+            )
+            raise StageTimedOut(stage, cwd, timeout)
+        result = subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+        if check:
+            result.check_returncode()
+        return result
+
+    @classmethod
+    async def spawn(
+        cls,
+        stage: str,
+        args: List[str],
+        cwd: str,
+        operation: str = "git",
+        check: bool = False,
+        input: str = None,
+    ) -> subprocess.CompletedProcess:
+        """
+        Runs a command as an asyncio subprocess in its own process group, killing the
+        group if it overruns its deadline or the caller is cancelled.
+        :param stage: The stage, for reporting.
+        :type stage: str
+        :param args: The command.
+        :type args: List[str]
+        :param cwd: The working folder.
+        :type cwd: str
+        :param operation: The kind of operation.
+        :type operation: str
+        :param check: Whether to raise subprocess.CalledProcessError if the command fails.
+        :type check: bool
+        :param input: The standard input, if any.
+        :type input: str
+        :return: The completed process.
+        :rtype: subprocess.CompletedProcess
+        """
+        timeout = cls.remaining(operation, stage, cwd)
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            cwd=cwd,
+            stdin=asyncio.subprocess.DEVNULL if input is None else asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(None if input is None else input.encode("utf-8")),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            cls.kill_group(process.pid)
+            await process.wait()
+            Deadline.logger().error(
+                "%s got stuck in %s running %s: killed after %.1fs",
+                stage,
+                cwd,
+                " ".join(args),
+                timeout,
+            )
+            raise StageTimedOut(stage, cwd, timeout)
+        except asyncio.CancelledError:
+            cls.kill_group(process.pid)
+            raise
+        result = subprocess.CompletedProcess(
+            args,
+            process.returncode,
+            stdout.decode("utf-8", errors="replace"),
+            stderr.decode("utf-8", errors="replace"),
+        )
+        if check:
+            result.check_returncode()
+        return result
+
+    @classmethod
+    async def call(
+        cls,
+        stage: str,
+        folder: str,
+        function: Callable,
+        *args,
+        operation: str = "git",
+        executor: Executor = None,
+    ) -> Any:
+        """
+        Runs a blocking call in a worker thread, giving up on it if it overruns its deadline.
+        A thread cannot be killed, so the call is left to finish on its own: commands that
+        may hang must go through spawn or run instead.
+        Errors raised by the call propagate unchanged.
+        :param stage: The stage, for reporting.
+        :type stage: str
+        :param folder: The repository folder the call works on.
+        :type folder: str
+        :param function: The blocking callable.
+        :type function: Callable
+        :param args: Its arguments.
+        :type args: List
+        :param operation: The kind of operation.
+        :type operation: str
+        :param executor: The pool to run it in. Defaults to the loop's default executor.
+        :type executor: concurrent.futures.Executor
+        :return: Whatever the call returns.
+        :rtype: Any
+        """
+        timeout = cls.remaining(operation, stage, folder)
+        if executor is None:
+            call = asyncio.to_thread(function, *args)
+        else:
+            # like asyncio.to_thread, the call sees the caller's context.
+            context = contextvars.copy_context()
+            call = asyncio.get_running_loop().run_in_executor(
+                executor, functools.partial(context.run, function, *args)
+            )
+        try:
+            return await asyncio.wait_for(call, timeout)
+        except asyncio.TimeoutError:
+            Deadline.logger().error(
+                "%s got stuck in %s: gave up after %.1fs", stage, folder, timeout
+            )
+            raise StageTimedOut(stage, folder, timeout)
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
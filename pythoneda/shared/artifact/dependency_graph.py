@@ -0,0 +1,341 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/dependency_graph.py
+
+This file declares the DependencyGraph class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from pythoneda.shared import BaseObject
+import re
+import threading
+from typing import Iterable, List, Set, Tuple
+
+
+class DependencyGraph(BaseObject):
+    """
+    The graph of artifacts and their flake inputs.
+
+    Class name: DependencyGraph
+
+    Responsibilities:
+        - Know which artifacts depend on which others.
+        - Answer "what does bumping X affect", caching the answers and
+          invalidating only the ones affected when an artifact's inputs change.
+
+    Collaborators:
+        - pythoneda.shared.artifact.AbstractArtifact
+        - pythoneda.shared.artifact.ArtifactRepository
+    """
+
+    _url_pattern = re.compile(
+        r"^(?:github:|https?://github\.com/|git@github\.com:)"
+        r"(?P<owner>[^/?#]+)/(?P<repo>[^/?#]+?)(?:\.git)?(?:[/?#].*)?$"
+    )
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        """
+        Creates a new DependencyGraph instance.
+        """
+        super().__init__()
+        self._inputs = {}
+        self._dependents = {}
+        self._closures = {}
+        self._cached_by = {}
+        self._cycle_of = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def instance(cls):
+        """
+        Retrieves the process-wide graph, the artifacts register themselves in.
+        :return: The graph.
+        :rtype: pythoneda.shared.artifact.DependencyGraph
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def key_for(cls, url: str) -> str:
+        """
+        Normalizes given url, so that repository urls and flake input urls of
+        any version map to the same node.
+        :param url: The url.
+        :type url: str
+        :return: The node key.
+        :rtype: str
+        """
+        match = cls._url_pattern.match(url)
+        if match is None:
+            return url.rstrip("/")
+        return f"{match.group('owner')}/{match.group('repo')}"
+
+    @classmethod
+    def from_artifacts(cls, artifacts: Iterable):
+        """
+        Builds the graph of given artifacts.
+        :param artifacts: The artifacts.
+        :type artifacts: Iterable[pythoneda.shared.artifact.AbstractArtifact]
+        :return: The graph.
+        :rtype: pythoneda.shared.artifact.DependencyGraph
+        """
+        result = cls()
+        for artifact in artifacts:
+            result.register(artifact)
+        return result
+
+    def register(self, artifact):
+        """
+        Adds or refreshes given artifact.
+        :param artifact: The artifact.
+        :type artifact: pythoneda.shared.artifact.AbstractArtifact
+        """
+        self.update_inputs(
+            artifact.__class__.url, [aux.url for aux in artifact.inputs]
+        )
+
+    def update_inputs(self, url: str, inputUrls: Iterable[str]):
+        """
+        Sets the inputs of given node, invalidating the cached closures that
+        depend on the edges that changed.
+        :param url: The url of the artifact.
+        :type url: str
+        :param inputUrls: The urls of its inputs.
+        :type inputUrls: Iterable[str]
+        """
+        node = self.key_for(url)
+        new_inputs = {self.key_for(aux) for aux in inputUrls}
+        new_inputs.discard(node)
+        with self._lock:
+            old_inputs = self._inputs.get(node, set())
+            for removed in old_inputs - new_inputs:
+                self._dependents.get(removed, set()).discard(node)
+            for added in new_inputs - old_inputs:
+                self._dependents.setdefault(added, set()).add(node)
+                self._inputs.setdefault(added, set())
+            self._inputs[node] = new_inputs
+            self._dependents.setdefault(node, set())
+            self._invalidate(old_inputs ^ new_inputs)
+
+    def unregister(self, url: str):
+        """
+        Removes given node.
+        :param url: The url of the artifact.
+        :type url: str
+        """
+        node = self.key_for(url)
+        with self._lock:
+            self.update_inputs(url, [])
+            for dependent in self._dependents.pop(node, set()):
+                self._inputs.get(dependent, set()).discard(node)
+            self._inputs.pop(node, None)
+            self._invalidate({node})
+
+    def _invalidate(self, nodes: Set[str]):
+        """
+        Forgets the cached closures that include any of given nodes, and the cycles.
+        :param nodes: The nodes whose edges changed.
+        :type nodes: Set[str]
+        """
+        if nodes:
+            self._cycle_of = None
+        for node in nodes:
+            for root in self._cached_by.pop(node, set()):
+                closure = self._closures.pop(root, None)
+                if closure is not None:
+                    for member in [root] + [member for member, _ in closure]:
+                        self._cached_by.get(member, set()).discard(root)
+
+    def inputs_of(self, url: str) -> Set[str]:
+        """
+        Retrieves the direct inputs of given node.
+        :param url: The url of the artifact.
+        :type url: str
+        :return: The keys of its inputs.
+        :rtype: Set[str]
+        """
+        with self._lock:
+            return set(self._inputs.get(self.key_for(url), set()))
+
+    def direct_dependents_of(self, url: str) -> Set[str]:
+        """
+        Retrieves the artifacts using given one directly as input.
+        :param url: The url of the artifact.
+        :type url: str
+        :return: The keys of its dependents.
+        :rtype: Set[str]
+        """
+        with self._lock:
+            return set(self._dependents.get(self.key_for(url), set()))
+
+    def dependents_of(self, url: str) -> List[Tuple[str, int]]:
+        """
+        Retrieves the transitive dependents of given artifact, in topological order.
+        The depth of each dependent is the length of the longest input chain
+        from given artifact, so every dependent comes after all the dependents
+        it uses as input.
+        Dependents caught in an input cycle cannot be ordered, and are left out.
+        :param url: The url of the artifact.
+        :type url: str
+        :return: The (key, depth) pairs.
+        :rtype: List[Tuple[str, int]]
+        """
+        root = self.key_for(url)
+        with self._lock:
+            result = self._closures.get(root, None)
+            if result is None:
+                result, members = self._compute_closure(root)
+                self._closures[root] = result
+                for member in members | {root}:
+                    self._cached_by.setdefault(member, set()).add(root)
+        return result
+
+    def affected_count(self, url: str) -> int:
+        """
+        Retrieves how many artifacts a change in given one ripples through.
+        :param url: The url of the artifact.
+        :type url: str
+        :return: The number of transitive dependents.
+        :rtype: int
+        """
+        return len(self.dependents_of(url))
+
+    def cycles(self) -> List[List[str]]:
+        """
+        Finds the input cycles, i.e. the strongly connected components with
+        more than one artifact.
+        :return: The artifacts of each cycle.
+        :rtype: List[List[str]]
+        """
+        result = []
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        counter = 0
+        with self._lock:
+            for start in list(self._inputs):
+                if start in index:
+                    continue
+                # iterative Tarjan, to cope with deep input chains.
+                work = [(start, iter(self._inputs.get(start, ())))]
+                index[start] = low[start] = counter
+                counter += 1
+                stack.append(start)
+                on_stack.add(start)
+                while work:
+                    node, children = work[-1]
+                    child = next(children, None)
+                    if child is not None:
+                        if child not in index:
+                            index[child] = low[child] = counter
+                            counter += 1
+                            stack.append(child)
+                            on_stack.add(child)
+                            work.append((child, iter(self._inputs.get(child, ()))))
+                        elif child in on_stack:
+                            low[node] = min(low[node], index[child])
+                        continue
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        if len(component) > 1:
+                            result.append(sorted(component))
+        return result
+
+    def in_same_cycle(self, url: str, otherUrl: str) -> bool:
+        """
+        Checks whether given artifacts belong to the same input cycle.
+        :param url: The url of an artifact.
+        :type url: str
+        :param otherUrl: The url of the other artifact.
+        :type otherUrl: str
+        :return: True in such case.
+        :rtype: bool
+        """
+        with self._lock:
+            if self._cycle_of is None:
+                self._cycle_of = {}
+                for cycle in self.cycles():
+                    members = frozenset(cycle)
+                    for member in members:
+                        self._cycle_of[member] = members
+            members = self._cycle_of.get(self.key_for(url), None)
+        return members is not None and self.key_for(otherUrl) in members
+
+    def _compute_closure(self, root: str) -> Tuple[List[Tuple[str, int]], Set[str]]:
+        """
+        Computes the transitive dependents of given node, in topological order.
+        :param root: The node.
+        :type root: str
+        :return: The (key, depth) pairs, and all the nodes reachable from the root.
+        :rtype: Tuple[List[Tuple[str, int]], Set[str]]
+        """
+        members = set()
+        pending = [root]
+        while pending:
+            node = pending.pop()
+            for dependent in self._dependents.get(node, ()):
+                if dependent not in members and dependent != root:
+                    members.add(dependent)
+                    pending.append(dependent)
+        # Kahn's algorithm restricted to the closure, tracking longest paths.
+        relevant = members | {root}
+        remaining = {
+            node: len(self._inputs.get(node, set()) & relevant) for node in members
+        }
+        depth = {root: 0}
+        ready = [root]
+        result = []
+        while ready:
+            node = ready.pop()
+            if node != root:
+                result.append((node, depth[node]))
+            for dependent in self._dependents.get(node, ()):
+                if dependent in remaining:
+                    depth[dependent] = max(depth.get(dependent, 0), depth[node] + 1)
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        ready.append(dependent)
+        if len(result) < len(members):
+            DependencyGraph.logger().warning(
+                f"Dependents of {root} in an input cycle were left out"
+            )
+        result.sort(key=lambda pair: (pair[1], pair[0]))
+        return result, members
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
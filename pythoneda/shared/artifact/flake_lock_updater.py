@@ -0,0 +1,243 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/flake_lock_updater.py
+
+This file declares the FlakeLockUpdater class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+from .content_digest import ContentDigest
+from .deadline import Deadline
+import os
+from pythoneda.shared import BaseObject
+from .shard_coordinator import ShardCoordinator
+import signal
+from .stage_timed_out import StageTimedOut
+import threading
+from typing import Dict, Iterable
+import weakref
+
+
+class FlakeLockUpdater(BaseObject):
+    """
+    Updates the flake.lock files of independent repositories in parallel.
+
+    Class name: FlakeLockUpdater
+
+    Responsibilities:
+        - Run `nix flake update` (PYTHONEDA_NIX, or nix) as asyncio subprocesses, as many at
+          once as the CPUs and the available memory allow (PYTHONEDA_LOCK_WORKERS overrides it).
+        - Bound each update by Deadline's nix timeout, counted from when it starts running,
+          killing the nix process group if needed.
+        - Tell whether each flake.lock changed.
+
+    Collaborators:
+        - pythoneda.shared.artifact.Deadline
+        - pythoneda.shared.artifact.StageInputUpdate
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+    # what a single nix evaluation is assumed to need, in MiB.
+    _default_worker_memory = 1024
+
+    def __init__(self, workers: int = None, nix: str = None):
+        """
+        Creates a new FlakeLockUpdater instance.
+        :param workers: How many updates can run at once. Defaults to PYTHONEDA_LOCK_WORKERS,
+        or to what the CPUs and memory allow.
+        :type workers: int
+        :param nix: The nix executable. Defaults to PYTHONEDA_NIX, or nix.
+        :type nix: str
+        """
+        super().__init__()
+        if workers is None:
+            workers = os.environ.get("PYTHONEDA_LOCK_WORKERS", None)
+            if workers is None:
+                workers = self.__class__.affordable_workers()
+            else:
+                workers = int(workers)
+        self._workers = max(workers, 1)
+        self._nix = nix or os.environ.get("PYTHONEDA_NIX", "nix")
+        # asyncio primitives belong to the loop they're used in.
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._semaphores_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        """
+        Retrieves the process-wide updater.
+        :return: The updater.
+        :rtype: pythoneda.shared.artifact.FlakeLockUpdater
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def available_memory(cls) -> int:
+        """
+        Retrieves the memory available for new processes.
+        :return: Such memory in MiB, or None if unknown.
+        :rtype: int
+        """
+        try:
+            with open("/proc/meminfo", "r", encoding="utf-8") as file:
+                for line in file:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) // 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        return None
+
+    @classmethod
+    def affordable_workers(cls) -> int:
+        """
+        Retrieves how many updates can run at once without oversubscribing the
+        CPUs or the memory (PYTHONEDA_NIX_WORKER_MEMORY MiB each).
+        :return: Such number.
+        :rtype: int
+        """
+        result = ShardCoordinator.cpus()
+        memory = cls.available_memory()
+        if memory is not None:
+            per_worker = int(
+                os.environ.get(
+                    "PYTHONEDA_NIX_WORKER_MEMORY", cls._default_worker_memory
+                )
+            )
+            result = min(result, memory // max(per_worker, 1))
+        return max(result, 1)
+
+    @property
+    def workers(self) -> int:
+        """
+        Retrieves how many updates can run at once.
+        :return: Such number.
+        :rtype: int
+        """
+        return self._workers
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        """
+        Retrieves the semaphore bounding the updates of the running loop.
+        :return: The semaphore.
+        :rtype: asyncio.Semaphore
+        """
+        loop = asyncio.get_running_loop()
+        with self._semaphores_lock:
+            result = self._semaphores.get(loop, None)
+            if result is None:
+                result = asyncio.Semaphore(self._workers)
+                self._semaphores[loop] = result
+        return result
+
+    async def _run(self, folder: str, timeout: float):
+        """
+        Runs `nix flake update` in given folder.
+        :param folder: The flake folder.
+        :type folder: str
+        :param timeout: The timeout in seconds, or None.
+        :type timeout: float
+        :return: The exit code (None if it timed out) and the error output.
+        :rtype: Tuple[int, str]
+        """
+        process = await asyncio.create_subprocess_exec(
+            self._nix,
+            "flake",
+            "update",
+            cwd=folder,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await process.wait()
+            return None, ""
+        except asyncio.CancelledError:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            raise
+        return process.returncode, stderr.decode("utf-8", errors="replace")
+
+    async def update_lock(self, folder: str) -> bool:
+        """
+        Updates the flake.lock in given folder.
+        :param folder: The flake folder.
+        :type folder: str
+        :return: Whether flake.lock changed, or None if the update failed.
+        :rtype: bool
+        """
+        lock_file = os.path.join(folder, "flake.lock")
+        async with self._semaphore():
+            # the time spent waiting for a slot doesn't count.
+            try:
+                timeout = Deadline.remaining("nix", "update_flake_lock", folder)
+            except StageTimedOut:
+                return None
+            before = ContentDigest.of_file(lock_file)
+            try:
+                code, stderr = await self._run(folder, timeout)
+            except OSError as err:
+                FlakeLockUpdater.logger().error(
+                    "Could not run %s in %s: %s", self._nix, folder, err
+                )
+                return None
+        if code is None:
+            FlakeLockUpdater.logger().error(
+                "Updating flake.lock in %s took more than %.1fs", folder, timeout
+            )
+            return None
+        if code != 0:
+            FlakeLockUpdater.logger().error(
+                "Could not update flake.lock in %s: %s", folder, stderr.strip()
+            )
+            return None
+        return ContentDigest.of_file(lock_file) != before
+
+    async def update_locks(self, folders: Iterable[str]) -> Dict[str, bool]:
+        """
+        Updates the flake.lock files in given folders, in parallel.
+        :param folders: The flake folders. Must be independent of each other.
+        :type folders: Iterable[str]
+        :return: Whether each flake.lock changed (None if it failed), by folder.
+        :rtype: Dict[str, bool]
+        """
+        folders = list(folders)
+        results = await asyncio.gather(
+            *[self.update_lock(folder) for folder in folders]
+        )
+        return dict(zip(folders, results))
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,183 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/flake_template_cache.py
+
+This file declares the FlakeTemplateCache class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+from pythoneda.shared import BaseObject
+from pythoneda.shared.nix.flake import NixFlake
+import sys
+import threading
+from typing import Any, Callable, Iterable, List, Tuple
+
+
+class FlakeTemplateCache(BaseObject):
+    """
+    Process-wide cache of the flake templates NixFlake loads.
+
+    Class name: FlakeTemplateCache
+
+    Responsibilities:
+        - Intercept the template groups NixFlake builds from its own template files, and
+          build each one only once, again only if the file changes.
+        - Generate many flakes in one pass.
+
+    Collaborators:
+        - pythoneda.shared.nix.flake.NixFlake
+        - pythoneda.shared.artifact.StageInputUpdate
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+    # the name NixFlake's module builds its template groups with.
+    _factory_name = "StringTemplateGroup"
+
+    def __init__(self):
+        """
+        Creates a new FlakeTemplateCache instance.
+        """
+        super().__init__()
+        self._templates = {}
+        self._lock = threading.Lock()
+        self._compilations = 0
+        self._installed = set()
+
+    @classmethod
+    def instance(cls):
+        """
+        Retrieves the process-wide cache.
+        :return: The cache.
+        :rtype: pythoneda.shared.artifact.FlakeTemplateCache
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    @property
+    def compilations(self) -> int:
+        """
+        Retrieves how many times a template has been compiled.
+        :return: Such number.
+        :rtype: int
+        """
+        return self._compilations
+
+    def compiled(self, path: str, compiler: Callable[[], Any]) -> Any:
+        """
+        Retrieves the compiled template of given file, compiling it if it's new or
+        changed since last time.
+        :param path: The template file.
+        :type path: str
+        :param compiler: Compiles the file.
+        :type compiler: Callable[[], Any]
+        :return: The compiled template.
+        :rtype: Any
+        """
+        key = os.path.realpath(path)
+        stat = os.stat(key)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._templates.get(key, None)
+            if entry is None or entry[0] != stamp:
+                FlakeTemplateCache.logger().debug(f"Compiling template {key}")
+                entry = (stamp, compiler())
+                self._templates[key] = entry
+                self._compilations += 1
+        return entry[1]
+
+    def invalidate(self, path: str = None):
+        """
+        Forgets the compiled template of given file, or all of them.
+        :param path: The template file, or None to forget them all.
+        :type path: str
+        """
+        with self._lock:
+            if path is None:
+                self._templates.clear()
+            else:
+                self._templates.pop(os.path.realpath(path), None)
+
+    def _caching(self, factory: Callable) -> Callable:
+        """
+        Wraps given template group factory so the groups read from a file are cached.
+        :param factory: The factory, i.e. stringtemplate3.StringTemplateGroup.
+        :type factory: Callable
+        :return: The wrapped factory.
+        :rtype: Callable
+        """
+
+        def build(*args, **kwargs):
+            path = getattr(kwargs.get("file", None), "name", None)
+            if not isinstance(path, str) or not os.path.isfile(path):
+                return factory(*args, **kwargs)
+            return self.compiled(path, lambda: factory(*args, **kwargs))
+
+        build.__wrapped__ = factory
+        return build
+
+    def install(self, flake: NixFlake) -> bool:
+        """
+        Makes the module of given flake's class build its template groups through this cache.
+        :param flake: The flake.
+        :type flake: pythoneda.shared.nix.flake.NixFlake
+        :return: True if its template groups get cached.
+        :rtype: bool
+        """
+        module = sys.modules.get(flake.__class__.__module__, None)
+        if module is None:
+            return False
+        with self._lock:
+            if module.__name__ in self._installed:
+                return True
+            factory = getattr(module, FlakeTemplateCache._factory_name, None)
+            if factory is None:
+                FlakeTemplateCache.logger().debug(
+                    f"{module.__name__} does not build template groups: not cached"
+                )
+                return False
+            if getattr(factory, "__wrapped__", None) is None:
+                setattr(module, FlakeTemplateCache._factory_name, self._caching(factory))
+            self._installed.add(module.__name__)
+        return True
+
+    def generate_flakes(self, flakes: Iterable[Tuple[NixFlake, str]]) -> List[str]:
+        """
+        Generates the flake.nix of many flakes in one pass, reusing the templates they share.
+        :param flakes: The (flake, output folder) pairs.
+        :type flakes: Iterable[Tuple[pythoneda.shared.nix.flake.NixFlake, str]]
+        :return: The flake files written.
+        :rtype: List[str]
+        """
+        result = []
+        for flake, folder in flakes:
+            self.install(flake)
+            flake.generate_flake(folder)
+            result.append(os.path.join(folder, "flake.nix"))
+        return result
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
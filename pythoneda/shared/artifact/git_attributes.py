@@ -0,0 +1,286 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/git_attributes.py
+
+This file declares the GitAttributes class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+from pythoneda.shared import BaseObject
+import re
+from .repository_folder_helper import RepositoryFolderHelper
+import threading
+from typing import Dict, List, Tuple
+
+
+class GitAttributes(BaseObject):
+    """
+    Reads git attributes in-process, following the rules of gitattributes(5).
+
+    Class name: GitAttributes
+
+    Responsibilities:
+        - Parse .gitattributes files and .git/info/attributes, including macros.
+        - Match paths with git's pattern semantics.
+        - Cache parsed files by mtime, so warm lookups run no subprocesses.
+
+    Collaborators:
+        - pythoneda.shared.artifact.ArtifactEventListener
+    """
+
+    _files = {}
+    _files_lock = threading.Lock()
+    _builtin_macros = {"binary": {"diff": "unset", "merge": "unset", "text": "unset"}}
+    _escapes = {"n": "\n", "t": "\t", '"': '"', "\\": "\\"}
+
+    def __init__(self, folder: str):
+        """
+        Creates a new GitAttributes instance.
+        :param folder: The repository folder.
+        :type folder: str
+        """
+        super().__init__()
+        self._folder = os.path.abspath(folder)
+        git_dir = RepositoryFolderHelper.git_dir(self._folder) or os.path.join(
+            self._folder, ".git"
+        )
+        self._info_attributes = os.path.join(git_dir, "info", "attributes")
+
+    @classmethod
+    def _unquote(cls, line: str) -> Tuple[str, str]:
+        """
+        Splits a C-style quoted pattern off the beginning of given line.
+        :param line: The line, starting with a double quote.
+        :type line: str
+        :return: The pattern, and the rest of the line.
+        :rtype: Tuple[str, str]
+        """
+        result = []
+        position = 1
+        while position < len(line) and line[position] != '"':
+            char = line[position]
+            if char == "\\" and position + 1 < len(line):
+                position += 1
+                char = cls._escapes.get(line[position], line[position])
+            result.append(char)
+            position += 1
+        return "".join(result), line[position + 1 :]
+
+    @classmethod
+    def _parse_attributes(cls, tokens: List[str]) -> List[Tuple[str, str]]:
+        """
+        Parses the attribute assignments of a line.
+        :param tokens: The attribute tokens.
+        :type tokens: List[str]
+        :return: Each attribute, with "set", "unset", its value, or None if unspecified.
+        :rtype: List[Tuple[str, str]]
+        """
+        result = []
+        for token in tokens:
+            if token.startswith("-"):
+                result.append((token[1:], "unset"))
+            elif token.startswith("!"):
+                result.append((token[1:], None))
+            elif "=" in token:
+                name, value = token.split("=", 1)
+                result.append((name, value))
+            else:
+                result.append((token, "set"))
+        return result
+
+    @classmethod
+    def _compile(cls, pattern: str) -> Tuple[re.Pattern, bool]:
+        """
+        Translates a gitattributes pattern into a regular expression.
+        :param pattern: The pattern.
+        :type pattern: str
+        :return: The expression, and whether it applies to the basename only.
+        :rtype: Tuple[re.Pattern, bool]
+        """
+        basename_only = "/" not in pattern
+        pattern = pattern.lstrip("/") if not basename_only else pattern
+        result = []
+        position = 0
+        while position < len(pattern):
+            char = pattern[position]
+            if pattern.startswith("**/", position) and (
+                position == 0 or pattern[position - 1] == "/"
+            ):
+                result.append("(?:.*/)?")
+                position += 3
+                continue
+            if pattern.startswith("**", position) and position + 2 == len(pattern) and (
+                position > 0 and pattern[position - 1] == "/"
+            ):
+                result.append(".*")
+                position += 2
+                continue
+            if char == "*":
+                result.append("[^/]*")
+            elif char == "?":
+                result.append("[^/]")
+            elif char == "[":
+                end = pattern.find("]", position + 2)
+                if end < 0:
+                    result.append(re.escape(char))
+                else:
+                    body = pattern[position + 1 : end]
+                    if body.startswith("!"):
+                        body = "^" + body[1:]
+                    result.append(f"[{body.replace(chr(92), chr(92) * 2)}]")
+                    position = end
+            elif char == "\\" and position + 1 < len(pattern):
+                position += 1
+                result.append(re.escape(pattern[position]))
+            else:
+                result.append(re.escape(char))
+            position += 1
+        return re.compile("".join(result) + r"\Z", re.DOTALL), basename_only
+
+    @classmethod
+    def parse(
+        cls, content: str, macrosAllowed: bool = True
+    ) -> Tuple[Dict[str, List[Tuple[str, str]]], List[Tuple[re.Pattern, bool, List]]]:
+        """
+        Parses the content of an attributes file.
+        :param content: The content.
+        :type content: str
+        :param macrosAllowed: Whether [attr] macro definitions are honored (top-level files only).
+        :type macrosAllowed: bool
+        :return: The macros, and the rules in file order.
+        :rtype: Tuple[Dict, List]
+        """
+        macros = {}
+        rules = []
+        for line in content.splitlines():
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            if line.startswith('"'):
+                pattern, rest = cls._unquote(line)
+            else:
+                parts = line.split(None, 1)
+                pattern, rest = parts[0], parts[1] if len(parts) > 1 else ""
+            attributes = cls._parse_attributes(rest.split())
+            if pattern.startswith("[attr]"):
+                if macrosAllowed:
+                    macros[pattern[len("[attr]") :]] = attributes
+                continue
+            if pattern.startswith("!") or pattern.endswith("/"):
+                # negative patterns are forbidden, and directories never match.
+                continue
+            regex, basename_only = cls._compile(pattern)
+            rules.append((regex, basename_only, attributes))
+        return macros, rules
+
+    @classmethod
+    def _load(cls, path: str, macrosAllowed: bool):
+        """
+        Retrieves the parsed content of given attributes file, reparsing it only if it changed.
+        :param path: The file.
+        :type path: str
+        :param macrosAllowed: Whether macro definitions are honored.
+        :type macrosAllowed: bool
+        :return: The macros and the rules, or None if the file does not exist.
+        :rtype: Tuple[Dict, List]
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with cls._files_lock:
+            cached = cls._files.get(path, None)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        with open(path, "r", encoding="utf-8") as file:
+            result = cls.parse(file.read(), macrosAllowed)
+        with cls._files_lock:
+            cls._files[path] = (signature, result)
+        return result
+
+    def _sources(self, path: str) -> List[Tuple[str, str, bool]]:
+        """
+        Retrieves the attribute files that apply to given path, from lowest to highest precedence.
+        :param path: The path, relative to the repository.
+        :type path: str
+        :return: Each file, the folder its patterns are relative to, and whether it can define macros.
+        :rtype: List[Tuple[str, str, bool]]
+        """
+        result = [(os.path.join(self._folder, ".gitattributes"), "", True)]
+        relative = ""
+        for part in path.split("/")[:-1]:
+            relative = f"{relative}{part}/"
+            result.append(
+                (os.path.join(self._folder, relative, ".gitattributes"), relative, False)
+            )
+        result.append((self._info_attributes, "", True))
+        return result
+
+    def attributes(self, path: str) -> Dict[str, str]:
+        """
+        Retrieves all attributes of given path.
+        :param path: The path, relative to the repository.
+        :type path: str
+        :return: Each specified attribute, with "set", "unset" or its value.
+        :rtype: Dict[str, str]
+        """
+        path = path.strip("/")
+        basename = path.rsplit("/", 1)[-1]
+        macros = dict(self.__class__._builtin_macros)
+        assignments = []
+        for file, relative, macrosAllowed in self._sources(path):
+            parsed = self.__class__._load(file, macrosAllowed)
+            if parsed is None:
+                continue
+            file_macros, rules = parsed
+            for name, attributes in file_macros.items():
+                macros[name] = dict(attributes)
+            if not path.startswith(relative):
+                continue
+            local = path[len(relative) :]
+            for regex, basename_only, attributes in rules:
+                if regex.match(basename if basename_only else local):
+                    assignments.extend(attributes)
+        result = {}
+        for name, state in assignments:
+            result[name] = state
+            if state == "set" and name in macros:
+                result.update(macros[name])
+        return {name: state for name, state in result.items() if state is not None}
+
+    def check_attr(self, attr: str, path: str) -> str:
+        """
+        Retrieves an attribute of given path, like git check-attr.
+        :param attr: The attribute.
+        :type attr: str
+        :param path: The path, relative to the repository.
+        :type path: str
+        :return: "set", "unset", its value, or None if unspecified.
+        :rtype: str
+        """
+        return self.attributes(path).get(attr, None)
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,243 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/listener_logging.py
+
+This file declares the ListenerLogging class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import logging
+import logging.handlers
+import os
+from pythoneda.shared import BaseObject
+import queue
+import threading
+from typing import List
+
+
+class _Lazy:
+    """
+    Defers building the text of a log argument until a handler formats it.
+
+    Class name: _Lazy
+
+    Responsibilities:
+        - Render its value, truncated, only when converted to str.
+
+    Collaborators:
+        - pythoneda.shared.artifact.ListenerLogging
+    """
+
+    __slots__ = ("_render", "_limit")
+
+    def __init__(self, render, limit: int):
+        """
+        Creates a new _Lazy instance.
+        :param render: Builds the full text.
+        :type render: Callable[[], str]
+        :param limit: The maximum length of the text.
+        :type limit: int
+        """
+        self._render = render
+        self._limit = limit
+
+    def __str__(self) -> str:
+        """
+        Builds the text.
+        :return: The text, truncated.
+        :rtype: str
+        """
+        return ListenerLogging.truncate(self._render(), self._limit)
+
+    __repr__ = __str__
+
+
+class ListenerLogging(BaseObject):
+    """
+    Cheap logging for the artifact listeners.
+
+    Class name: ListenerLogging
+
+    Responsibilities:
+        - Provide lazy, truncated representations of events and other values, built only
+          if a record is actually emitted.
+        - Move the logging handlers behind a queue, so emitting a record never
+          blocks the event loop on I/O.
+
+    Collaborators:
+        - pythoneda.shared.artifact.ArtifactEventListener
+    """
+
+    _summary_attributes = (
+        "tag",
+        "commit",
+        "repository_url",
+        "branch",
+        "repository_folder",
+    )
+    # the queue handler, the listener draining it, the logger it was installed on, and
+    # the handlers it replaced there.
+    _handler = None
+    _listener = None
+    _listener_logger = None
+    _listener_handlers = ()
+    _listener_lock = threading.Lock()
+
+    @classmethod
+    def limit(cls) -> int:
+        """
+        Retrieves the maximum length of logged values, from PYTHONEDA_LOG_REPR_LIMIT.
+        :return: Such length.
+        :rtype: int
+        """
+        return int(os.environ.get("PYTHONEDA_LOG_REPR_LIMIT", "200"))
+
+    @classmethod
+    def truncate(cls, text: str, limit: int) -> str:
+        """
+        Truncates given text.
+        :param text: The text.
+        :type text: str
+        :param limit: The maximum length.
+        :type limit: int
+        :return: The text, with an ellipsis and its original length if it was longer.
+        :rtype: str
+        """
+        if len(text) <= limit:
+            return text
+        return f"{text[:limit]}... ({len(text)} chars)"
+
+    @classmethod
+    def lazy(cls, value, limit: int = None) -> _Lazy:
+        """
+        Wraps given value so its str() is built, truncated, only when logged.
+        :param value: The value.
+        :type value: Any
+        :param limit: The maximum length. Defaults to PYTHONEDA_LOG_REPR_LIMIT.
+        :type limit: int
+        :return: The lazy wrapper.
+        :rtype: pythoneda.shared.artifact.listener_logging._Lazy
+        """
+        return _Lazy(lambda: str(value), limit or cls.limit())
+
+    @classmethod
+    def summary(cls, event) -> str:
+        """
+        Describes an event by its class, id and short attributes, without its (potentially huge) repr.
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        :return: The description.
+        :rtype: str
+        """
+        if event is None:
+            return "None"
+        parts = [f"{event.__class__.__name__}[{getattr(event, 'id', '?')}]"]
+        source = event
+        change = getattr(event, "change", None)
+        if change is not None:
+            source = change
+        for attribute in cls._summary_attributes:
+            value = getattr(source, attribute, None)
+            if value is None and source is not event:
+                value = getattr(event, attribute, None)
+            if isinstance(value, str):
+                parts.append(f"{attribute}={value}")
+        return " ".join(parts)
+
+    @classmethod
+    def brief(cls, event, limit: int = None) -> _Lazy:
+        """
+        Wraps given event so its summary is built only when logged.
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        :param limit: The maximum length. Defaults to PYTHONEDA_LOG_REPR_LIMIT.
+        :type limit: int
+        :return: The lazy wrapper.
+        :rtype: pythoneda.shared.artifact.listener_logging._Lazy
+        """
+        return _Lazy(lambda: cls.summary(event), limit or cls.limit())
+
+    @classmethod
+    def install_queue_handler(
+        cls, loggerName: str = None, handlers: List[logging.Handler] = None
+    ) -> logging.handlers.QueueListener:
+        """
+        Routes the records of given logger through a queue, drained by a background thread.
+        :param loggerName: The logger. Defaults to the root logger, since the loggers of
+        BaseObject.logger() are named after their classes and only meet there.
+        :type loggerName: str
+        :param handlers: The handlers doing the actual I/O. Defaults to the logger's own,
+        or the root logger's if it has none.
+        :type handlers: List[logging.Handler]
+        :return: The queue listener.
+        :rtype: logging.handlers.QueueListener
+        """
+        with cls._listener_lock:
+            if cls._listener is not None:
+                return cls._listener
+            logger = logging.getLogger(loggerName)
+            if handlers is None:
+                handlers = list(logger.handlers) or list(logging.getLogger().handlers)
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+            records = queue.SimpleQueue()
+            cls._handler = logging.handlers.QueueHandler(records)
+            logger.addHandler(cls._handler)
+            if logger is not logging.getLogger():
+                # the queue now owns the output; the root would emit them a second time.
+                logger.propagate = False
+            cls._listener = logging.handlers.QueueListener(
+                records, *handlers, respect_handler_level=True
+            )
+            cls._listener.start()
+            cls._listener_logger = logger
+            cls._listener_handlers = handlers
+        return cls._listener
+
+    @classmethod
+    def uninstall_queue_handler(cls):
+        """
+        Flushes the queue and restores the original handlers.
+        """
+        with cls._listener_lock:
+            if cls._listener is None:
+                return
+            cls._listener.stop()
+            logger = cls._listener_logger
+            logger.removeHandler(cls._handler)
+            if logger is not logging.getLogger():
+                logger.propagate = True
+                root_handlers = logging.getLogger().handlers
+                for handler in cls._listener_handlers:
+                    if handler not in root_handlers:
+                        logger.addHandler(handler)
+            else:
+                for handler in cls._listener_handlers:
+                    logger.addHandler(handler)
+            cls._handler = None
+            cls._listener = None
+            cls._listener_logger = None
+            cls._listener_handlers = ()
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
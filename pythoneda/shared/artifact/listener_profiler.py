@@ -0,0 +1,385 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/listener_profiler.py
+
+This file declares the ListenerProfiler class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import atexit
+from collections import Counter
+import cProfile
+import itertools
+import os
+import pstats
+from pythoneda.shared import BaseObject, Event
+import sys
+import threading
+from typing import Awaitable, Dict, Tuple
+
+
+class _ProfiledListen:
+    """
+    Drives a listen coroutine step by step, profiling only while it actually runs.
+
+    Class name: _ProfiledListen
+
+    Responsibilities:
+        - Enable the profiler of its listener around each step of the coroutine, so
+          concurrent listens never get attributed to each other.
+
+    Collaborators:
+        - pythoneda.shared.artifact.ListenerProfiler
+    """
+
+    def __init__(self, profiler, key: Tuple[str, str], code, coroutine):
+        """
+        Creates a new _ProfiledListen instance.
+        :param profiler: The profiler.
+        :type profiler: pythoneda.shared.artifact.ListenerProfiler
+        :param key: The listener class and repository.
+        :type key: Tuple[str, str]
+        :param code: The code object of the listen method.
+        :type code: code
+        :param coroutine: The listen coroutine.
+        :type coroutine: Coroutine
+        """
+        self._profiler = profiler
+        self._key = key
+        self._code = code
+        self._coroutine = coroutine
+
+    def __await__(self):
+        """
+        Runs the coroutine.
+        :return: Whatever the coroutine returns.
+        :rtype: Any
+        """
+        value = None
+        error = None
+        while True:
+            self._profiler._enter(self._key, self._code)
+            try:
+                if error is None:
+                    awaited = self._coroutine.send(value)
+                else:
+                    awaited = self._coroutine.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self._profiler._exit(self._key)
+            try:
+                value = yield awaited
+                error = None
+            except BaseException as err:
+                value = None
+                error = err
+
+
+class ListenerProfiler(BaseObject):
+    """
+    Opt-in profiling of the artifact listeners, for flamegraphs of production waves.
+
+    Class name: ListenerProfiler
+
+    Responsibilities:
+        - Wrap each listen, when enabled via PYTHONEDA_PROFILE (or configure()).
+        - Support a sampling mode (stacks of the event loop thread, every
+          PYTHONEDA_PROFILE_INTERVAL seconds) and a cProfile mode.
+        - Aggregate per listener class and repository, and write collapsed-stack files
+          under PYTHONEDA_PROFILE_DIR, named after both plus the process and profiler
+          run, so no run overwrites another's.
+
+    Collaborators:
+        - pythoneda.shared.artifact.AbstractArtifact
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+    _modes = ("sampling", "cprofile")
+    _runs = itertools.count(1)
+
+    def __init__(self, mode: str = None, folder: str = None, interval: float = None):
+        """
+        Creates a new ListenerProfiler instance.
+        :param mode: "sampling", "cprofile", or None to disable it.
+        :type mode: str
+        :param folder: Where to write the collapsed stacks.
+        :type folder: str
+        :param interval: The sampling interval, in seconds.
+        :type interval: float
+        """
+        super().__init__()
+        if mode not in ListenerProfiler._modes:
+            if mode:
+                ListenerProfiler.logger().warning("Unknown profiling mode %s", mode)
+            mode = None
+        self._mode = mode
+        self._folder = folder or os.path.join(os.getcwd(), "pythoneda-profiles")
+        self._interval = interval or 0.005
+        self._run = f"{os.getpid()}-{next(ListenerProfiler._runs)}"
+        self._lock = threading.Lock()
+        self._active: Dict[int, Tuple[Tuple[str, str], object]] = {}
+        self._samples: Dict[Tuple[str, str], Counter] = {}
+        self._profiles: Dict[Tuple[str, str], cProfile.Profile] = {}
+        self._sampler = None
+        self._stopped = threading.Event()
+
+    @classmethod
+    def instance(cls):
+        """
+        Retrieves the process-wide profiler, configured from the environment.
+        :return: The profiler.
+        :rtype: pythoneda.shared.artifact.ListenerProfiler
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                interval = os.environ.get("PYTHONEDA_PROFILE_INTERVAL", None)
+                cls._instance = cls(
+                    os.environ.get("PYTHONEDA_PROFILE", None),
+                    os.environ.get("PYTHONEDA_PROFILE_DIR", None),
+                    None if interval is None else float(interval),
+                )
+                if cls._instance.enabled:
+                    atexit.register(cls._instance.flush)
+        return cls._instance
+
+    @classmethod
+    def configure(cls, mode: str, folder: str = None, interval: float = None):
+        """
+        Replaces the process-wide profiler, flushing the previous one.
+        :param mode: "sampling", "cprofile", or None to disable profiling.
+        :type mode: str
+        :param folder: Where to write the collapsed stacks.
+        :type folder: str
+        :param interval: The sampling interval, in seconds.
+        :type interval: float
+        :return: The new profiler.
+        :rtype: pythoneda.shared.artifact.ListenerProfiler
+        """
+        with cls._instance_lock:
+            previous = cls._instance
+            cls._instance = cls(mode, folder, interval)
+            if cls._instance.enabled:
+                atexit.register(cls._instance.flush)
+        if previous is not None and previous.enabled:
+            previous.flush()
+            previous.stop()
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Checks whether profiling is on.
+        :return: True in such case.
+        :rtype: bool
+        """
+        return self._mode is not None
+
+    def listen(self, listener, event: Event) -> Awaitable:
+        """
+        Calls listener.listen(event), profiling it if enabled.
+        :param listener: The listener.
+        :type listener: pythoneda.shared.artifact.ArtifactEventListener
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        :return: The awaitable result of listen.
+        :rtype: Awaitable
+        """
+        coroutine = listener.listen(event)
+        if not self.enabled:
+            return coroutine
+        cls = type(listener)
+        key = (f"{cls.__module__}.{cls.__qualname__}", listener.repository_folder)
+        code = getattr(cls.listen, "__code__", None)
+        if self._mode == "sampling":
+            self._start_sampler()
+        return _ProfiledListen(self, key, code, coroutine)
+
+    def _enter(self, key: Tuple[str, str], code):
+        """
+        Marks given listener as running in the current thread.
+        :param key: The listener class and repository.
+        :type key: Tuple[str, str]
+        :param code: The code object of its listen method.
+        :type code: code
+        """
+        if self._mode == "cprofile":
+            with self._lock:
+                profile = self._profiles.setdefault(key, cProfile.Profile())
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiler (e.g. an enclosing listen) is already active.
+                return
+        self._active[threading.get_ident()] = (key, code)
+
+    def _exit(self, key: Tuple[str, str]):
+        """
+        Marks given listener as no longer running in the current thread.
+        :param key: The listener class and repository.
+        :type key: Tuple[str, str]
+        """
+        active = self._active.pop(threading.get_ident(), None)
+        if self._mode == "cprofile" and active is not None:
+            self._profiles[key].disable()
+
+    def _start_sampler(self):
+        """
+        Starts the sampling thread, if not running already.
+        """
+        with self._lock:
+            if self._sampler is None:
+                self._sampler = threading.Thread(
+                    target=self._sample, name="pythoneda-profiler", daemon=True
+                )
+                self._sampler.start()
+
+    def _sample(self):
+        """
+        Samples the stacks of the threads running a listener, until stopped.
+        """
+        while not self._stopped.wait(self._interval):
+            frames = sys._current_frames()
+            for thread, (key, code) in list(self._active.items()):
+                frame = frames.get(thread, None)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    if frame.f_code is code:
+                        break
+                    frame = frame.f_back
+                with self._lock:
+                    self._samples.setdefault(key, Counter())[
+                        ";".join(reversed(stack))
+                    ] += 1
+
+    @classmethod
+    def _label(cls, code) -> str:
+        """
+        Builds the flamegraph label of given code object.
+        :param code: The code object.
+        :type code: code
+        :return: The label.
+        :rtype: str
+        """
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    @classmethod
+    def collapse(cls, profile: cProfile.Profile) -> Counter:
+        """
+        Converts cProfile statistics into collapsed stacks, in microseconds,
+        splitting the time of each function among its callers.
+        :param profile: The profile.
+        :type profile: cProfile.Profile
+        :return: The weight of each stack.
+        :rtype: collections.Counter
+        """
+        stats = pstats.Stats(profile).stats
+        callees = {}
+        for function, (_, _, _, _, callers) in stats.items():
+            for caller in callers:
+                callees.setdefault(caller, []).append(function)
+        result = Counter()
+
+        def label(function) -> str:
+            filename, line, name = function
+            return f"{name} ({os.path.basename(filename)}:{line})"
+
+        pending = [
+            ((function,), 1.0)
+            for function, (_, _, _, _, callers) in stats.items()
+            if not callers
+        ]
+        while pending:
+            path, share = pending.pop()
+            function = path[-1]
+            _, _, own, total, _ = stats[function]
+            weight = int(own * share * 1e6)
+            if weight > 0:
+                result[";".join(label(item) for item in path)] += weight
+            if len(path) >= 128:
+                continue
+            for callee in callees.get(function, []):
+                if callee in path or stats[callee][3] <= 0:
+                    continue
+                edge = stats[callee][4][function][3]
+                pending.append((path + (callee,), share * edge / stats[callee][3]))
+        return result
+
+    def stacks(self) -> Dict[Tuple[str, str], Counter]:
+        """
+        Retrieves the collapsed stacks gathered so far.
+        :return: The weight of each stack (samples, or microseconds), per listener class and repository.
+        :rtype: Dict[Tuple[str, str], collections.Counter]
+        """
+        with self._lock:
+            if self._mode == "cprofile":
+                return {
+                    key: self.__class__.collapse(profile)
+                    for key, profile in self._profiles.items()
+                    if profile.getstats()
+                }
+            return {key: Counter(samples) for key, samples in self._samples.items()}
+
+    def file_name(self, listener: str, repository: str) -> str:
+        """
+        Builds the name of the collapsed-stack file of given listener and repository.
+        :param listener: The module path of the listener class.
+        :type listener: str
+        :param repository: The repository folder.
+        :type repository: str
+        :return: The file name.
+        :rtype: str
+        """
+        folder = os.path.abspath(repository).strip(os.sep).replace(os.sep, "_")
+        return f"{listener}.{folder or 'root'}.{self._run}.{self._mode}.collapsed"
+
+    def flush(self):
+        """
+        Writes a collapsed-stack file per listener class and repository.
+        """
+        stacks = self.stacks()
+        if not stacks:
+            return
+        os.makedirs(self._folder, exist_ok=True)
+        for (listener, repository), counts in stacks.items():
+            path = os.path.join(self._folder, self.file_name(listener, repository))
+            with open(path, "w", encoding="utf-8") as file:
+                for stack, count in counts.most_common():
+                    file.write(f"{stack} {count}\n")
+            ListenerProfiler.logger().info("Wrote %s", path)
+
+    def stop(self):
+        """
+        Stops sampling.
+        """
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,105 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/registry_benchmark.py
+
+This file declares the RegistryBenchmark class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from .compact_artifact_registry import CompactArtifactRegistry
+from pythoneda.shared import BaseObject
+import sys
+from typing import Dict, List
+
+
+class RegistryBenchmark(BaseObject):
+    """
+    Estimates the memory CompactArtifactRegistry saves. Run it with
+    `python -m pythoneda.shared.artifact.registry_benchmark [count]`.
+    It compares plain stand-ins with the attributes `add` reads, measured with
+    deep_size_of, against the registry: it says nothing about a live process.
+
+    Class name: RegistryBenchmark
+
+    Responsibilities:
+        - Build stand-ins for a workspace of artifacts.
+        - Report the bytes per artifact as objects and in the registry.
+
+    Collaborators:
+        - pythoneda.shared.artifact.CompactArtifactRegistry
+    """
+
+    @classmethod
+    def synthetic_artifacts(cls, count: int) -> List:
+        """
+        Builds stand-ins for artifacts, with the attributes `add` reads and realistic values,
+        so the benchmark can run without a workspace.
+        :param count: How many.
+        :type count: int
+        :return: The stand-ins, each one of its own class as artifacts are.
+        :rtype: List
+        """
+        result = []
+        for index in range(count):
+            url = f"https://github.com/pythoneda-org{index % 50}/project-{index}"
+            inputs = []
+            for offset in range(1, 1 + index % 6):
+                other = (index + offset) % count
+                input = type("Input", (), {})()
+                input.url = f"https://github.com/pythoneda-org{other % 50}/project-{other}"
+                inputs.append(input)
+            artifact = type(f"Artifact{index}", (), {"url": url})()
+            artifact.name = f"project-{index}"
+            artifact.version = f"0.0.{index % 300}"
+            artifact.description = f"Project {index} of the PythonEDA workspace"
+            artifact.homepage = url
+            artifact.license_id = "gpl3"
+            artifact.maintainers = ["rydnr"]
+            artifact.copyright_year = 2023 + index % 3
+            artifact.copyright_holder = "rydnr"
+            artifact.inputs = inputs
+            result.append(artifact)
+        return result
+
+    @classmethod
+    def run(cls, count: int) -> Dict[str, float]:
+        """
+        Benchmarks the registry with given number of stand-ins.
+        :param count: How many.
+        :type count: int
+        :return: The bytes per artifact, "before" and "after".
+        :rtype: Dict[str, float]
+        """
+        return CompactArtifactRegistry.benchmark(cls.synthetic_artifacts(count))
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    result = RegistryBenchmark.run(count)
+    print(
+        f"{count} artifacts: {result['before']:.0f} bytes each as objects, "
+        f"{result['after']:.0f} bytes each in the registry"
+    )
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,372 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/registry_snapshot.py
+
+This file declares the RegistrySnapshot class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from array import array
+from .artifact_record import ArtifactRecord
+from .compact_artifact_registry import CompactArtifactRegistry
+from enum import Enum
+import mmap
+import os
+from pythoneda.shared import BaseObject
+from .repository_folder_helper import RepositoryFolderHelper
+import struct
+from typing import Dict, List, Tuple, Type
+
+
+class RegistrySnapshot(BaseObject):
+    """
+    Memory-mapped, read-only snapshot of a CompactArtifactRegistry.
+
+    Class name: RegistrySnapshot
+
+    Responsibilities:
+        - Serialize a whole artifact registry, plus the HEAD of each repository, into a single file.
+        - Load it by mapping the file in memory, decoding values only when accessed.
+        - Tell which repositories moved since the snapshot was taken.
+
+    Collaborators:
+        - pythoneda.shared.artifact.CompactArtifactRegistry
+        - pythoneda.shared.artifact.ArtifactRecord
+        - pythoneda.shared.artifact.RepositoryFolderHelper
+    """
+
+    _magic = b"PEDAREG\0"
+    _format_version = 2
+    # magic, format version, artifact count, number of sections
+    _header = struct.Struct("<8sIII")
+    # name, typecode, offset, length in bytes
+    _section = struct.Struct("<32s1sxxxQQ")
+
+    def __init__(self, path: str):
+        """
+        Opens the snapshot at given path.
+        :param path: The snapshot file.
+        :type path: str
+        """
+        super().__init__()
+        self._path = path
+        self._file = open(path, "rb")
+        self._map = None
+        self._view = None
+        self._sections = {}
+        self._string_offsets = None
+        self._string_blob = None
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)
+            self._load_sections()
+        except BaseException:
+            self.close()
+            raise
+        self._decoded = {}
+        self._ordinals_by_url = None
+
+    def _load_sections(self):
+        """
+        Reads the header and the section directory.
+        """
+        magic, version, count, sections = self.__class__._header.unpack_from(
+            self._map, 0
+        )
+        if magic != self.__class__._magic or version != self.__class__._format_version:
+            raise ValueError(f"{self._path} is not a registry snapshot")
+        self._count = count
+        position = self.__class__._header.size
+        for _ in range(sections):
+            name, typecode, offset, length = self.__class__._section.unpack_from(
+                self._map, position
+            )
+            position += self.__class__._section.size
+            if offset + length > len(self._map):
+                raise ValueError(f"{self._path} is truncated")
+            self._sections[name.rstrip(b"\0").decode("ascii")] = self._view[
+                offset : offset + length
+            ].cast(typecode.decode("ascii"))
+        self._string_offsets = self._sections["strings.offsets"]
+        self._string_blob = self._sections["strings.blob"]
+        if (
+            len(self._string_offsets) == 0
+            or self._string_offsets[-1] != len(self._string_blob)
+        ):
+            raise ValueError(f"{self._path} has a corrupt string table")
+        for name, section in self._sections.items():
+            if not name.startswith(("strings.", "list.")) and len(section) != count:
+                raise ValueError(f"{self._path} has a corrupt {name} section")
+
+    @classmethod
+    def open(cls, path: str):
+        """
+        Opens the snapshot at given path.
+        :param path: The snapshot file.
+        :type path: str
+        :return: The snapshot, or None if the file is missing or invalid.
+        :rtype: pythoneda.shared.artifact.RegistrySnapshot
+        """
+        result = None
+        if os.path.exists(path):
+            try:
+                result = cls(path)
+            except (OSError, ValueError, TypeError, KeyError, struct.error) as err:
+                RegistrySnapshot.logger().error("Ignoring snapshot %s: %s", path, err)
+        return result
+
+    def close(self):
+        """
+        Releases the mapping.
+        """
+        # the casts hold exports of the view, which must go before it can be released.
+        for section in self._sections.values():
+            section.release()
+        self._sections = {}
+        self._string_offsets = None
+        self._string_blob = None
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    @classmethod
+    def write(
+        cls, path: str, registry: CompactArtifactRegistry, heads: Dict[str, str] = None
+    ):
+        """
+        Writes a snapshot of given registry.
+        :param path: The snapshot file.
+        :type path: str
+        :param registry: The registry.
+        :type registry: pythoneda.shared.artifact.CompactArtifactRegistry
+        :param heads: The HEAD commit of each repository folder. Resolved from disk if omitted.
+        :type heads: Dict[str, str]
+        """
+        strings = list(registry.string_table)
+        string_ids = {value: index for index, value in enumerate(strings) if index > 0}
+        head_ids = array("I")
+        for record in registry.records():
+            folder = record.folder
+            head = None
+            if folder is not None:
+                head = (heads or {}).get(folder, None)
+                if head is None:
+                    head = RepositoryFolderHelper.head_commit(folder)
+            if head is None:
+                head_ids.append(0)
+            else:
+                if head not in string_ids:
+                    string_ids[head] = len(strings)
+                    strings.append(head)
+                head_ids.append(string_ids[head])
+        blob = bytearray()
+        offsets = array("Q", [0])
+        for value in strings:
+            if value is not None:
+                blob.extend(value.encode("utf-8"))
+            offsets.append(len(blob))
+        sections = [
+            ("strings.offsets", "Q", offsets.tobytes()),
+            ("strings.blob", "B", bytes(blob)),
+            ("heads", "I", head_ids.tobytes()),
+        ]
+        for name, column in registry.columns().items():
+            sections.append((name, column.typecode, column.tobytes()))
+
+        position = cls._header.size + cls._section.size * len(sections)
+        directory = bytearray()
+        payload = bytearray()
+        for name, typecode, content in sections:
+            padding = (-(position + len(payload))) % 8
+            payload.extend(b"\0" * padding)
+            directory.extend(
+                cls._section.pack(
+                    name.encode("ascii"),
+                    typecode.encode("ascii"),
+                    position + len(payload),
+                    len(content),
+                )
+            )
+            payload.extend(content)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as file:
+            file.write(
+                cls._header.pack(
+                    cls._magic, cls._format_version, len(registry), len(sections)
+                )
+            )
+            file.write(directory)
+            file.write(payload)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, path)
+
+    def __len__(self) -> int:
+        """
+        Retrieves the number of artifacts.
+        :return: Such number.
+        :rtype: int
+        """
+        return self._count
+
+    def _string(self, identifier: int) -> str:
+        """
+        Decodes the string with given id.
+        :param identifier: The id.
+        :type identifier: int
+        :return: The string, or None for id 0.
+        :rtype: str
+        """
+        if identifier == 0:
+            return None
+        result = self._decoded.get(identifier, None)
+        if result is None:
+            start = self._string_offsets[identifier]
+            end = self._string_offsets[identifier + 1]
+            result = bytes(self._string_blob[start:end]).decode("utf-8")
+            self._decoded[identifier] = result
+        return result
+
+    def string(self, ordinal: int, column: str) -> str:
+        """
+        Retrieves a string attribute.
+        :param ordinal: The position of the artifact.
+        :type ordinal: int
+        :param column: The attribute.
+        :type column: str
+        :return: Its value.
+        :rtype: str
+        """
+        return self._string(self._sections[f"column.{column}"][ordinal])
+
+    def strings(self, ordinal: int, column: str) -> Tuple[str, ...]:
+        """
+        Retrieves a list attribute.
+        :param ordinal: The position of the artifact.
+        :type ordinal: int
+        :param column: The attribute.
+        :type column: str
+        :return: Its values.
+        :rtype: Tuple[str, ...]
+        """
+        start = self._sections[f"starts.{column}"][ordinal]
+        end = start + self._sections[f"lengths.{column}"][ordinal]
+        items = self._sections[f"list.{column}"]
+        return tuple(self._string(item) for item in items[start:end])
+
+    def enum(self, ordinal: int, enum: Type[Enum]) -> Enum:
+        """
+        Retrieves an enum attribute.
+        :param ordinal: The position of the artifact.
+        :type ordinal: int
+        :param enum: The enum type.
+        :type enum: Type[enum.Enum]
+        :return: Its value, or None.
+        :rtype: enum.Enum
+        """
+        index = self._sections[f"enum.{enum.__name__}"][ordinal]
+        return None if index < 0 else list(enum)[index]
+
+    def copyright_year(self, ordinal: int) -> int:
+        """
+        Retrieves the copyright year of an artifact.
+        :param ordinal: The position of the artifact.
+        :type ordinal: int
+        :return: Such year.
+        :rtype: int
+        """
+        return self._sections["copyright_years"][ordinal]
+
+    def head(self, ordinal: int) -> str:
+        """
+        Retrieves the HEAD commit the repository of an artifact had when the snapshot was taken.
+        :param ordinal: The position of the artifact.
+        :type ordinal: int
+        :return: The commit hash, or None if unknown.
+        :rtype: str
+        """
+        return self._string(self._sections["heads"][ordinal])
+
+    def record(self, ordinal: int) -> ArtifactRecord:
+        """
+        Retrieves a lazy view of the artifact at given position.
+        :param ordinal: The position.
+        :type ordinal: int
+        :return: The view.
+        :rtype: pythoneda.shared.artifact.ArtifactRecord
+        """
+        return ArtifactRecord(self, ordinal)
+
+    def records(self) -> List[ArtifactRecord]:
+        """
+        Retrieves lazy views of all artifacts.
+        :return: The views.
+        :rtype: List[pythoneda.shared.artifact.ArtifactRecord]
+        """
+        return [ArtifactRecord(self, ordinal) for ordinal in range(self._count)]
+
+    def find_by_url(self, url: str) -> ArtifactRecord:
+        """
+        Retrieves the artifact with given url.
+        :param url: The url.
+        :type url: str
+        :return: Its view, or None if not found.
+        :rtype: pythoneda.shared.artifact.ArtifactRecord
+        """
+        if self._ordinals_by_url is None:
+            urls = self._sections["column.url"]
+            self._ordinals_by_url = {
+                self._string(urls[ordinal]): ordinal for ordinal in range(self._count)
+            }
+        ordinal = self._ordinals_by_url.get(url, None)
+        return None if ordinal is None else ArtifactRecord(self, ordinal)
+
+    def is_fresh(self, ordinal: int) -> bool:
+        """
+        Checks whether the repository of an artifact is still at the HEAD recorded in the snapshot.
+        :param ordinal: The position of the artifact.
+        :type ordinal: int
+        :return: True in such case.
+        :rtype: bool
+        """
+        folder = self.string(ordinal, "folder")
+        if folder is None:
+            return True
+        head = self.head(ordinal)
+        return head is not None and head == RepositoryFolderHelper.head_commit(folder)
+
+    def stale(self) -> List[int]:
+        """
+        Retrieves the artifacts whose repository moved since the snapshot was taken,
+        and need to be rebuilt from their flake and tags.
+        :return: Their positions.
+        :rtype: List[int]
+        """
+        return [ordinal for ordinal in range(self._count) if not self.is_fresh(ordinal)]
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
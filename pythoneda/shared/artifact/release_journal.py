@@ -0,0 +1,283 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/release_journal.py
+
+This file declares the ReleaseJournal class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import json
+import os
+from pythoneda.shared import BaseObject
+from .repository_folder_helper import RepositoryFolderHelper
+import threading
+import time
+from typing import Dict, Iterable, List
+
+
+class ReleaseJournal(BaseObject):
+    """
+    Write-ahead journal of the release steps performed in a repository.
+    It replays nothing by itself: a release resumes when the event that drives it is
+    delivered again after a restart (by the event bus, or by RepositoryWatcher finding
+    the changes still staged), and each step skips what completed() says already finished.
+
+    Class name: ReleaseJournal
+
+    Responsibilities:
+        - Record when a pipeline step starts, and its outputs once it finishes.
+        - Tell whether a step already finished for a given release, so it can be skipped after a restart.
+        - Forget the steps that failed, and the releases superseded by a later one.
+
+    Collaborators:
+        - pythoneda.shared.artifact.ArtifactEventListener
+        - pythoneda.shared.artifact.CommitPush
+        - pythoneda.shared.artifact.CommitTag
+    """
+
+    _journals = {}
+    _journals_lock = threading.Lock()
+
+    def __init__(self, folder: str):
+        """
+        Creates a new ReleaseJournal instance.
+        :param folder: The repository folder.
+        :type folder: str
+        """
+        super().__init__()
+        self._folder = folder
+        # worktrees and submodules keep their git directory elsewhere.
+        git_dir = RepositoryFolderHelper.git_dir(folder) or os.path.join(folder, ".git")
+        self._path = os.path.join(git_dir, "pythoneda", "release-journal.jsonl")
+        self._lock = threading.Lock()
+        self._records = None
+
+    @classmethod
+    def for_folder(cls, folder: str):
+        """
+        Retrieves the journal of given repository folder.
+        :param folder: The repository folder.
+        :type folder: str
+        :return: The journal.
+        :rtype: pythoneda.shared.artifact.ReleaseJournal
+        """
+        key = os.path.abspath(folder)
+        with cls._journals_lock:
+            result = cls._journals.get(key, None)
+            if result is None:
+                result = cls(key)
+                cls._journals[key] = result
+        return result
+
+    @property
+    def folder(self) -> str:
+        """
+        Retrieves the repository folder.
+        :return: Such folder.
+        :rtype: str
+        """
+        return self._folder
+
+    @property
+    def path(self) -> str:
+        """
+        Retrieves the path of the journal file.
+        :return: Such path.
+        :rtype: str
+        """
+        return self._path
+
+    def _load(self) -> List[Dict]:
+        """
+        Loads the journal records from disk, if not loaded already. Requires the lock.
+        :return: The records.
+        :rtype: List[Dict]
+        """
+        if self._records is None:
+            records = []
+            corrupt = False
+            if os.path.exists(self._path):
+                with open(self._path, "r", encoding="utf-8") as file:
+                    for line in file:
+                        try:
+                            records.append(json.loads(line))
+                        except json.JSONDecodeError:
+                            # a torn write from a crash: the step never completed.
+                            ReleaseJournal.logger().warning(
+                                "Ignoring corrupt entry in %s", self._path
+                            )
+                            corrupt = True
+            if corrupt:
+                # otherwise the next record would be appended to the torn line.
+                self._rewrite(records)
+            self._records = records
+        return self._records
+
+    def _append(self, record: Dict):
+        """
+        Appends given record, making sure it reaches the disk. Requires the lock.
+        :param record: The record.
+        :type record: Dict
+        """
+        # before writing: loading drops a torn last line, and must not see the record.
+        records = self._load()
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        with open(self._path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(record, sort_keys=True) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        records.append(record)
+
+    def begin(self, step: str, key: str, inputs: Dict = None):
+        """
+        Records a step is about to start.
+        :param step: The step name.
+        :type step: str
+        :param key: The release the step belongs to (a version or a commit).
+        :type key: str
+        :param inputs: The inputs of the step.
+        :type inputs: Dict
+        """
+        with self._lock:
+            self._append(
+                {
+                    "op": "begin",
+                    "step": step,
+                    "key": key,
+                    "inputs": inputs or {},
+                    "at": time.time(),
+                }
+            )
+
+    def complete(self, step: str, key: str, outputs: Dict = None):
+        """
+        Records a step has finished.
+        :param step: The step name.
+        :type step: str
+        :param key: The release the step belongs to (a version or a commit).
+        :type key: str
+        :param outputs: The outputs of the step.
+        :type outputs: Dict
+        """
+        with self._lock:
+            self._append(
+                {
+                    "op": "complete",
+                    "step": step,
+                    "key": key,
+                    "outputs": outputs or {},
+                    "at": time.time(),
+                }
+            )
+
+    def completed(self, step: str, key: str) -> Dict:
+        """
+        Retrieves the outputs of given step, if it already finished.
+        :param step: The step name.
+        :type step: str
+        :param key: The release the step belongs to (a version or a commit).
+        :type key: str
+        :return: The outputs of the step, or None if it did not finish.
+        :rtype: Dict
+        """
+        result = None
+        with self._lock:
+            for record in reversed(self._load()):
+                if record.get("step") == step and record.get("key") == key:
+                    if record.get("op") == "complete":
+                        result = record.get("outputs", {})
+                    break
+        return result
+
+    def abort(self, step: str, key: str):
+        """
+        Forgets a step that failed, so it's run again from scratch.
+        :param step: The step name.
+        :type step: str
+        :param key: The release the step belongs to (a version or a commit).
+        :type key: str
+        """
+        with self._lock:
+            self._rewrite(
+                [
+                    record
+                    for record in self._load()
+                    if record.get("step") != step or record.get("key") != key
+                ]
+            )
+
+    def supersede(self, key: str, steps: Iterable[str]):
+        """
+        Discards the records of given steps for any release other than given one, e.g.
+        the version a crashed tagger never finished before a different one got allocated.
+        :param key: The release that replaces them.
+        :type key: str
+        :param steps: The step names.
+        :type steps: Iterable[str]
+        """
+        steps = set(steps)
+        with self._lock:
+            records = self._load()
+            remaining = [
+                record
+                for record in records
+                if record.get("step") not in steps or record.get("key") == key
+            ]
+            if len(remaining) != len(records):
+                ReleaseJournal.logger().info(
+                    f"Discarding {len(records) - len(remaining)} records superseded by {key} in {self._path}"
+                )
+                self._rewrite(remaining)
+
+    def close(self, key: str):
+        """
+        Discards the records of a finished release.
+        :param key: The release (a version or a commit).
+        :type key: str
+        """
+        with self._lock:
+            self._rewrite(
+                [record for record in self._load() if record.get("key") != key]
+            )
+
+    def _rewrite(self, remaining: List[Dict]):
+        """
+        Replaces the journal with given records, atomically. Requires the lock.
+        :param remaining: The records to keep.
+        :type remaining: List[Dict]
+        """
+        if len(remaining) == 0:
+            if os.path.exists(self._path):
+                os.remove(self._path)
+        else:
+            tmp = f"{self._path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as file:
+                for record in remaining:
+                    file.write(json.dumps(record, sort_keys=True) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp, self._path)
+        self._records = remaining
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
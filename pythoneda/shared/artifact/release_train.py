@@ -0,0 +1,231 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/release_train.py
+
+This file declares the ReleaseTrain class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+from .commit import Commit
+from .commit_push import CommitPush
+from .commit_tag import CommitTag
+from .dependency_graph import DependencyGraph
+from pythoneda.shared import BaseObject, Event
+from pythoneda.shared.artifact.events import TagPushed
+from .stage_input_update import StageInputUpdate
+from .tag_push import TagPush
+from typing import Awaitable, Callable, Dict, Iterable, List, Set, Tuple
+
+
+class ReleaseTrain(BaseObject):
+    """
+    Releases every repository affected by a set of upstream tags, once.
+
+    Class name: ReleaseTrain
+
+    Responsibilities:
+        - Compute the repositories affected by some root tags, grouped in levels so every
+          repository comes after all the affected repositories it uses as input.
+        - Bump all the affected inputs of each repository in a single flake update, and
+          commit, push, tag and push the tag exactly once per repository.
+        - Skip, and report, the repositories using an affected input that failed to release,
+          rather than releasing them with partial bumps.
+
+    Collaborators:
+        - pythoneda.shared.artifact.DependencyGraph
+        - pythoneda.shared.artifact.StageInputUpdate
+        - pythoneda.shared.artifact.Commit
+        - pythoneda.shared.artifact.CommitPush
+        - pythoneda.shared.artifact.CommitTag
+        - pythoneda.shared.artifact.TagPush
+    """
+
+    def __init__(
+        self,
+        artifacts: Iterable,
+        graph: DependencyGraph = None,
+        onEmitted: Callable[[Event], Awaitable] = None,
+    ):
+        """
+        Creates a new ReleaseTrain instance.
+        :param artifacts: The artifacts of the workspace.
+        :type artifacts: Iterable[pythoneda.shared.artifact.AbstractArtifact]
+        :param graph: Their input graph. Built from the artifacts if omitted.
+        :type graph: pythoneda.shared.artifact.DependencyGraph
+        :param onEmitted: The coroutine to notify every emitted event to. Whoever listens
+        must not feed them to the reactive cascade, or every repository would be released twice.
+        :type onEmitted: Callable[[pythoneda.shared.Event], Awaitable]
+        """
+        super().__init__()
+        self._artifacts = {
+            DependencyGraph.key_for(artifact.__class__.url): artifact
+            for artifact in artifacts
+        }
+        self._graph = graph or DependencyGraph.from_artifacts(
+            self._artifacts.values()
+        )
+        self._on_emitted = onEmitted
+        self._failed = {}
+
+    @property
+    def failed(self) -> Dict[str, str]:
+        """
+        Retrieves the repositories the last run could not release.
+        :return: Why each one was not released, by key.
+        :rtype: Dict[str, str]
+        """
+        return dict(self._failed)
+
+    def levels(self, urls: Iterable[str]) -> List[List[str]]:
+        """
+        Retrieves the repositories affected by changes in given ones, level by level.
+        :param urls: The urls of the changed repositories.
+        :type urls: Iterable[str]
+        :return: The keys of the affected repositories, per level.
+        :rtype: List[List[str]]
+        """
+        remaining: Set[str] = set()
+        for url in urls:
+            remaining.update(key for key, _ in self._graph.dependents_of(url))
+        result = []
+        while remaining:
+            ready = {
+                key
+                for key in remaining
+                if not (self._graph.inputs_of(key) & remaining)
+            }
+            if not ready:
+                # dependents_of already leaves cycles out; be safe anyway.
+                ReleaseTrain.logger().warning(
+                    "Cannot order %s: input cycle", sorted(remaining)
+                )
+                break
+            result.append(sorted(ready))
+            remaining -= ready
+        return result
+
+    async def run(self, roots: Iterable[Tuple[str, str]]) -> Dict[str, TagPushed]:
+        """
+        Releases every repository affected by given tags.
+        :param roots: The (repository url, tag) pairs already released upstream.
+        :type roots: Iterable[Tuple[str, str]]
+        :return: The TagPushed event of each released repository, by key. The ones that
+        could not be released, and why, are available in `failed` afterwards.
+        :rtype: Dict[str, pythoneda.shared.artifact.events.TagPushed]
+        """
+        released = {DependencyGraph.key_for(url): (url, tag) for url, tag in roots}
+        result = {}
+        self._failed = {}
+        levels = self.levels([url for url, _ in released.values()])
+        affected = {key for level in levels for key in level}
+        ReleaseTrain.logger().info(
+            "Release train over %d repositories in %d levels",
+            len(affected),
+            len(levels),
+        )
+        for number, level in enumerate(levels):
+            ReleaseTrain.logger().debug("Level %d: %s", number, level)
+            ready = []
+            for key in level:
+                blocked = sorted(self._graph.inputs_of(key) & self._failed.keys())
+                if blocked:
+                    self._failed[key] = f"inputs not released: {', '.join(blocked)}"
+                    ReleaseTrain.logger().error(
+                        "Skipping %s: %s", key, self._failed[key]
+                    )
+                else:
+                    ready.append(key)
+            outcomes = await asyncio.gather(
+                *[self.release(key, released) for key in ready],
+                return_exceptions=True,
+            )
+            for key, outcome in zip(ready, outcomes):
+                if isinstance(outcome, BaseException):
+                    self._failed[key] = str(outcome)
+                    ReleaseTrain.logger().error(
+                        "Could not release %s: %s", key, outcome
+                    )
+                elif outcome is None:
+                    # its dependents would otherwise get only part of their bumps.
+                    self._failed[key] = "not released"
+                    ReleaseTrain.logger().error("%s was not released", key)
+                else:
+                    result[key] = outcome
+                    released[key] = (outcome.repository_url, outcome.tag)
+        if self._failed:
+            ReleaseTrain.logger().error(
+                "Release train left %d of %d repositories unreleased: %s",
+                len(self._failed),
+                len(affected),
+                sorted(self._failed),
+            )
+        return result
+
+    async def release(
+        self, key: str, released: Dict[str, Tuple[str, str]]
+    ) -> TagPushed:
+        """
+        Bumps the released inputs of given repository, and releases it.
+        :param key: The key of the repository.
+        :type key: str
+        :param released: The (url, tag) of each repository released so far, by key.
+        :type released: Dict[str, Tuple[str, str]]
+        :return: The TagPushed event, or None if nothing was released.
+        :rtype: pythoneda.shared.artifact.events.TagPushed
+        """
+        artifact = self._artifacts.get(key, None)
+        if artifact is None:
+            ReleaseTrain.logger().warning("No artifact for %s: skipped", key)
+            return None
+        folder = artifact.repository_folder
+        bumps = [
+            released[input] for input in self._graph.inputs_of(key) if input in released
+        ]
+        if not bumps:
+            ReleaseTrain.logger().info("No released inputs for %s", key)
+            return None
+        staged = await StageInputUpdate(folder).stage_bumps(bumps)
+        if staged is None:
+            return None
+        event = await Commit(folder).commit_batch(folder, [staged])
+        for listener in (CommitPush(folder), CommitTag(folder), TagPush(folder)):
+            if event is None:
+                break
+            await self._emit(event)
+            event = await listener.listen(event)
+        if event is not None:
+            await self._emit(event)
+        return event
+
+    async def _emit(self, event: Event):
+        """
+        Notifies given event, if anyone listens.
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        """
+        if self._on_emitted is not None:
+            await self._on_emitted(event)
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
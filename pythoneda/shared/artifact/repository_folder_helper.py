@@ -19,9 +19,14 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
+from .deadline import Deadline
 import os
 from pythoneda.shared import BaseObject
 from pythoneda.shared.git import GitRepo, GitTag
+from .stage_timed_out import StageTimedOut
+import threading
+from typing import List, Tuple
+import zlib
 
 
 class RepositoryFolderHelper(BaseObject):
@@ -37,6 +42,10 @@ class RepositoryFolderHelper(BaseObject):
         - None
     """
 
+    # folder -> remote url
+    _remote_urls = {}
+    _remote_urls_lock = threading.Lock()
+
     @classmethod
     def find_out_version(cls, repositoryFolder: str) -> str:
         """
@@ -48,6 +57,230 @@ class RepositoryFolderHelper(BaseObject):
         """
         return GitTag(repositoryFolder).current_tag()
 
+    @classmethod
+    def git_dir(cls, repositoryFolder: str) -> str:
+        """
+        Retrieves the git directory of given repository, following .git files of worktrees.
+        :param repositoryFolder: The repository folder.
+        :type repositoryFolder: str
+        :return: The git directory, or None if it's not a repository.
+        :rtype: str
+        """
+        result = os.path.join(repositoryFolder, ".git")
+        if os.path.isfile(result):
+            with open(result, "r", encoding="utf-8") as file:
+                content = file.read().strip()
+            if content.startswith("gitdir:"):
+                result = os.path.join(repositoryFolder, content[len("gitdir:") :].strip())
+            else:
+                result = None
+        elif not os.path.isdir(result):
+            result = None
+        return result
+
+    @classmethod
+    def common_dir(cls, repositoryFolder: str) -> str:
+        """
+        Retrieves the directory with the refs and objects shared by all worktrees.
+        :param repositoryFolder: The repository folder.
+        :type repositoryFolder: str
+        :return: Such directory, or None if it's not a repository.
+        :rtype: str
+        """
+        result = cls.git_dir(repositoryFolder)
+        if result is not None:
+            common_file = os.path.join(result, "commondir")
+            if os.path.isfile(common_file):
+                with open(common_file, "r", encoding="utf-8") as file:
+                    result = os.path.join(result, file.read().strip())
+        return result
+
+    @classmethod
+    def remote_url_files(cls, repositoryFolder: str) -> List[str]:
+        """
+        Retrieves the files the remote url of given repository depends on: the config,
+        shared by all worktrees, and HEAD, since it's the remote of the current branch.
+        :param repositoryFolder: The repository folder.
+        :type repositoryFolder: str
+        :return: Such files, or an empty list if it's not a repository.
+        :rtype: List[str]
+        """
+        git_dir = cls.git_dir(repositoryFolder)
+        if git_dir is None:
+            return []
+        return [
+            os.path.join(cls.common_dir(repositoryFolder), "config"),
+            os.path.join(git_dir, "HEAD"),
+        ]
+
+    @classmethod
+    def remote_url(cls, repositoryFolder: str) -> str:
+        """
+        Retrieves the remote url of the current branch, asking git once per folder.
+        The answer is kept until invalidate_remote_url is called (e.g. by RepositoryWatcher,
+        when any of remote_url_files changes).
+        :param repositoryFolder: The repository folder.
+        :type repositoryFolder: str
+        :return: Such url.
+        :rtype: str
+        """
+        key = os.path.abspath(repositoryFolder)
+        with cls._remote_urls_lock:
+            if key in cls._remote_urls:
+                return cls._remote_urls[key]
+        url = GitRepo.from_folder(repositoryFolder).remote_url
+        with cls._remote_urls_lock:
+            cls._remote_urls[key] = url
+        return url
+
+    @classmethod
+    def invalidate_remote_url(cls, repositoryFolder: str):
+        """
+        Forgets the remote url of given repository, e.g. after its config or HEAD changed.
+        :param repositoryFolder: The repository folder.
+        :type repositoryFolder: str
+        """
+        with cls._remote_urls_lock:
+            cls._remote_urls.pop(os.path.abspath(repositoryFolder), None)
+
+    @classmethod
+    def head_commit(cls, repositoryFolder: str) -> str:
+        """
+        Retrieves the commit HEAD points to, reading git's files directly instead
+        of running git.
+        :param repositoryFolder: The repository folder.
+        :type repositoryFolder: str
+        :return: The commit hash, or None if it cannot be resolved.
+        :rtype: str
+        """
+        return cls.resolve_ref(repositoryFolder, "HEAD")
+
+    @classmethod
+    def resolve_ref(cls, repositoryFolder: str, ref: str) -> str:
+        """
+        Retrieves the commit given reference points to, reading git's files directly
+        instead of running git. Annotated tags are peeled to their commit, asking git
+        only when the tag object is packed.
+        :param repositoryFolder: The repository folder.
+        :type repositoryFolder: str
+        :param ref: HEAD, or a full reference such as refs/tags/0.0.1.
+        :type ref: str
+        :return: The commit hash, or None if it cannot be resolved.
+        :rtype: str
+        """
+        git_dir = cls.git_dir(repositoryFolder)
+        if git_dir is None:
+            return None
+        common_dir = cls.common_dir(repositoryFolder)
+        if ref == "HEAD":
+            try:
+                with open(os.path.join(git_dir, "HEAD"), "r", encoding="utf-8") as file:
+                    head = file.read().strip()
+            except OSError:
+                return None
+            if not head.startswith("ref:"):
+                return head
+            ref = head[len("ref:") :].strip()
+        sha, peeled = cls._read_ref(git_dir, common_dir, ref)
+        # only tags may point to tag objects.
+        if sha is None or peeled or not ref.startswith("refs/tags/"):
+            return sha
+        result = cls._peel(common_dir, sha)
+        if result is None:
+            # the tag object lives in a pack: let git peel it.
+            result = cls._rev_parse(repositoryFolder, f"{ref}^{{commit}}")
+        return result
+
+    @classmethod
+    def _read_ref(cls, gitDir: str, commonDir: str, ref: str) -> Tuple[str, bool]:
+        """
+        Reads given reference from the loose refs, or else from packed-refs.
+        :param gitDir: The git directory.
+        :type gitDir: str
+        :param commonDir: The common directory, shared by the worktrees.
+        :type commonDir: str
+        :param ref: A full reference such as refs/tags/0.0.1.
+        :type ref: str
+        :return: The object it points to, or None if absent, and whether it's already
+        peeled to a commit.
+        :rtype: Tuple[str, bool]
+        """
+        # worktrees keep their refs in the common directory.
+        for folder in (gitDir, commonDir):
+            try:
+                with open(os.path.join(folder, ref), "r", encoding="utf-8") as file:
+                    return file.read().strip(), False
+            except OSError:
+                continue
+        found = None
+        try:
+            with open(os.path.join(commonDir, "packed-refs"), "r", encoding="utf-8") as file:
+                for line in file:
+                    line = line.strip()
+                    if found is not None:
+                        # packed annotated tags may be followed by the commit they point to.
+                        if line.startswith("^"):
+                            return line[1:], True
+                        break
+                    parts = line.split(" ")
+                    if len(parts) == 2 and parts[1] == ref:
+                        found = parts[0]
+        except OSError:
+            pass
+        return found, False
+
+    @classmethod
+    def _rev_parse(cls, repositoryFolder: str, revision: str) -> str:
+        """
+        Asks git for the object given revision names.
+        :param repositoryFolder: The repository folder.
+        :type repositoryFolder: str
+        :param revision: The revision, e.g. refs/tags/0.0.1^{commit}.
+        :type revision: str
+        :return: The object hash, or None if git cannot resolve it.
+        :rtype: str
+        """
+        try:
+            completed_process = Deadline.run(
+                "rev_parse",
+                ["git", "rev-parse", "--verify", "--quiet", revision],
+                repositoryFolder,
+                "git",
+            )
+        except StageTimedOut:
+            return None
+        if completed_process.returncode != 0:
+            RepositoryFolderHelper.logger().debug(
+                "git cannot resolve %s in %s", revision, repositoryFolder
+            )
+            return None
+        return completed_process.stdout.strip()
+
+    @classmethod
+    def _peel(cls, commonDir: str, sha: str) -> str:
+        """
+        Follows the tag objects given object may be, until a commit.
+        :param commonDir: The directory with the objects.
+        :type commonDir: str
+        :param sha: The object.
+        :type sha: str
+        :return: The commit hash, or None if any object lives in a pack.
+        :rtype: str
+        """
+        while True:
+            path = os.path.join(commonDir, "objects", sha[:2], sha[2:])
+            try:
+                with open(path, "rb") as file:
+                    content = zlib.decompress(file.read())
+            except (OSError, zlib.error):
+                return None
+            if not content.startswith(b"tag "):
+                return sha
+            body = content[content.index(b"\0") + 1 :]
+            if not body.startswith(b"object "):
+                return None
+            sha = body[len("object ") : len("object ") + 40].decode("ascii")
+
     @classmethod
     def find_out_repository_folder(
         cls, referenceRepositoryFolder: str, url: str
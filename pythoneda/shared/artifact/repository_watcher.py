@@ -0,0 +1,434 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/repository_watcher.py
+
+This file declares the RepositoryWatcher class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+from .async_git import AsyncGit
+from .content_digest import ContentDigest
+import ctypes
+import ctypes.util
+import os
+from pythoneda.shared import BaseObject
+from pythoneda.shared.artifact.events import Change, ChangeStaged
+from .repository_folder_helper import RepositoryFolderHelper
+import struct
+import subprocess
+import threading
+from typing import Awaitable, Callable, Dict, List, Set
+
+
+class RepositoryWatcher(BaseObject):
+    """
+    Watches repository folders with Linux inotify, and emits ChangeStaged events incrementally.
+
+    Class name: RepositoryWatcher
+
+    Responsibilities:
+        - Watch the working trees of the repositories in the workspace, except the
+          folders git ignores.
+        - Debounce bursts of writes, stage only the touched paths, and emit a
+          ChangeStaged event with the diff of those paths.
+        - Rescan the repositories if the kernel dropped events.
+        - Ignore the files the pipeline itself wrote.
+        - Tell RepositoryFolderHelper when the remote url of a repository may have changed.
+
+    Collaborators:
+        - pythoneda.shared.artifact.AsyncGit
+        - pythoneda.shared.artifact.events.ChangeStaged
+        - pythoneda.shared.artifact.RepositoryFolderHelper
+    """
+
+    _IN_CLOSE_WRITE = 0x00000008
+    _IN_MOVED_FROM = 0x00000040
+    _IN_MOVED_TO = 0x00000080
+    _IN_CREATE = 0x00000100
+    _IN_DELETE = 0x00000200
+    _IN_DELETE_SELF = 0x00000400
+    _IN_Q_OVERFLOW = 0x00004000
+    _IN_ISDIR = 0x40000000
+    _IN_IGNORED = 0x00008000
+    _IN_NONBLOCK = 0o4000
+    _IN_CLOEXEC = 0o2000000
+    _mask = (
+        _IN_CLOSE_WRITE
+        | _IN_MOVED_FROM
+        | _IN_MOVED_TO
+        | _IN_CREATE
+        | _IN_DELETE
+        | _IN_DELETE_SELF
+    )
+    # git replaces its files by renaming a lock file over them.
+    _git_mask = _IN_CLOSE_WRITE | _IN_MOVED_TO
+    _event_header = struct.Struct("iIII")
+    # the digest of the files the pipeline wrote, by absolute path.
+    _own_writes: Dict[str, str] = {}
+    _own_writes_lock = threading.Lock()
+
+    def __init__(
+        self,
+        folders: List[str],
+        onChangeStaged: Callable[[ChangeStaged], Awaitable],
+        debounce: float = 0.5,
+    ):
+        """
+        Creates a new RepositoryWatcher instance.
+        :param folders: The repository folders to watch.
+        :type folders: List[str]
+        :param onChangeStaged: The coroutine to notify each ChangeStaged event to.
+        :type onChangeStaged: Callable[[pythoneda.shared.artifact.events.ChangeStaged], Awaitable]
+        :param debounce: How long a repository must stay quiet, in seconds, before its changes are staged.
+        :type debounce: float
+        """
+        super().__init__()
+        self._folders = [os.path.abspath(folder) for folder in folders]
+        self._on_change_staged = onChangeStaged
+        self._debounce = debounce
+        self._fd = None
+        self._libc = None
+        self._watches = {}
+        # wd -> (repository, file name) pairs of the git files it covers.
+        self._git_watches: Dict[int, Set] = {}
+        self._ignored: Dict[str, Set[str]] = {}
+        self._pending: Dict[str, Set[str]] = {}
+        self._timers = {}
+        self._loop = None
+        self._tasks = set()
+
+    @classmethod
+    def own_write(cls, path: str):
+        """
+        Declares the pipeline just wrote given file, so watching it doesn't trigger it again.
+        :param path: The file.
+        :type path: str
+        """
+        digest = ContentDigest.of_file(path)
+        with cls._own_writes_lock:
+            cls._own_writes[os.path.abspath(path)] = digest
+
+    @classmethod
+    def is_own_write(cls, path: str) -> bool:
+        """
+        Checks whether given file still has the contents the pipeline wrote.
+        Any other contents make the pipeline forget about it.
+        :param path: The file.
+        :type path: str
+        :return: True in such case.
+        :rtype: bool
+        """
+        path = os.path.abspath(path)
+        with cls._own_writes_lock:
+            digest = cls._own_writes.get(path, None)
+        if digest is None:
+            return False
+        if ContentDigest.of_file(path) == digest:
+            return True
+        with cls._own_writes_lock:
+            if cls._own_writes.get(path, None) == digest:
+                del cls._own_writes[path]
+        return False
+
+    async def start(self):
+        """
+        Starts watching.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(
+            RepositoryWatcher._IN_NONBLOCK | RepositoryWatcher._IN_CLOEXEC
+        )
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        for folder in self._folders:
+            await self._load_ignored(folder)
+            self._watch_tree(folder, folder)
+            self._watch_git_files(folder)
+        self._loop.add_reader(self._fd, self._on_readable)
+        RepositoryWatcher.logger().info(
+            f"Watching {len(self._watches)} folders in {len(self._folders)} repositories"
+        )
+
+    def stop(self):
+        """
+        Stops watching, discarding pending changes.
+        """
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._pending.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        self._watches.clear()
+        self._git_watches.clear()
+
+    async def _load_ignored(self, repository: str):
+        """
+        Retrieves the folders git ignores in given repository.
+        :param repository: The repository folder.
+        :type repository: str
+        """
+        try:
+            ignored = await AsyncGit.instance().ignored_directories(repository)
+        except subprocess.CalledProcessError as err:
+            RepositoryWatcher.logger().error(
+                f"Cannot tell the ignored folders of {repository}: {err.stderr}"
+            )
+            ignored = []
+        self._ignored[repository] = {path.rstrip("/") for path in ignored}
+
+    def _watch_tree(self, repository: str, folder: str):
+        """
+        Watches given folder and its subfolders, skipping git's own and the ignored ones.
+        :param repository: The repository the folder belongs to.
+        :type repository: str
+        :param folder: The folder.
+        :type folder: str
+        """
+        ignored = self._ignored.get(repository, set())
+        for root, dirs, _ in os.walk(folder):
+            dirs[:] = [
+                name
+                for name in dirs
+                if name != ".git"
+                and not os.path.islink(os.path.join(root, name))
+                and os.path.relpath(os.path.join(root, name), repository)
+                not in ignored
+            ]
+            wd = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(root), RepositoryWatcher._mask
+            )
+            if wd < 0:
+                errno = ctypes.get_errno()
+                RepositoryWatcher.logger().error(
+                    f"Cannot watch {root}: {os.strerror(errno)}"
+                )
+            else:
+                self._watches[wd] = (repository, root)
+
+    def _watch_git_files(self, repository: str):
+        """
+        Watches the git files the remote url of given repository depends on.
+        :param repository: The repository folder.
+        :type repository: str
+        """
+        for file in RepositoryFolderHelper.remote_url_files(repository):
+            wd = self._libc.inotify_add_watch(
+                self._fd,
+                os.fsencode(os.path.dirname(file)),
+                RepositoryWatcher._git_mask,
+            )
+            if wd < 0:
+                errno = ctypes.get_errno()
+                RepositoryWatcher.logger().error(
+                    f"Cannot watch {file}: {os.strerror(errno)}"
+                )
+            else:
+                self._git_watches.setdefault(wd, set()).add(
+                    (repository, os.path.basename(file))
+                )
+
+    def _spawn(self, coroutine):
+        """
+        Runs given coroutine in the background, until it finishes or the watcher stops.
+        :param coroutine: The coroutine.
+        :type coroutine: Coroutine
+        """
+        task = self._loop.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _on_readable(self):
+        """
+        Reads the available inotify events.
+        """
+        try:
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        position = 0
+        header = RepositoryWatcher._event_header
+        while position + header.size <= len(buffer):
+            wd, mask, _, length = header.unpack_from(buffer, position)
+            position += header.size
+            name = os.fsdecode(buffer[position : position + length].rstrip(b"\0"))
+            position += length
+            if mask & RepositoryWatcher._IN_Q_OVERFLOW:
+                RepositoryWatcher.logger().warning(
+                    "inotify queue overflowed: rescanning all repositories"
+                )
+                for repository in self._folders:
+                    self._spawn(self._rescan(repository))
+                continue
+            for repository, file in self._git_watches.get(wd, ()):
+                if name == file:
+                    RepositoryFolderHelper.invalidate_remote_url(repository)
+            if mask & RepositoryWatcher._IN_IGNORED:
+                self._git_watches.pop(wd, None)
+            watch = self._watches.get(wd, None)
+            if watch is None:
+                continue
+            repository, folder = watch
+            if mask & RepositoryWatcher._IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if name == "" or name == ".git":
+                continue
+            path = os.path.join(folder, name)
+            if mask & RepositoryWatcher._IN_ISDIR:
+                if mask & (RepositoryWatcher._IN_CREATE | RepositoryWatcher._IN_MOVED_TO):
+                    self._spawn(self._watch_new(repository, path))
+                continue
+            if mask & RepositoryWatcher._IN_CREATE:
+                # wait for IN_CLOSE_WRITE, the file is still being written.
+                continue
+            self._touch(repository, os.path.relpath(path, repository))
+
+    async def _watch_new(self, repository: str, folder: str):
+        """
+        Watches a folder created after the watcher started, unless git ignores it.
+        :param repository: The repository the folder belongs to.
+        :type repository: str
+        :param folder: The new folder.
+        :type folder: str
+        """
+        relative = os.path.relpath(folder, repository)
+        try:
+            kept = await AsyncGit.instance().not_ignored(repository, [f"{relative}/"])
+        except subprocess.CalledProcessError as err:
+            RepositoryWatcher.logger().error(
+                f"Cannot tell whether {folder} is ignored: {err.stderr}"
+            )
+            kept = [relative]
+        if not kept:
+            self._ignored.setdefault(repository, set()).add(relative)
+            return
+        if self._fd is None:
+            return
+        self._watch_tree(repository, folder)
+        # files may have landed before the new watch was in place.
+        for root, _, files in os.walk(folder):
+            for file in files:
+                self._touch(
+                    repository, os.path.relpath(os.path.join(root, file), repository)
+                )
+
+    async def _rescan(self, repository: str):
+        """
+        Catches up with the events the kernel dropped for given repository: watches the
+        folders created meanwhile, and treats every changed path as touched.
+        :param repository: The repository folder.
+        :type repository: str
+        """
+        await self._load_ignored(repository)
+        if self._fd is None:
+            return
+        self._watch_tree(repository, repository)
+        # the changes to its git files may be among the dropped events.
+        RepositoryFolderHelper.invalidate_remote_url(repository)
+        try:
+            paths = await AsyncGit.instance().changed_paths(repository)
+        except subprocess.CalledProcessError as err:
+            RepositoryWatcher.logger().error(
+                f"Cannot rescan {repository}: {err.stderr}"
+            )
+            return
+        for path in paths:
+            self._touch(repository, path)
+
+    def _touch(self, repository: str, path: str):
+        """
+        Records a path changed, and (re)starts the debounce timer of its repository.
+        :param repository: The repository folder.
+        :type repository: str
+        :param path: The path, relative to the repository.
+        :type path: str
+        """
+        self._pending.setdefault(repository, set()).add(path)
+        timer = self._timers.pop(repository, None)
+        if timer is not None:
+            timer.cancel()
+        self._timers[repository] = self._loop.call_later(
+            self._debounce, self._schedule_flush, repository
+        )
+
+    def _schedule_flush(self, repository: str):
+        """
+        Stages the pending changes of given repository in the background.
+        :param repository: The repository folder.
+        :type repository: str
+        """
+        self._timers.pop(repository, None)
+        paths = sorted(self._pending.pop(repository, set()))
+        if paths:
+            self._spawn(self.flush(repository, paths))
+
+    async def flush(self, folder: str, paths: List[str]) -> ChangeStaged:
+        """
+        Stages given paths and emits a ChangeStaged event with their diff.
+        :param folder: The repository folder.
+        :type folder: str
+        :param paths: The touched paths, relative to the folder.
+        :type paths: List[str]
+        :return: The event, or None if nothing relevant changed.
+        :rtype: pythoneda.shared.artifact.events.ChangeStaged
+        """
+        result = None
+        paths = [
+            path
+            for path in paths
+            if not self.__class__.is_own_write(os.path.join(folder, path))
+        ]
+        if not paths:
+            return result
+        git = AsyncGit.instance()
+        try:
+            paths = await git.not_ignored(folder, paths)
+            if not paths:
+                return result
+            for path in paths:
+                await git.add(folder, path)
+            diff = await git.staged_diff(folder, paths)
+            urls = await git.remote_urls(folder)
+            branch = await git.current_branch(folder)
+        except subprocess.CalledProcessError as err:
+            RepositoryWatcher.logger().error(
+                f"Could not stage the changes in {folder}: {err.stderr}"
+            )
+            return result
+        if diff.strip() != "" and len(urls) > 0:
+            result = ChangeStaged(
+                Change.from_unidiff_text(diff, urls[0], branch, folder)
+            )
+            await self._on_change_staged(result)
+        return result
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,210 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/sha256_cache.py
+
+This file declares the Sha256Cache class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from .content_digest import ContentDigest
+import json
+import os
+from pythoneda.shared import BaseObject
+import threading
+
+
+class Sha256Cache(BaseObject):
+    """
+    Content-addressed, on-disk cache of source hashes.
+
+    Class name: Sha256Cache
+
+    Responsibilities:
+        - Remember the sha256 of the sources of a given (url, revision).
+        - Keep the cache under a size limit, evicting the least recently used entries.
+
+    Collaborators:
+        - pythoneda.shared.artifact.ArtifactEventListener
+    """
+
+    _default_max_bytes = 16 * 1024 * 1024
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, folder: str, maxBytes: int = None):
+        """
+        Creates a new Sha256Cache instance.
+        :param folder: The folder where entries are stored.
+        :type folder: str
+        :param maxBytes: The maximum size of the cache, in bytes.
+        :type maxBytes: int
+        """
+        super().__init__()
+        self._folder = folder
+        self._max_bytes = maxBytes or Sha256Cache._default_max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    @classmethod
+    def instance(cls):
+        """
+        Retrieves the process-wide cache.
+        The location can be customized via PYTHONEDA_SHA256_CACHE, and the size limit
+        via PYTHONEDA_SHA256_CACHE_MAX_BYTES.
+        :return: The cache.
+        :rtype: pythoneda.shared.artifact.Sha256Cache
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                folder = os.environ.get("PYTHONEDA_SHA256_CACHE", None)
+                if folder is None:
+                    base = os.environ.get(
+                        "XDG_CACHE_HOME",
+                        os.path.join(os.path.expanduser("~"), ".cache"),
+                    )
+                    folder = os.path.join(base, "pythoneda", "sha256")
+                max_bytes = os.environ.get("PYTHONEDA_SHA256_CACHE_MAX_BYTES", None)
+                cls._instance = cls(
+                    folder, int(max_bytes) if max_bytes is not None else None
+                )
+        return cls._instance
+
+    @property
+    def folder(self) -> str:
+        """
+        Retrieves the folder of the cache.
+        :return: Such folder.
+        :rtype: str
+        """
+        return self._folder
+
+    @property
+    def max_bytes(self) -> int:
+        """
+        Retrieves the size limit of the cache.
+        :return: Such limit, in bytes.
+        :rtype: int
+        """
+        return self._max_bytes
+
+    def _entry_path(self, url: str, rev: str) -> str:
+        """
+        Retrieves the path of the entry for given key.
+        :param url: The url of the sources.
+        :type url: str
+        :param rev: The revision of the sources.
+        :type rev: str
+        :return: The path.
+        :rtype: str
+        """
+        digest = ContentDigest.of_text(f"{url}\0{rev}")
+        return os.path.join(self._folder, digest[:2], digest)
+
+    def get(self, url: str, rev: str) -> str:
+        """
+        Retrieves the cached sha256 for given sources.
+        :param url: The url of the sources, i.e. url_for(version).
+        :type url: str
+        :param rev: The revision of the sources.
+        :type rev: str
+        :return: The sha256, or None if it's not cached.
+        :rtype: str
+        """
+        result = None
+        path = self._entry_path(url, rev)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                entry = json.load(file)
+            if entry.get("url") == url and entry.get("rev") == rev:
+                result = entry.get("sha256", None)
+                # mark it as recently used.
+                os.utime(path)
+        except (OSError, json.JSONDecodeError):
+            result = None
+        return result
+
+    def put(self, url: str, rev: str, sha256: str):
+        """
+        Stores the sha256 of given sources.
+        :param url: The url of the sources, i.e. url_for(version).
+        :type url: str
+        :param rev: The revision of the sources.
+        :type rev: str
+        :param sha256: The hash.
+        :type sha256: str
+        """
+        path = self._entry_path(url, rev)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as file:
+            json.dump({"url": url, "rev": rev, "sha256": sha256}, file)
+        size = os.path.getsize(tmp)
+        try:
+            # rewriting an entry replaces its bytes.
+            size -= os.path.getsize(path)
+        except OSError:
+            pass
+        os.replace(tmp, path)
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += size
+            over_limit = (
+                self._total_bytes is None or self._total_bytes > self._max_bytes
+            )
+        if over_limit:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits its size limit.
+        Temporary files being written are neither counted nor removed.
+        """
+        with self._lock:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self._folder):
+                for name in files:
+                    # writes in progress, possibly by other processes.
+                    if name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+            if total > self._max_bytes:
+                entries.sort()
+                for _, size, path in entries:
+                    if total <= self._max_bytes:
+                        break
+                    try:
+                        os.remove(path)
+                        total -= size
+                    except OSError:
+                        pass
+            self._total_bytes = total
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,266 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/sha256_prefetcher.py
+
+This file declares the Sha256Prefetcher class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+from pythoneda.shared import BaseObject
+from .sha256_cache import Sha256Cache
+import subprocess
+import tempfile
+import threading
+
+
+class Sha256Prefetcher(BaseObject):
+    """
+    Computes the sha256 of freshly tagged revisions in the background.
+
+    Class name: Sha256Prefetcher
+
+    Responsibilities:
+        - Hash a tagged revision from the local clone while its tag is still being pushed.
+        - Store the hash in the Sha256Cache, and hand in-flight results to whoever needs them:
+          the flake update of the tagged repository, and the input updates of its dependents.
+
+    Collaborators:
+        - pythoneda.shared.artifact.Sha256Cache
+        - pythoneda.shared.artifact.ArtifactEventListener
+        - pythoneda.shared.artifact.StageInputUpdate
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, cache: Sha256Cache, workers: int = None):
+        """
+        Creates a new Sha256Prefetcher instance.
+        :param cache: The cache to store the hashes in.
+        :type cache: pythoneda.shared.artifact.Sha256Cache
+        :param workers: The number of background workers.
+        :type workers: int
+        """
+        super().__init__()
+        self._cache = cache
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or os.cpu_count() or 1,
+            thread_name_prefix="sha256-prefetch",
+        )
+        self._in_flight = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def instance(cls):
+        """
+        Retrieves the process-wide prefetcher.
+        The number of workers can be customized via PYTHONEDA_PREFETCH_WORKERS.
+        :return: The prefetcher.
+        :rtype: pythoneda.shared.artifact.Sha256Prefetcher
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                workers = os.environ.get("PYTHONEDA_PREFETCH_WORKERS", None)
+                cls._instance = cls(
+                    Sha256Cache.instance(),
+                    int(workers) if workers is not None else None,
+                )
+        return cls._instance
+
+    @classmethod
+    def source_url(cls, url: str, tag: str) -> str:
+        """
+        Retrieves the url of the sources of given repository at given tag, i.e. the
+        url_for(tag) the Sha256Cache is keyed on.
+        :param url: The repository url.
+        :type url: str
+        :param tag: The tag.
+        :type tag: str
+        :return: The url of the sources.
+        :rtype: str
+        """
+        return f"{url}/{tag}"
+
+    def prefetch(self, url: str, tag: str, rev: str, folder: str) -> Future:
+        """
+        Starts hashing given revision, unless it's cached or already in progress.
+        :param url: The repository url.
+        :type url: str
+        :param tag: The tag pointing to the revision.
+        :type tag: str
+        :param rev: The revision to hash.
+        :type rev: str
+        :param folder: The local clone.
+        :type folder: str
+        :return: The future of the hash.
+        :rtype: concurrent.futures.Future
+        """
+        key = (url, rev, tag)
+        source_url = self.source_url(url, tag)
+        with self._lock:
+            result = self._in_flight.get(key, None)
+            if result is None:
+                cached = self._cache.get(source_url, rev)
+                if cached is not None:
+                    result = Future()
+                    result.set_result(cached)
+                else:
+                    Sha256Prefetcher.logger().debug(
+                        f"Prefetching sha256 of {source_url} ({rev}) from {folder}"
+                    )
+                    result = self._executor.submit(
+                        self._compute, source_url, rev, folder
+                    )
+                    self._in_flight[key] = result
+                    result.add_done_callback(lambda _: self._forget(key))
+        return result
+
+    def _forget(self, key):
+        """
+        Forgets a finished computation. Its result is already in the cache.
+        :param key: The (url, rev, tag) tuple.
+        :type key: tuple
+        """
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    async def wait_for(self, url: str, tag: str, rev: str) -> str:
+        """
+        Waits for an in-flight computation, if any.
+        :param url: The repository url.
+        :type url: str
+        :param tag: The tag.
+        :type tag: str
+        :param rev: The revision.
+        :type rev: str
+        :return: The sha256, or None if nothing was being computed or it failed.
+        :rtype: str
+        """
+        with self._lock:
+            future = self._in_flight.get((url, rev, tag), None)
+        result = None
+        if future is not None:
+            try:
+                result = await asyncio.wrap_future(future)
+            except Exception as err:
+                Sha256Prefetcher.logger().error(err)
+        return result
+
+    async def lookup(self, url: str, tag: str, rev: str) -> str:
+        """
+        Retrieves the sha256 of given revision, waiting for an in-flight computation
+        and falling back to the cache.
+        :param url: The repository url.
+        :type url: str
+        :param tag: The tag.
+        :type tag: str
+        :param rev: The revision.
+        :type rev: str
+        :return: The sha256, or None if unknown.
+        :rtype: str
+        """
+        result = await self.wait_for(url, tag, rev)
+        if result is None:
+            result = self._cache.get(self.source_url(url, tag), rev)
+        return result
+
+    def _compute(self, url: str, rev: str, folder: str) -> str:
+        """
+        Computes the sha256 of given revision, the same way fetchFromGitHub does.
+        :param url: The url of the sources.
+        :type url: str
+        :param rev: The revision to hash.
+        :type rev: str
+        :param folder: The local clone.
+        :type folder: str
+        :return: The sha256, in SRI format, or None if it could not be computed.
+        :rtype: str
+        """
+        result = None
+        with tempfile.TemporaryDirectory(prefix="sha256-prefetch-") as tmp:
+            source = os.path.join(tmp, "source")
+            os.mkdir(source)
+            archive = subprocess.Popen(
+                ["git", "archive", "--format=tar", rev],
+                cwd=folder,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            extract = subprocess.run(
+                ["tar", "-x", "-C", source],
+                stdin=archive.stdout,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            archive.stdout.close()
+            archive_stderr = archive.stderr.read().decode(errors="replace")
+            archive.wait()
+            if archive.returncode != 0 or extract.returncode != 0:
+                Sha256Prefetcher.logger().error(
+                    f"Could not extract {rev} from {folder}: {archive_stderr}{extract.stderr}"
+                )
+            else:
+                result = self._hash_path(source)
+        if result is not None:
+            self._cache.put(url, rev, result)
+        return result
+
+    def _hash_path(self, path: str) -> str:
+        """
+        Computes the NAR hash of given path.
+        :param path: The path.
+        :type path: str
+        :return: The sha256, in SRI format, or None if nix failed.
+        :rtype: str
+        """
+        result = None
+        nix = os.environ.get("PYTHONEDA_NIX", "nix")
+        completed_process = subprocess.run(
+            [
+                nix,
+                "--extra-experimental-features",
+                "nix-command",
+                "hash",
+                "path",
+                "--type",
+                "sha256",
+                "--sri",
+                path,
+            ],
+            check=False,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        if completed_process.returncode == 0:
+            result = completed_process.stdout.strip()
+        else:
+            Sha256Prefetcher.logger().error(completed_process.stderr)
+        return result
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,152 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/shard_benchmark.py
+
+This file declares the ShardBenchmark class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import functools
+import os
+from pythoneda.shared import BaseObject
+from pythoneda.shared.artifact.events import TagPushed
+from .shard_coordinator import ShardCoordinator
+import sys
+import time
+from typing import Dict, List
+
+
+class ShardBenchmark(BaseObject):
+    """
+    Measures how ShardCoordinator scales with the number of shards. Run it with
+    `python -m pythoneda.shared.artifact.shard_benchmark [repositories] [events] [milliseconds]`.
+
+    Class name: ShardBenchmark
+
+    Responsibilities:
+        - Simulate a workspace whose artifacts spend CPU time reacting to every TagPushed.
+        - Report how long it takes to settle for each shard count.
+
+    Collaborators:
+        - pythoneda.shared.artifact.ShardCoordinator
+    """
+
+    class SimulatedArtifact:
+        """
+        Stand-in for an artifact that spends some CPU time on each new tag.
+        """
+
+        def __init__(self, folder: str, work: float):
+            """
+            Creates a new SimulatedArtifact instance.
+            :param folder: Its repository folder.
+            :type folder: str
+            :param work: The CPU seconds each tag costs.
+            :type work: float
+            """
+            self.repository_folder = folder
+            self._work = work
+
+        async def maybe_update_flake_after_TagPushed(self, event: TagPushed):
+            """
+            Burns the CPU time of an input update.
+            :param event: The event.
+            :type event: pythoneda.shared.artifact.events.TagPushed
+            :return: Nothing, so the cascade stops here.
+            :rtype: NoneType
+            """
+            until = time.process_time() + self._work
+            while time.process_time() < until:
+                pass
+            return None
+
+    @classmethod
+    def events(cls, folders: List[str], count: int) -> List[TagPushed]:
+        """
+        Builds the tags to inject.
+        :param folders: The repository folders.
+        :type folders: List[str]
+        :param count: How many.
+        :type count: int
+        :return: The events.
+        :rtype: List[pythoneda.shared.artifact.events.TagPushed]
+        """
+        result = []
+        for index in range(count):
+            folder = folders[index % len(folders)]
+            result.append(
+                TagPushed(
+                    f"0.0.{index}",
+                    f"{index:040x}",
+                    f"https://github.com/pythoneda-bench/{os.path.basename(folder)}",
+                    "main",
+                    folder,
+                )
+            )
+        return result
+
+    @classmethod
+    def run(
+        cls, repositories: int, events: int, work: float, shardCounts: List[int] = None
+    ) -> Dict[int, float]:
+        """
+        Benchmarks a simulated workspace.
+        :param repositories: The number of repositories.
+        :type repositories: int
+        :param events: The number of tags to inject.
+        :type events: int
+        :param work: The CPU seconds each artifact spends on each tag.
+        :type work: float
+        :param shardCounts: The shard counts to try. Defaults to powers of two up to the number of CPUs.
+        :type shardCounts: List[int]
+        :return: The elapsed seconds for each shard count.
+        :rtype: Dict[int, float]
+        """
+        folders = [
+            f"/nonexistent/pythoneda-bench/project-{index}"
+            for index in range(repositories)
+        ]
+        return ShardCoordinator.benchmark(
+            functools.partial(cls.SimulatedArtifact, work=work),
+            folders,
+            cls.events(folders, events),
+            shardCounts,
+        )
+
+
+if __name__ == "__main__":
+    # imported by name, so the shards can unpickle the simulated artifacts.
+    from pythoneda.shared.artifact.shard_benchmark import ShardBenchmark
+
+    repositories = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    events = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    work = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.002
+    serial = repositories * events * work
+    for shards, seconds in ShardBenchmark.run(repositories, events, work).items():
+        print(
+            f"{shards} shards: {seconds:.3f}s for {events} tags over {repositories} "
+            f"repositories ({serial:.3f}s of work)"
+        )
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,560 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/shard_coordinator.py
+
+This file declares the ShardCoordinator class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+from collections import Counter
+from .critical_path_scheduler import CriticalPathScheduler
+from .dependency_graph import DependencyGraph
+import multiprocessing
+import os
+from pythoneda.shared import BaseObject, Event
+import queue
+from .stage_pipeline import StagePipeline
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+from .wave_tracker import WaveTracker
+
+
+class ShardCoordinator(BaseObject):
+    """
+    Spreads the artifacts of a large workspace over a pool of worker processes.
+
+    Class name: ShardCoordinator
+
+    Responsibilities:
+        - Assign each repository to exactly one shard process, so its git operations
+          and caches stay in a single process.
+        - Forward every event a shard emits to all shards over local pipes, along with
+          its wave, so cycle detection and wave deadlines span all shards.
+        - Share the inputs of every artifact with all shards, so each one sees the whole
+          dependency graph.
+        - Detect when the whole workspace is quiescent.
+        - Move repositories from busy shards to idle ones, based on measured stage times.
+
+    Collaborators:
+        - pythoneda.shared.artifact.CriticalPathScheduler
+        - pythoneda.shared.artifact.DependencyGraph
+        - pythoneda.shared.artifact.StagePipeline
+        - pythoneda.shared.artifact.WaveTracker
+    """
+
+    def __init__(
+        self,
+        folders: List[str],
+        factory: Callable[[str], object],
+        shards: int = None,
+        onEmitted: Callable[[Event], None] = None,
+        prioritize: bool = False,
+    ):
+        """
+        Creates a new ShardCoordinator instance.
+        :param folders: The repository folders of the artifacts.
+        :type folders: List[str]
+        :param factory: Builds the artifact of a repository folder, inside the shard. Must be picklable.
+        :type factory: Callable[[str], pythoneda.shared.artifact.AbstractArtifact]
+        :param shards: The number of worker processes. Defaults to the number of usable CPUs.
+        :type shards: int
+        :param onEmitted: Gets notified of every emitted event, from a coordinator thread.
+        :type onEmitted: Callable[[pythoneda.shared.Event], None]
+        :param prioritize: Whether each shard ranks its jobs with a CriticalPathScheduler.
+        :type prioritize: bool
+        """
+        super().__init__()
+        self._folders = sorted(os.path.abspath(folder) for folder in folders)
+        self._factory = factory
+        count = shards or ShardCoordinator.cpus()
+        self._shards = max(1, min(count, len(self._folders) or 1))
+        self._on_emitted = onEmitted
+        self._prioritize = prioritize
+        self._assignment = {
+            folder: index % self._shards for index, folder in enumerate(self._folders)
+        }
+        self._processes = []
+        self._outboxes = []
+        self._threads = []
+        self._condition = threading.Condition()
+        self._sent = [0] * self._shards
+        self._processed = [0] * self._shards
+        self._load: List[Dict[str, float]] = [{} for _ in range(self._shards)]
+        self._emitted = 0
+        self._dead = set()
+        self._inputs: Dict[str, List[str]] = {}
+        self._reported = set()
+
+    @classmethod
+    def cpus(cls) -> int:
+        """
+        Retrieves the number of CPUs this process can run on.
+        :return: Such number.
+        :rtype: int
+        """
+        try:
+            return len(os.sched_getaffinity(0))
+        except AttributeError:
+            return os.cpu_count() or 1
+
+    @property
+    def assignment(self) -> Dict[str, int]:
+        """
+        Retrieves the shard of each repository folder.
+        :return: Such mapping.
+        :rtype: Dict[str, int]
+        """
+        return dict(self._assignment)
+
+    def folders_of(self, shard: int) -> List[str]:
+        """
+        Retrieves the repository folders of given shard.
+        :param shard: The shard.
+        :type shard: int
+        :return: Its folders.
+        :rtype: List[str]
+        """
+        return [folder for folder, index in self._assignment.items() if index == shard]
+
+    def start(self, timeout: float = None):
+        """
+        Starts the shard processes, and waits until all of them know the whole
+        dependency graph.
+        :param timeout: The maximum time to wait for the shards to report their inputs, in seconds.
+        :type timeout: float
+        """
+        context = multiprocessing.get_context("spawn")
+        for index in range(self._shards):
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=ShardCoordinator._run_shard,
+                args=(
+                    index,
+                    child,
+                    self._factory,
+                    self.folders_of(index),
+                    self._prioritize,
+                ),
+                name=f"pythoneda-shard-{index}",
+                daemon=True,
+            )
+            process.start()
+            child.close()
+            outbox = queue.SimpleQueue()
+            self._processes.append(process)
+            self._outboxes.append(outbox)
+            for target in (self._send, self._receive):
+                thread = threading.Thread(
+                    target=target, args=(index, parent), daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: len(self._reported | self._dead) == self._shards, timeout
+            ):
+                ShardCoordinator.logger().warning(
+                    "Not every shard reported its inputs: their graphs are partial"
+                )
+            inputs = dict(self._inputs)
+        # before any event, so no shard reacts with a partial graph.
+        for outbox in self._outboxes:
+            outbox.put(("inputs", inputs))
+        ShardCoordinator.logger().info(
+            f"Started {self._shards} shards for {len(self._folders)} repositories"
+        )
+
+    def _send(self, index: int, connection):
+        """
+        Writes the outgoing messages of given shard, so routing never blocks on a full pipe.
+        :param index: The shard.
+        :type index: int
+        :param connection: The pipe to the shard.
+        :type connection: multiprocessing.connection.Connection
+        """
+        outbox = self._outboxes[index]
+        while True:
+            message = outbox.get()
+            try:
+                connection.send(message)
+            except (BrokenPipeError, EOFError, OSError):
+                break
+            if message[0] == "stop":
+                break
+
+    def _receive(self, index: int, connection):
+        """
+        Reads the messages of given shard, routing emitted events to every shard.
+        :param index: The shard.
+        :type index: int
+        :param connection: The pipe to the shard.
+        :type connection: multiprocessing.connection.Connection
+        """
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                ShardCoordinator.logger().error(f"Shard {index} died")
+                with self._condition:
+                    self._dead.add(index)
+                    self._condition.notify_all()
+                break
+            kind = message[0]
+            if kind == "emitted":
+                event = message[1]
+                self._broadcast(event)
+                with self._condition:
+                    self._emitted += 1
+                if self._on_emitted is not None:
+                    self._on_emitted(event)
+            elif kind == "inputs":
+                with self._condition:
+                    self._inputs.update(message[1])
+                    self._reported.add(index)
+                    self._condition.notify_all()
+            elif kind == "idle":
+                _, processed, load = message
+                with self._condition:
+                    self._processed[index] = max(self._processed[index], processed)
+                    self._load[index] = load
+                    self._condition.notify_all()
+            elif kind == "stopped":
+                break
+
+    def _broadcast(self, event: Event):
+        """
+        Sends given event to every shard.
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        """
+        # every event goes through here, so this process sees every chain whole.
+        tracker = WaveTracker.instance()
+        wave = tracker.wave_of(event)
+        started = tracker.started_at(event)
+        with self._condition:
+            for index in range(self._shards):
+                self._sent[index] += 1
+        for outbox in self._outboxes:
+            outbox.put(("event", event, wave, started))
+
+    def submit(self, event: Event):
+        """
+        Injects an event into the workspace.
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        """
+        self._broadcast(event)
+
+    def quiescent(self) -> bool:
+        """
+        Checks whether every shard processed every event sent to it.
+        :return: True in such case.
+        :rtype: bool
+        """
+        with self._condition:
+            return self._sent == self._processed
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Blocks until the workspace is quiescent.
+        :param timeout: The maximum time to wait, in seconds.
+        :type timeout: float
+        :return: False if it timed out, or a shard died.
+        :rtype: bool
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._dead or self._sent == self._processed, timeout
+            )
+            return not self._dead and self._sent == self._processed
+
+    async def join(self, timeout: float = None) -> bool:
+        """
+        Waits until the workspace is quiescent, without blocking the event loop.
+        :param timeout: The maximum time to wait, in seconds.
+        :type timeout: float
+        :return: False if it timed out.
+        :rtype: bool
+        """
+        return await asyncio.to_thread(self.wait, timeout)
+
+    def loads(self) -> List[float]:
+        """
+        Retrieves the accumulated stage time of each shard.
+        :return: The seconds spent by each shard.
+        :rtype: List[float]
+        """
+        with self._condition:
+            return [sum(load.values()) for load in self._load]
+
+    def rebalance(self, timeout: float = None) -> List[Tuple[str, int, int]]:
+        """
+        Moves repositories from the busiest shards to the idlest ones, while that lowers
+        the busiest one. Waits for quiescence first, so no repository is worked on by
+        two shards at once.
+        :param timeout: The maximum time to wait for quiescence, in seconds.
+        :type timeout: float
+        :return: Each move: folder, source shard and target shard.
+        :rtype: List[Tuple[str, int, int]]
+        """
+        result = []
+        if not self.wait(timeout):
+            ShardCoordinator.logger().warning("Not rebalancing: shards still busy")
+            return result
+        with self._condition:
+            loads = [dict(load) for load in self._load]
+        totals = [sum(load.values()) for load in loads]
+        while True:
+            busiest = max(range(self._shards), key=lambda index: totals[index])
+            idlest = min(range(self._shards), key=lambda index: totals[index])
+            gap = totals[busiest] - totals[idlest]
+            candidates = [
+                (seconds, folder)
+                for folder, seconds in loads[busiest].items()
+                if 0 < seconds < gap and self._assignment.get(folder) == busiest
+            ]
+            if busiest == idlest or not candidates:
+                break
+            seconds, folder = max(candidates)
+            loads[busiest].pop(folder)
+            loads[idlest][folder] = seconds
+            totals[busiest] -= seconds
+            totals[idlest] += seconds
+            self._assignment[folder] = idlest
+            self._outboxes[busiest].put(("drop", folder))
+            self._outboxes[idlest].put(("add", folder))
+            result.append((folder, busiest, idlest))
+        with self._condition:
+            self._load = loads
+        for folder, source, target in result:
+            ShardCoordinator.logger().info(
+                f"Moved {folder} from shard {source} to shard {target}"
+            )
+        return result
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Stops the shard processes.
+        :param timeout: How long to wait for each of them, in seconds.
+        :type timeout: float
+        """
+        for outbox in self._outboxes:
+            outbox.put(("stop",))
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+        self._processes = []
+        self._outboxes = []
+        self._threads = []
+
+    @classmethod
+    def _run_shard(
+        cls, index: int, connection, factory, folders: List[str], prioritize: bool
+    ):
+        """
+        Entry point of a shard process.
+        :param index: The shard.
+        :type index: int
+        :param connection: The pipe to the coordinator.
+        :type connection: multiprocessing.connection.Connection
+        :param factory: Builds the artifact of a repository folder.
+        :type factory: Callable[[str], pythoneda.shared.artifact.AbstractArtifact]
+        :param folders: The repository folders of this shard.
+        :type folders: List[str]
+        :param prioritize: Whether to rank the jobs with a CriticalPathScheduler.
+        :type prioritize: bool
+        """
+        asyncio.run(cls._serve(index, connection, factory, folders, prioritize))
+
+    @classmethod
+    def _inputs_of(cls, artifacts: List) -> Dict[str, List[str]]:
+        """
+        Retrieves the inputs of given artifacts.
+        :param artifacts: The artifacts.
+        :type artifacts: List[pythoneda.shared.artifact.AbstractArtifact]
+        :return: The urls of the inputs of each artifact, by url.
+        :rtype: Dict[str, List[str]]
+        """
+        result = {}
+        for artifact in artifacts:
+            url = getattr(artifact.__class__, "url", None)
+            if url is not None:
+                result[url] = [aux.url for aux in getattr(artifact, "inputs", [])]
+        return result
+
+    @classmethod
+    async def _serve(
+        cls, index: int, connection, factory, folders: List[str], prioritize: bool
+    ):
+        """
+        Runs the artifacts of a shard until told to stop.
+        :param index: The shard.
+        :type index: int
+        :param connection: The pipe to the coordinator.
+        :type connection: multiprocessing.connection.Connection
+        :param factory: Builds the artifact of a repository folder.
+        :type factory: Callable[[str], pythoneda.shared.artifact.AbstractArtifact]
+        :param folders: The repository folders of this shard.
+        :type folders: List[str]
+        :param prioritize: Whether to rank the jobs with a CriticalPathScheduler.
+        :type prioritize: bool
+        """
+        loop = asyncio.get_running_loop()
+        outbox = queue.SimpleQueue()
+        artifacts = {folder: factory(folder) for folder in folders}
+        outbox.put(("inputs", cls._inputs_of(artifacts.values())))
+        load = Counter()
+        received = 0
+        stopped = asyncio.Event()
+        tasks = set()
+
+        def send():
+            while True:
+                message = outbox.get()
+                connection.send(message)
+                if message[0] == "stopped":
+                    break
+
+        def timed(artifact, stage: str, seconds: float):
+            load[artifact.repository_folder] += seconds
+
+        async def emitted(event: Event):
+            outbox.put(("emitted", event))
+
+        scheduler = None
+        if prioritize:
+            scheduler = CriticalPathScheduler(DependencyGraph.instance())
+        pipeline = StagePipeline(
+            list(artifacts.values()),
+            emitted,
+            chain=False,
+            onTimed=timed,
+            priority=None if scheduler is None else scheduler.priority,
+        )
+        if scheduler is not None:
+            pipeline.add_timed_listener(scheduler.record)
+        pipeline.start()
+
+        async def report_idle():
+            while True:
+                await pipeline.join()
+                if pipeline.idle():
+                    outbox.put(("idle", received, dict(load)))
+                    return
+                await asyncio.sleep(0)
+
+        async def handle(message):
+            nonlocal received
+            kind = message[0]
+            if kind == "event":
+                received += 1
+                WaveTracker.instance().adopt(message[1], message[2], message[3])
+                await pipeline.submit(message[1])
+                task = asyncio.create_task(report_idle())
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            elif kind == "inputs":
+                graph = DependencyGraph.instance()
+                for url, inputs in message[1].items():
+                    graph.update_inputs(url, inputs)
+                if scheduler is not None:
+                    scheduler.invalidate()
+            elif kind == "add":
+                artifacts[message[1]] = factory(message[1])
+                pipeline.add_artifact(artifacts[message[1]])
+            elif kind == "drop":
+                artifact = artifacts.pop(message[1], None)
+                if artifact is not None:
+                    pipeline.remove_artifact(artifact)
+                load.pop(message[1], None)
+            elif kind == "stop":
+                stopped.set()
+
+        def receive():
+            while True:
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    message = ("stop",)
+                # one message at a time: a full stage pushes back on the coordinator.
+                asyncio.run_coroutine_threadsafe(handle(message), loop).result()
+                if message[0] == "stop":
+                    break
+
+        sender = threading.Thread(target=send, daemon=True)
+        sender.start()
+        threading.Thread(target=receive, daemon=True).start()
+        await stopped.wait()
+        await pipeline.stop()
+        outbox.put(("stopped",))
+        await asyncio.to_thread(sender.join)
+
+    @classmethod
+    def benchmark(
+        cls,
+        factory: Callable[[str], object],
+        folders: List[str],
+        events: List[Event],
+        shardCounts: List[int] = None,
+    ) -> Dict[int, float]:
+        """
+        Measures how long the workspace takes to settle after given events, for several shard counts.
+        :param factory: Builds the artifact of a repository folder. Must be picklable.
+        :type factory: Callable[[str], pythoneda.shared.artifact.AbstractArtifact]
+        :param folders: The repository folders.
+        :type folders: List[str]
+        :param events: The events to inject.
+        :type events: List[pythoneda.shared.Event]
+        :param shardCounts: The shard counts to try. Defaults to powers of two up to the number of CPUs.
+        :type shardCounts: List[int]
+        :return: The elapsed seconds for each shard count, excluding process startup.
+        :rtype: Dict[int, float]
+        """
+        if shardCounts is None:
+            shardCounts = []
+            count = 1
+            while count <= cls.cpus():
+                shardCounts.append(count)
+                count *= 2
+        result = {}
+        for shards in shardCounts:
+            coordinator = cls(folders, factory, shards)
+            coordinator.start()
+            try:
+                started = time.monotonic()
+                for event in events:
+                    coordinator.submit(event)
+                coordinator.wait()
+                result[shards] = time.monotonic() - started
+            finally:
+                coordinator.stop()
+            ShardCoordinator.logger().info(
+                f"{shards} shards: {result[shards]:.3f}s for {len(events)} events"
+            )
+        return result
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
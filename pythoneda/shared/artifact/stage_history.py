@@ -0,0 +1,180 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/stage_history.py
+
+This file declares the StageHistory class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from .dependency_graph import DependencyGraph
+import json
+import os
+from pythoneda.shared import BaseObject
+import threading
+from typing import Dict, Tuple
+
+
+class StageHistory(BaseObject):
+    """
+    Remembers how long each cascade stage takes, per repository.
+
+    Class name: StageHistory
+
+    Responsibilities:
+        - Keep an exponentially weighted average of the duration of each stage of each repository.
+        - Estimate how long a whole release of a repository takes, falling back to the
+          average of the other repositories for stages it never ran.
+        - Persist itself as JSON, so estimates survive restarts.
+
+    Collaborators:
+        - pythoneda.shared.artifact.CriticalPathScheduler
+    """
+
+    _default_duration = 1.0
+
+    def __init__(self, alpha: float = 0.3):
+        """
+        Creates a new StageHistory instance.
+        :param alpha: The weight of the latest sample in the average.
+        :type alpha: float
+        """
+        super().__init__()
+        self._alpha = alpha
+        self._averages: Dict[str, Dict[str, float]] = {}
+        # running sums of the averages per stage, so the defaults never need a full scan.
+        self._totals: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, url: str, stage: str, seconds: float) -> Tuple[float, float]:
+        """
+        Records how long a stage took.
+        :param url: The url of the repository.
+        :type url: str
+        :param stage: The stage.
+        :type stage: str
+        :param seconds: The duration.
+        :type seconds: float
+        :return: How much the average of the stage of the repository changed, and how much
+        its average across repositories changed, relative to their previous values (1.0 if new).
+        :rtype: Tuple[float, float]
+        """
+        key = DependencyGraph.key_for(url)
+        with self._lock:
+            stages = self._averages.setdefault(key, {})
+            previous = stages.get(stage, None)
+            previous_default = self._default_of(stage)
+            if previous is None:
+                stages[stage] = seconds
+                self._totals[stage] = self._totals.get(stage, 0.0) + seconds
+                self._counts[stage] = self._counts.get(stage, 0) + 1
+                own = 1.0
+            else:
+                stages[stage] = previous + self._alpha * (seconds - previous)
+                self._totals[stage] += stages[stage] - previous
+                own = abs(stages[stage] - previous) / max(previous, 1e-6)
+            if previous_default is None:
+                return own, 1.0
+            return own, abs(self._default_of(stage) - previous_default) / max(
+                previous_default, 1e-6
+            )
+
+    def _default_of(self, stage: str) -> float:
+        """
+        Retrieves the average duration of given stage across repositories.
+        Expects the lock to be held.
+        :param stage: The stage.
+        :type stage: str
+        :return: Such average, or None if no repository ran it.
+        :rtype: float
+        """
+        count = self._counts.get(stage, 0)
+        if count == 0:
+            return None
+        return self._totals[stage] / count
+
+    def _stage_defaults(self) -> Dict[str, float]:
+        """
+        Retrieves the average duration of each stage across repositories.
+        Expects the lock to be held.
+        :return: Such averages.
+        :rtype: Dict[str, float]
+        """
+        return {stage: self._default_of(stage) for stage in self._counts}
+
+    def duration(self, url: str) -> float:
+        """
+        Estimates how long it takes to run all stages of given repository.
+        :param url: The url of the repository.
+        :type url: str
+        :return: The estimate, in seconds.
+        :rtype: float
+        """
+        key = DependencyGraph.key_for(url)
+        with self._lock:
+            defaults = self._stage_defaults()
+            own = self._averages.get(key, {})
+        if not defaults:
+            return self.__class__._default_duration
+        return sum(own.get(stage, seconds) for stage, seconds in defaults.items())
+
+    def save(self, path: str):
+        """
+        Writes the averages to given file.
+        :param path: The file.
+        :type path: str
+        """
+        with self._lock:
+            content = json.dumps(self._averages, sort_keys=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as file:
+            file.write(content)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, alpha: float = 0.3):
+        """
+        Reads the averages from given file.
+        :param path: The file.
+        :type path: str
+        :param alpha: The weight of the latest sample in the average.
+        :type alpha: float
+        :return: The history, empty if the file is missing or invalid.
+        :rtype: pythoneda.shared.artifact.StageHistory
+        """
+        result = cls(alpha)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                averages = json.load(file)
+        except (OSError, json.JSONDecodeError) as err:
+            StageHistory.logger().debug(f"Starting with an empty history: {err}")
+            return result
+        result._averages = averages
+        for stages in averages.values():
+            for stage, seconds in stages.items():
+                result._totals[stage] = result._totals.get(stage, 0.0) + seconds
+                result._counts[stage] = result._counts.get(stage, 0) + 1
+        return result
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -20,8 +20,22 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 from .artifact_event_listener import ArtifactEventListener
-from pythoneda.shared.artifact.events import ChangeStaged, TagPushed
-from pythoneda.shared.git import GitAdd, GitAddFailed, GitDiff, GitRepo
+import asyncio
+from .async_git import AsyncGit
+from .content_digest import ContentDigest
+from .dependency_graph import DependencyGraph
+from .flake_lock_updater import FlakeLockUpdater
+from .flake_template_cache import FlakeTemplateCache
+from .listener_logging import ListenerLogging
+import json
+import os
+from pythoneda.shared.artifact.events import Change, ChangeStaged, TagPushed
+from pythoneda.shared.nix.flake import NixFlake
+from .repository_folder_helper import RepositoryFolderHelper
+from .repository_watcher import RepositoryWatcher
+from .sha256_prefetcher import Sha256Prefetcher
+import tempfile
+from typing import Dict, Iterable, Tuple
 
 
 class StageInputUpdate(ArtifactEventListener):
@@ -32,8 +46,12 @@ class StageInputUpdate(ArtifactEventListener):
 
     Responsibilities:
         - Update flake input versions and stage the changes.
+        - Plan several input updates of the same flake as a single change.
+        - Check the relocked inputs against the hashes prefetched when they were tagged.
 
     Collaborators:
+        - pythoneda.shared.artifact.FlakeLockUpdater
+        - pythoneda.shared.artifact.Sha256Prefetcher
         - pythoneda.shared.artifact.events.ChangeStaged
     """
 
@@ -54,51 +72,231 @@ class StageInputUpdate(ArtifactEventListener):
         """
         if not self.enabled:
             return None
-        StageInputUpdate.logger().debug(f"Received {event}")
+        StageInputUpdate.logger().debug("Received %s", ListenerLogging.brief(event))
         return await self.stage(event.repository_url, event.tag, event.id)
 
     async def stage(self, url: str, tag: str, tagPushedId: str) -> ChangeStaged:
         """
-        Stages the changes of given files.
+        Stages the update of one input.
         :param url: The repository url of the dependency.
         :type url: str
         :param tag: The new tag of the dependency.
         :type tag: str
         :param tagPushedId: The id of the TagPushed event.
         :type tagPushedId: str
-        :return: An event notifying the change has been staged.
+        :return: An event notifying the change has been staged, or None if
+        the flake was already up to date.
         :rtype: pythoneda.shared.artifact.events.ChangeStaged
         """
-        StageInputUpdate.logger().info(f"Staging changes in input {self.folder}")
-        # 1. find out the repository folder from given url
-        dependency_folder = RepositoryFolderHelper.find_out_repository_folder(
-            self.folder, url
+        return await self.stage_bumps([(url, tag)], tagPushedId)
+
+    def validate_bumps(
+        self, bumps: Iterable[Tuple[str, str]]
+    ) -> Dict[str, Tuple[str, str]]:
+        """
+        Checks given input bumps.
+        :param bumps: The (repository url, tag) pairs.
+        :type bumps: Iterable[Tuple[str, str]]
+        :return: The bumps by dependency, or None if they are inconsistent.
+        :rtype: Dict[str, Tuple[str, str]]
+        """
+        result = {}
+        for url, tag in bumps:
+            if not url or not tag:
+                StageInputUpdate.logger().error("Invalid bump of %s to %s", url, tag)
+                return None
+            key = DependencyGraph.key_for(url)
+            previous = result.get(key, None)
+            if previous is not None and previous[1] != tag:
+                StageInputUpdate.logger().error(
+                    "Conflicting bumps of %s: %s and %s", key, previous[1], tag
+                )
+                return None
+            result[key] = (url, tag)
+        return result
+
+    async def stage_bumps(
+        self,
+        bumps: Iterable[Tuple[str, str]],
+        previousEventId: str = None,
+    ) -> ChangeStaged:
+        """
+        Updates several inputs at once, regenerating and relocking the flake only once.
+        :param bumps: The (repository url, tag) pairs of the dependencies.
+        :type bumps: Iterable[Tuple[str, str]]
+        :param previousEventId: The id of the event causing the bumps.
+        :type previousEventId: str
+        :return: An event notifying the change has been staged, or None if
+        the flake was already up to date or any dependency could not be resolved.
+        :rtype: pythoneda.shared.artifact.events.ChangeStaged
+        """
+        folder = self.repository_folder
+        plan = self.validate_bumps(bumps)
+        if not plan:
+            return None
+        StageInputUpdate.logger().info(
+            "Staging %d input updates in %s", len(plan), folder
+        )
+        # 1. find out the repository folders of the dependencies, and
+        # 2. create their artifact instances, concurrently
+        dependencies = await asyncio.gather(
+            *[
+                asyncio.to_thread(self.resolve_dependency, url, tag)
+                for url, tag in plan.values()
+            ]
+        )
+        if any(dependency is None for dependency in dependencies):
+            return None
+        # the hashes CommitTag prefetched, to check the relock against.
+        prefetched = await asyncio.gather(
+            *[self.prefetched_sha256(url, tag) for url, tag in plan.values()]
         )
 
-        # 2. Create the artifact instance of the dependency
-        artifact = NixFlake.from_folder(dependency_folder, tag)
+        # 3. update this artifact's inputs, replacing the old ones with the new versions
+        artifact = NixFlake.from_folder(
+            folder, RepositoryFolderHelper.find_out_version(folder)
+        )
+        for dependency in dependencies:
+            artifact.update_input(dependency.to_input())
 
-        # 3. update this artifact's inputs, replacing the old one with this new version
-        artifact.update_input(dependency.to_input())
+        # 4. serialize this artifact to nix flake, unless it's already up to date
+        flake_changed = self.generate_flake_if_changed(artifact, folder)
 
-        # 4. serialize this artifact to nix flake
-        artifact.generate_flake(self.folder)
+        # 5. update flake.lock, unless flake.nix didn't change
+        lock_changed = False
+        lock_file = os.path.join(folder, "flake.lock")
+        if flake_changed or not os.path.exists(lock_file):
+            # run in the shared pool, in parallel with the other dependents.
+            lock_changed = await FlakeLockUpdater.instance().update_lock(folder)
+            if lock_changed is None:
+                return None
+            if lock_changed:
+                RepositoryWatcher.own_write(lock_file)
+            if not self.verify_locked_hashes(lock_file, prefetched):
+                return None
 
-        # 5. update flake.lock
-        NixFlake.update_flake_lock(self.folder)
+        if not flake_changed and not lock_changed:
+            StageInputUpdate.logger().info(
+                "%s already uses %s: nothing to stage",
+                folder,
+                ", ".join(f"{url} {tag}" for url, tag in plan.values()),
+            )
+            return None
 
         # 6. retrieve the Change
+        git = AsyncGit.instance()
         change = Change.from_unidiff_text(
-            GitDiff(self.folder).diff(),
-            artifact.repository_url,
-            artifact.branch,
-            self.folder,
+            await git.diff(folder),
+            self.repository_url,
+            await git.current_branch(folder),
+            folder,
         )
 
         # 7. create the event
-        result = ChangeStaged(change, tagPushedId)
+        result = ChangeStaged(change, previousEventId)
+
+        return result
+
+    def resolve_dependency(self, url: str, tag: str) -> NixFlake:
+        """
+        Builds the flake of a dependency at given tag, from its cloned repository.
+        :param url: The repository url of the dependency.
+        :type url: str
+        :param tag: The tag.
+        :type tag: str
+        :return: The flake, or None if the repository is not cloned.
+        :rtype: pythoneda.shared.nix.flake.NixFlake
+        """
+        dependency_folder = RepositoryFolderHelper.find_out_repository_folder(
+            self.repository_folder, url
+        )
+        if dependency_folder is None:
+            StageInputUpdate.logger().error("Could not find the clone of %s", url)
+            return None
+        return NixFlake.from_folder(dependency_folder, tag)
 
+    async def prefetched_sha256(self, url: str, tag: str) -> Tuple[str, str]:
+        """
+        Retrieves the hash of the sources of a dependency at given tag, if it was prefetched.
+        :param url: The repository url of the dependency.
+        :type url: str
+        :param tag: The tag.
+        :type tag: str
+        :return: The tagged revision and its sha256, or None if unknown.
+        :rtype: Tuple[str, str]
+        """
+        dependency_folder = RepositoryFolderHelper.find_out_repository_folder(
+            self.repository_folder, url
+        )
+        if dependency_folder is None:
+            return None
+        tagged = self.tagged_revision(dependency_folder, tag)
+        if tagged is None:
+            return None
+        rev = tagged[1]
+        sha256 = await Sha256Prefetcher.instance().lookup(url, tag, rev)
+        return None if sha256 is None else (rev, sha256)
+
+    def verify_locked_hashes(
+        self, lockFile: str, prefetched: Iterable[Tuple[str, str]]
+    ) -> bool:
+        """
+        Checks the narHash nix locked for each bumped revision matches the prefetched one.
+        :param lockFile: The flake.lock file.
+        :type lockFile: str
+        :param prefetched: The (revision, sha256) pairs, or None for the unknown ones.
+        :type prefetched: Iterable[Tuple[str, str]]
+        :return: False if any of them differs.
+        :rtype: bool
+        """
+        expected = dict(entry for entry in prefetched if entry is not None)
+        if not expected:
+            return True
+        try:
+            with open(lockFile, "r", encoding="utf-8") as file:
+                nodes = json.load(file).get("nodes", {})
+        except (OSError, ValueError) as err:
+            StageInputUpdate.logger().error("Could not read %s: %s", lockFile, err)
+            return False
+        for name, node in nodes.items():
+            locked = node.get("locked", {}) if isinstance(node, dict) else {}
+            sha256 = expected.get(locked.get("rev", None), None)
+            if sha256 is not None and locked.get("narHash", None) != sha256:
+                StageInputUpdate.logger().error(
+                    "Input %s in %s locked %s as %s, but its sources hash to %s",
+                    name,
+                    lockFile,
+                    locked.get("rev"),
+                    locked.get("narHash"),
+                    sha256,
+                )
+                return False
+        return True
+
+    def generate_flake_if_changed(self, artifact: NixFlake, folder: str) -> bool:
+        """
+        Generates the flake of given artifact, and writes it only if it differs
+        from the one already in the folder.
+        :param artifact: The artifact.
+        :type artifact: pythoneda.shared.nix.flake.NixFlake
+        :param folder: The artifact's repository folder.
+        :type folder: str
+        :return: True if flake.nix changed.
+        :rtype: bool
+        """
+        flake_file = os.path.join(folder, "flake.nix")
+        with tempfile.TemporaryDirectory(prefix="flake-") as tmp:
+            FlakeTemplateCache.instance().generate_flakes([(artifact, tmp)])
+            with open(os.path.join(tmp, "flake.nix"), "rb") as file:
+                content = file.read()
+        result = ContentDigest.of_bytes(content) != ContentDigest.of_file(flake_file)
+        if result:
+            with open(flake_file, "wb") as file:
+                file.write(content)
+            RepositoryWatcher.own_write(flake_file)
         return result
+
+
 # vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
 # Local Variables:
 # mode: python
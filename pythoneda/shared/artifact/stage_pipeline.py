@@ -0,0 +1,322 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/stage_pipeline.py
+
+This file declares the StagePipeline class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+import itertools
+import os
+from pythoneda.shared import BaseObject, Event
+from pythoneda.shared.artifact.events import (
+    ChangeStaged,
+    CommittedChangesPushed,
+    CommittedChangesTagged,
+    StagedChangesCommitted,
+    TagPushed,
+)
+import time
+from typing import Awaitable, Callable, Dict, List
+
+
+class StagePipeline(BaseObject):
+    """
+    Runs the release cascade through bounded queues, one per stage.
+
+    Class name: StagePipeline
+
+    Responsibilities:
+        - Hand each event to the stage that reacts to it, for every artifact.
+        - Run each stage with a fixed number of workers.
+        - Block producers while the queue of the next stage is full, so a fast stage
+          cannot swamp a slow one.
+        - Feed the events closing the cascade (e.g. ChangeStaged) back to their stage,
+          without blocking the worker that emitted them.
+
+    Collaborators:
+        - pythoneda.shared.artifact.AbstractArtifact
+    """
+
+    # name, event it reacts to, artifact method, default worker count.
+    # commits of the same repository are batched and serialized by CommitBatcher, so
+    # the commit stage needs enough workers for batches of different repositories.
+    _stages = (
+        ("commit", ChangeStaged, "commit_after_ChangeStaged", 4),
+        ("push", StagedChangesCommitted, "push_commit_after_StagedChangesCommitted", 2),
+        ("tag", CommittedChangesPushed, "create_tag_after_CommittedChangesPushed", 1),
+        ("push_tag", CommittedChangesTagged, "push_tag_after_CommittedChangesTagged", 2),
+        ("update_inputs", TagPushed, "maybe_update_flake_after_TagPushed", 4),
+    )
+    _default_capacity = 32
+
+    def __init__(
+        self,
+        artifacts: List,
+        onEmitted: Callable[[Event], Awaitable] = None,
+        workers: Dict[str, int] = None,
+        capacity: int = None,
+        chain: bool = True,
+        onTimed: Callable[[object, str, float], None] = None,
+        priority: Callable[[object, Event], float] = None,
+    ):
+        """
+        Creates a new StagePipeline instance.
+        :param artifacts: The artifacts reacting to the events.
+        :type artifacts: List[pythoneda.shared.artifact.AbstractArtifact]
+        :param onEmitted: The coroutine to notify every emitted event to.
+        :type onEmitted: Callable[[pythoneda.shared.Event], Awaitable]
+        :param workers: The number of workers of each stage, by name. Defaults to
+        PYTHONEDA_STAGE_WORKERS_<NAME>, or a per-stage default.
+        :type workers: Dict[str, int]
+        :param capacity: The size of each queue. Defaults to PYTHONEDA_STAGE_QUEUE_SIZE, or 32.
+        :type capacity: int
+        :param chain: Whether emitted events are enqueued in the stage reacting to them.
+        Disable it when someone else (e.g. a ShardCoordinator) routes the notified events back.
+        :type chain: bool
+        :param onTimed: Gets notified of how long each job that emitted an event took: artifact,
+        stage name and seconds.
+        More listeners can be added with add_timed_listener.
+        :type onTimed: Callable[[pythoneda.shared.artifact.AbstractArtifact, str, float], None]
+        :param priority: Ranks the jobs waiting in each stage, lowest first (e.g.
+        CriticalPathScheduler.priority). Jobs run in arrival order if omitted.
+        :type priority: Callable[[pythoneda.shared.artifact.AbstractArtifact, pythoneda.shared.Event], float]
+        """
+        super().__init__()
+        self._artifacts = list(artifacts)
+        self._on_emitted = onEmitted
+        self._chain = chain
+        self._timed_listeners = [] if onTimed is None else [onTimed]
+        self._priority = priority
+        self._sequence = itertools.count()
+        if capacity is None:
+            capacity = int(
+                os.environ.get(
+                    "PYTHONEDA_STAGE_QUEUE_SIZE", StagePipeline._default_capacity
+                )
+            )
+        self._capacity = capacity
+        self._workers = {}
+        for name, _, _, default in StagePipeline._stages:
+            count = (workers or {}).get(name, None)
+            if count is None:
+                count = int(
+                    os.environ.get(f"PYTHONEDA_STAGE_WORKERS_{name.upper()}", default)
+                )
+            self._workers[name] = max(count, 1)
+        self._queues = {}
+        self._tasks = []
+        self._pending = 0
+        self._feeding = set()
+
+    def add_timed_listener(self, listener: Callable[[object, str, float], None]):
+        """
+        Notifies given listener of how long each job that emits an event takes, besides the
+        existing ones.
+        :param listener: The listener: artifact, stage name and seconds.
+        :type listener: Callable[[pythoneda.shared.artifact.AbstractArtifact, str, float], None]
+        """
+        self._timed_listeners.append(listener)
+
+    def add_artifact(self, artifact):
+        """
+        Starts feeding events to given artifact.
+        :param artifact: The artifact.
+        :type artifact: pythoneda.shared.artifact.AbstractArtifact
+        """
+        self._artifacts.append(artifact)
+
+    def remove_artifact(self, artifact):
+        """
+        Stops feeding events to given artifact. Jobs already queued for it still run.
+        :param artifact: The artifact.
+        :type artifact: pythoneda.shared.artifact.AbstractArtifact
+        """
+        self._artifacts.remove(artifact)
+
+    def stage_of(self, event: Event) -> int:
+        """
+        Retrieves the position of the stage reacting to given event.
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        :return: Such position, or None if no stage reacts to it.
+        :rtype: int
+        """
+        for index, (_, event_class, _, _) in enumerate(StagePipeline._stages):
+            if isinstance(event, event_class):
+                return index
+        return None
+
+    def start(self):
+        """
+        Creates the queues and starts the workers. Must be called from within a running event loop.
+        """
+        for index, (name, _, _, _) in enumerate(StagePipeline._stages):
+            if self._priority is None:
+                self._queues[index] = asyncio.Queue(maxsize=self._capacity)
+            else:
+                self._queues[index] = asyncio.PriorityQueue(maxsize=self._capacity)
+            for _ in range(self._workers[name]):
+                self._tasks.append(asyncio.create_task(self._work(index)))
+        StagePipeline.logger().debug(
+            "Started stages %s with queues of %d", self._workers, self._capacity
+        )
+
+    async def submit(self, event: Event):
+        """
+        Enqueues given event for every artifact, waiting while its stage is full.
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        """
+        index = self.stage_of(event)
+        if index is None:
+            StagePipeline.logger().warning("No stage reacts to %s", event.__class__)
+            return
+        await self._enqueue(index, event)
+
+    async def _enqueue(self, index: int, event: Event):
+        """
+        Enqueues given event in given stage, once per artifact.
+        :param index: The position of the stage.
+        :type index: int
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        """
+        queue = self._queues[index]
+        for artifact in list(self._artifacts):
+            self._pending += 1
+            if self._priority is None:
+                await queue.put((artifact, event))
+            else:
+                # the sequence keeps equal priorities in arrival order.
+                await queue.put(
+                    (
+                        self._priority(artifact, event),
+                        next(self._sequence),
+                        artifact,
+                        event,
+                    )
+                )
+
+    async def _work(self, index: int):
+        """
+        Processes the jobs of given stage, forever.
+        :param index: The position of the stage.
+        :type index: int
+        """
+        name, _, method, _ = StagePipeline._stages[index]
+        queue = self._queues[index]
+        while True:
+            artifact, event = (await queue.get())[-2:]
+            started = time.monotonic()
+            try:
+                result = await getattr(artifact, method)(event)
+                if result is not None:
+                    # most jobs are artifacts ignoring someone else's event: timing
+                    # those would drag the averages towards zero.
+                    elapsed = time.monotonic() - started
+                    for listener in self._timed_listeners:
+                        listener(artifact, name, elapsed)
+                    await self._emit(index, result)
+            except Exception as err:
+                StagePipeline.logger().error(
+                    "Stage %s failed on %s for %s: %s",
+                    name,
+                    event.__class__.__name__,
+                    artifact.__class__.__name__,
+                    err,
+                )
+            finally:
+                self._pending -= 1
+                queue.task_done()
+
+    async def _emit(self, index: int, event: Event):
+        """
+        Forwards an event emitted by given stage.
+        Events for a later stage are enqueued, blocking while it's full. Events for the same or
+        an earlier stage (e.g. the ChangeStaged closing the cascade) are enqueued in the
+        background: waiting for a full upstream queue would let the pipeline deadlock.
+        :param index: The position of the stage that emitted it.
+        :type index: int
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        """
+        if self._on_emitted is not None:
+            await self._on_emitted(event)
+        target = self.stage_of(event)
+        if not self._chain or target is None:
+            return
+        if target > index:
+            await self._enqueue(target, event)
+        else:
+            task = asyncio.create_task(self._enqueue(target, event))
+            self._feeding.add(task)
+            task.add_done_callback(self._feeding.discard)
+
+    async def join(self):
+        """
+        Waits until all queues are drained, including the jobs fed back upstream.
+        """
+        while True:
+            if self._feeding:
+                await asyncio.gather(*list(self._feeding), return_exceptions=True)
+            for index in sorted(self._queues):
+                await self._queues[index].join()
+            # a later stage may have fed an earlier one meanwhile.
+            if not self._feeding and self._pending == 0:
+                break
+
+    def idle(self) -> bool:
+        """
+        Checks whether no job is queued or running.
+        :return: True in such case.
+        :rtype: bool
+        """
+        return self._pending == 0
+
+    async def stop(self):
+        """
+        Stops the workers, discarding the pending jobs.
+        """
+        tasks = self._tasks + list(self._feeding)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._feeding = set()
+        self._queues = {}
+
+    def backlog(self) -> Dict[str, int]:
+        """
+        Retrieves how many jobs wait in each stage.
+        :return: The queue sizes, by stage name.
+        :rtype: Dict[str, int]
+        """
+        return {
+            StagePipeline._stages[index][0]: queue.qsize()
+            for index, queue in self._queues.items()
+        }
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
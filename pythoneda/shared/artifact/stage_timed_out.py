@@ -0,0 +1,87 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/stage_timed_out.py
+
+This file declares the StageTimedOut class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+class StageTimedOut(Exception):
+    """
+    A pipeline stage did not finish before its deadline.
+
+    Class name: StageTimedOut
+
+    Responsibilities:
+        - Report which stage got stuck, where, and for how long it was allowed to run.
+
+    Collaborators:
+        - pythoneda.shared.artifact.Deadline
+    """
+
+    def __init__(self, stage: str, folder: str, timeout: float):
+        """
+        Creates a new StageTimedOut instance.
+        :param stage: The stage.
+        :type stage: str
+        :param folder: The repository folder.
+        :type folder: str
+        :param timeout: The time it was allowed to run, in seconds.
+        :type timeout: float
+        """
+        super().__init__(f"{stage} in {folder} timed out after {timeout:.1f}s")
+        self._stage = stage
+        self._folder = folder
+        self._timeout = timeout
+
+    @property
+    def stage(self) -> str:
+        """
+        Retrieves the stage that timed out.
+        :return: Such stage.
+        :rtype: str
+        """
+        return self._stage
+
+    @property
+    def folder(self) -> str:
+        """
+        Retrieves the repository folder.
+        :return: Such folder.
+        :rtype: str
+        """
+        return self._folder
+
+    @property
+    def timeout(self) -> float:
+        """
+        Retrieves the time the stage was allowed to run.
+        :return: Such time, in seconds.
+        :rtype: float
+        """
+        return self._timeout
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
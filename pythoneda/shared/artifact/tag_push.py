@@ -20,8 +20,13 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 from .artifact_event_listener import ArtifactEventListener
+from .async_git import AsyncGit
+from .listener_logging import ListenerLogging
+from .release_journal import ReleaseJournal
 from pythoneda.shared.artifact.events import CommittedChangesTagged, TagPushed
-from pythoneda.shared.git import GitPush, GitPushFailed
+from .stage_timed_out import StageTimedOut
+import subprocess
+from .version_allocator import VersionAllocator
 
 
 class TagPush(ArtifactEventListener):
@@ -59,9 +64,14 @@ class TagPush(ArtifactEventListener):
         if not self.enabled:
             return None
         result = None
-        TagPush.logger().debug(f"Received {event}")
+        TagPush.logger().debug("Received %s", ListenerLogging.brief(event))
         pushed = await self.push_tags(event.repository_folder)
         if pushed:
+            # the release of this commit is over: nothing left to resume.
+            ReleaseJournal.for_folder(event.repository_folder).close(event.commit)
+            tagged_folder = self.tagged_folder(event.repository_folder)
+            if tagged_folder is not None:
+                await VersionAllocator.for_folder(tagged_folder).release(event.tag)
             result = TagPushed(
                 event.tag,
                 event.commit,
@@ -70,7 +80,7 @@ class TagPush(ArtifactEventListener):
                 event.repository_folder,
                 event.id,
             )
-            print(result)
+            TagPush.logger().info("Pushed %s", ListenerLogging.brief(result))
         return result
 
     async def push_tags(self, folder: str) -> bool:
@@ -82,10 +92,15 @@ class TagPush(ArtifactEventListener):
         :rtype: bool
         """
         try:
-            GitPush(folder).push_tags()
+            await AsyncGit.instance().push_tags(folder)
             result = True
-        except GitPushFailed as err:
-            TagPush.logger().error(err)
+        except subprocess.CalledProcessError as err:
+            TagPush.logger().error(err.stderr)
+            result = False
+        except StageTimedOut as err:
+            TagPush.logger().error(
+                "Gave up pushing in %s: stuck in %s", folder, err.stage
+            )
             result = False
         return result
 # vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
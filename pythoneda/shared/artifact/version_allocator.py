@@ -0,0 +1,261 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/version_allocator.py
+
+This file declares the VersionAllocator class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+import fcntl
+import json
+import os
+from pythoneda.shared import BaseObject
+from pythoneda.shared.git import Version
+import re
+from .repository_folder_helper import RepositoryFolderHelper
+import socket
+import threading
+import time
+from typing import Awaitable, Callable, Dict
+
+
+class VersionAllocator(BaseObject):
+    """
+    Hands out the next version of a repository to one tagger at a time.
+
+    Class name: VersionAllocator
+
+    Responsibilities:
+        - Hold an exclusive, per-repository lock file (fcntl) from the moment the next
+          version is computed until it's tagged, across threads and processes.
+        - Record who reserved which version, and skip versions reserved by a live holder,
+          until the tag is pushed if asked to.
+        - Drop the reservations of holders that died.
+
+    Collaborators:
+        - pythoneda.shared.artifact.ArtifactEventListener
+    """
+
+    _allocators = {}
+    _allocators_lock = threading.Lock()
+    _last_number = re.compile(r"(\d+)(?!.*\d)")
+
+    def __init__(self, folder: str):
+        """
+        Creates a new VersionAllocator instance.
+        :param folder: The repository folder.
+        :type folder: str
+        """
+        super().__init__()
+        self._folder = folder
+        git_dir = RepositoryFolderHelper.git_dir(folder) or os.path.join(folder, ".git")
+        self._lock_path = os.path.join(git_dir, "pythoneda", "version.lock")
+        self._reservations_path = os.path.join(
+            git_dir, "pythoneda", "version-reservations.json"
+        )
+
+    @classmethod
+    def for_folder(cls, folder: str):
+        """
+        Retrieves the allocator of given repository folder.
+        :param folder: The repository folder.
+        :type folder: str
+        :return: The allocator.
+        :rtype: pythoneda.shared.artifact.VersionAllocator
+        """
+        key = os.path.abspath(folder)
+        with cls._allocators_lock:
+            result = cls._allocators.get(key, None)
+            if result is None:
+                result = cls(key)
+                cls._allocators[key] = result
+        return result
+
+    async def _acquire(self) -> int:
+        """
+        Waits for the lock file of the repository.
+        Polls a non-blocking flock, so a cancelled waiter never ends up holding it.
+        :return: The file descriptor holding the lock.
+        :rtype: int
+        """
+        os.makedirs(os.path.dirname(self._lock_path), exist_ok=True)
+        fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+        delay = 0.01
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except BlockingIOError:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 0.25)
+        except BaseException:
+            os.close(fd)
+            raise
+
+    def _release(self, fd: int):
+        """
+        Releases the lock file.
+        :param fd: The file descriptor holding it.
+        :type fd: int
+        """
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def _load(self) -> Dict[str, Dict]:
+        """
+        Reads the reservations, dropping those of dead holders on this host.
+        :return: The reservations, by version.
+        :rtype: Dict[str, Dict]
+        """
+        result = {}
+        try:
+            with open(self._reservations_path, "r", encoding="utf-8") as file:
+                result = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            pass
+        host = socket.gethostname()
+        for version, holder in list(result.items()):
+            if holder.get("host") == host and not self._alive(holder.get("pid", 0)):
+                VersionAllocator.logger().warning(
+                    f"Dropping reservation of {version} in {self._folder}: process {holder.get('pid')} is gone"
+                )
+                del result[version]
+        return result
+
+    def _save(self, reservations: Dict[str, Dict]):
+        """
+        Writes the reservations atomically.
+        :param reservations: The reservations, by version.
+        :type reservations: Dict[str, Dict]
+        """
+        tmp = f"{self._reservations_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as file:
+            json.dump(reservations, file, sort_keys=True)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, self._reservations_path)
+
+    @classmethod
+    def _alive(cls, pid: int) -> bool:
+        """
+        Checks whether given process is still running.
+        :param pid: The process id.
+        :type pid: int
+        :return: True in such case.
+        :rtype: bool
+        """
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return pid > 0
+
+    @classmethod
+    def next_patch(cls, value: str) -> str:
+        """
+        Bumps the last number of given version.
+        :param value: The version, e.g. 0.0.41.
+        :type value: str
+        :return: The next one, e.g. 0.0.42.
+        :rtype: str
+        """
+        return cls._last_number.sub(lambda m: str(int(m.group(1)) + 1), value, count=1)
+
+    @asynccontextmanager
+    async def allocate(
+        self, propose: Callable[[], Awaitable[Version]], keep: bool = False
+    ):
+        """
+        Holds the repository lock and reserves its next version for the duration of the block.
+        Taggers of other repositories are not affected; taggers of this one wait their turn.
+        :param propose: Computes the next version, e.g. AsyncGit.increase_patch. Called with the lock held.
+        :type propose: Callable[[], Awaitable[pythoneda.shared.git.Version]]
+        :param keep: Whether the reservation outlives the block, until `release` is called
+        (e.g. once the tag is pushed).
+        :type keep: bool
+        :return: The reserved version, or None if none could be proposed.
+        :rtype: pythoneda.shared.git.Version
+        """
+        fd = await self._acquire()
+        version = None
+        try:
+            version = await propose()
+            if version is not None:
+                reservations = self._load()
+                value = version.value
+                while value in reservations:
+                    value = self.next_patch(value)
+                if value != version.value:
+                    VersionAllocator.logger().info(
+                        f"{version.value} is taken in {self._folder}: using {value}"
+                    )
+                    version = Version(value)
+                reservations[value] = {
+                    "host": socket.gethostname(),
+                    "pid": os.getpid(),
+                    "thread": threading.get_ident(),
+                    "at": time.time(),
+                }
+                self._save(reservations)
+            yield version
+        except BaseException:
+            if version is not None:
+                self._forget(version.value)
+                version = None
+            raise
+        finally:
+            if version is not None and not keep:
+                self._forget(version.value)
+            self._release(fd)
+
+    def _forget(self, value: str):
+        """
+        Drops the reservation of given version. Requires the lock.
+        :param value: The version.
+        :type value: str
+        """
+        reservations = self._load()
+        if reservations.pop(value, None) is not None:
+            self._save(reservations)
+
+    async def release(self, value: str):
+        """
+        Drops the reservation of given version, kept when it was allocated.
+        :param value: The version.
+        :type value: str
+        """
+        fd = await self._acquire()
+        try:
+            self._forget(value)
+        finally:
+            self._release(fd)
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
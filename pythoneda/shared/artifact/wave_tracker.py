@@ -0,0 +1,172 @@
+# vim: set fileencoding=utf-8
+"""
+pythoneda/shared/artifact/wave_tracker.py
+
+This file declares the WaveTracker class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from collections import OrderedDict
+from pythoneda.shared import BaseObject, Event
+import threading
+import time
+
+
+class WaveTracker(BaseObject):
+    """
+    Tracks the causal chain of the events of each release wave.
+
+    Class name: WaveTracker
+
+    Responsibilities:
+        - Find out the wave an event belongs to, following the chain of previous event ids
+          of every event of the cascade.
+        - Make sure no artifact reacts twice to the same change within a wave.
+        - Adopt the wave another process (e.g. a ShardCoordinator) found out for an event.
+
+    Collaborators:
+        - pythoneda.shared.artifact.AbstractArtifact
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+    _default_capacity = 100000
+
+    def __init__(self, capacity: int = None):
+        """
+        Creates a new WaveTracker instance.
+        :param capacity: How many events and visits to remember.
+        :type capacity: int
+        """
+        super().__init__()
+        self._capacity = capacity or WaveTracker._default_capacity
+        self._roots = OrderedDict()
+        self._visits = OrderedDict()
+        self._started = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        """
+        Retrieves the process-wide tracker.
+        :return: The tracker.
+        :rtype: pythoneda.shared.artifact.WaveTracker
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    def _remember(self, entries: OrderedDict, key, value):
+        """
+        Stores given entry, forgetting the oldest ones beyond the capacity.
+        :param entries: The entries.
+        :type entries: collections.OrderedDict
+        :param key: The key.
+        :type key: Any
+        :param value: The value.
+        :type value: Any
+        """
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self._capacity:
+            entries.popitem(last=False)
+
+    def wave_of(self, event: Event) -> str:
+        """
+        Retrieves the id of the event that started the wave of given event.
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        :return: The id of the first event of the chain.
+        :rtype: str
+        """
+        with self._lock:
+            result = self._roots.get(event.id, None)
+            if result is None:
+                result = event.id
+                for previous in event.previous_event_ids or []:
+                    result = self._roots.get(previous, previous)
+                    break
+                self._remember(self._roots, event.id, result)
+                if result not in self._started:
+                    self._remember(self._started, result, time.monotonic())
+        return result
+
+    def adopt(self, event: Event, wave: str, startedAt: float):
+        """
+        Records the wave of given event, as found out by a process that saw its whole chain.
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        :param wave: The id of the first event of its chain.
+        :type wave: str
+        :param startedAt: When the wave started, as per time.monotonic(), which all
+        processes of the same host share.
+        :type startedAt: float
+        """
+        with self._lock:
+            self._remember(self._roots, event.id, wave)
+            if wave not in self._started:
+                self._remember(self._started, wave, startedAt)
+
+    def started_at(self, event: Event) -> float:
+        """
+        Retrieves when this process first saw the wave of given event.
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        :return: Such instant, as per time.monotonic().
+        :rtype: float
+        """
+        wave = self.wave_of(event)
+        with self._lock:
+            result = self._started.get(wave, None)
+            if result is None:
+                result = time.monotonic()
+                self._remember(self._started, wave, result)
+        return result
+
+    def first_visit(self, event: Event, folder: str, subject: str) -> bool:
+        """
+        Records given artifact reacts to a change in given subject, within the
+        wave of given event.
+        :param event: The event.
+        :type event: pythoneda.shared.Event
+        :param folder: The repository folder of the artifact.
+        :type folder: str
+        :param subject: What changed, e.g. the url of the input that got a new tag.
+        :type subject: str
+        :return: False if the artifact already reacted to it in this wave.
+        :rtype: bool
+        """
+        wave = self.wave_of(event)
+        key = (wave, folder, subject)
+        with self._lock:
+            result = key not in self._visits
+            self._remember(self._visits, key, True)
+        if not result:
+            WaveTracker.logger().warning(
+                f"{folder} already reacted to {subject} in wave {wave}: skipping it to break a cycle"
+            )
+        return result
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,96 @@
+# vim: set fileencoding=utf-8
+"""
+tests/test_commit_batcher.py
+
+This file tests the CommitBatcher class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+from pythoneda.shared.artifact import CommitBatcher, StageTimedOut
+
+
+def stuck(started: asyncio.Event):
+    """
+    Builds a commit callable that times out once the next batch is waiting.
+    :param started: Set when the commit starts.
+    :type started: asyncio.Event
+    :return: Such callable.
+    :rtype: Callable
+    """
+
+    async def commit(folder, batch):
+        started.set()
+        await asyncio.sleep(0.05)
+        raise StageTimedOut("commit", folder, 0.05)
+
+    return commit
+
+
+async def committed(folder, batch):
+    """
+    Commits a batch, returning what it committed.
+    :param folder: The repository folder.
+    :type folder: str
+    :param batch: The events in the batch.
+    :type batch: List
+    :return: The events.
+    :rtype: List
+    """
+    return list(batch)
+
+
+def test_a_timed_out_batch_does_not_fail_the_next_one(tmp_path):
+    batcher = CommitBatcher(window=0)
+    folder = str(tmp_path)
+
+    async def scenario():
+        started = asyncio.Event()
+        first = asyncio.ensure_future(batcher.submit(folder, "a", stuck(started)))
+        await started.wait()
+        second = await batcher.submit(folder, "b", committed)
+        return await first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert first is None
+    assert second == ["b"]
+
+
+def test_events_joining_a_timed_out_batch_get_nothing(tmp_path):
+    batcher = CommitBatcher(window=0.05)
+    folder = str(tmp_path)
+
+    async def scenario():
+        started = asyncio.Event()
+        return await asyncio.gather(
+            batcher.submit(folder, "a", stuck(started)),
+            batcher.submit(folder, "b", committed),
+        )
+
+    results = asyncio.run(scenario())
+
+    assert results == [None, None]
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,95 @@
+# vim: set fileencoding=utf-8
+"""
+tests/test_deadline.py
+
+This file tests the Deadline class, against shell commands.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+import os
+from pythoneda.shared.artifact import Deadline, StageTimedOut
+import pytest
+import subprocess
+import sys
+import time
+
+
+def is_gone(pid: int) -> bool:
+    """
+    Checks whether given process has exited.
+    :param pid: The process id.
+    :type pid: int
+    :return: True if it no longer runs.
+    :rtype: bool
+    """
+    if not os.path.exists(f"/proc/{pid}"):
+        return True
+    return "Z" in open(f"/proc/{pid}/stat").read().split(")")[1].split()[0]
+
+
+def test_spawn_kills_the_whole_process_group(tmp_path, monkeypatch):
+    monkeypatch.setenv("PYTHONEDA_TIMEOUT_GIT", "0.3")
+    script = f'sleep 30 & echo $! > "{tmp_path}/child"; wait'
+
+    started = time.monotonic()
+    with pytest.raises(StageTimedOut):
+        asyncio.run(Deadline.spawn("push", ["sh", "-c", script], str(tmp_path)))
+
+    assert time.monotonic() - started < 10
+    time.sleep(0.1)
+    assert is_gone(int((tmp_path / "child").read_text()))
+
+
+def test_run_kills_the_whole_process_group(tmp_path, monkeypatch):
+    monkeypatch.setenv("PYTHONEDA_TIMEOUT_SCRIPT", "0.3")
+    script = f'sleep 30 & echo $! > "{tmp_path}/child"; wait'
+
+    with pytest.raises(StageTimedOut):
+        Deadline.run("script", ["sh", "-c", script], str(tmp_path))
+
+    time.sleep(0.1)
+    assert is_gone(int((tmp_path / "child").read_text()))
+
+
+def test_spawn_leaves_other_processes_alone(tmp_path, monkeypatch):
+    monkeypatch.setenv("PYTHONEDA_TIMEOUT_GIT", "0.3")
+    bystander = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        with pytest.raises(StageTimedOut):
+            asyncio.run(Deadline.spawn("git", ["sleep", "30"], str(tmp_path)))
+        assert bystander.poll() is None
+    finally:
+        bystander.kill()
+        bystander.wait()
+
+
+def test_spawn_returns_the_output(tmp_path):
+    result = asyncio.run(
+        Deadline.spawn("git", ["sh", "-c", "cat; echo err >&2"], str(tmp_path), input="in")
+    )
+
+    assert (result.returncode, result.stdout, result.stderr) == (0, "in", "err\n")
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
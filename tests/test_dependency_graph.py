@@ -0,0 +1,166 @@
+# vim: set fileencoding=utf-8
+"""
+tests/test_dependency_graph.py
+
+This file tests the DependencyGraph class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from pythoneda.shared.artifact import DependencyGraph
+
+
+def url(name: str) -> str:
+    """
+    Builds the url of a test repository.
+    :param name: The repository name.
+    :type name: str
+    :return: The url.
+    :rtype: str
+    """
+    return f"https://github.com/o/{name}"
+
+
+def graph(edges) -> DependencyGraph:
+    """
+    Builds a graph.
+    :param edges: The inputs of each artifact, by name.
+    :type edges: Dict[str, List[str]]
+    :return: The graph.
+    :rtype: pythoneda.shared.artifact.DependencyGraph
+    """
+    result = DependencyGraph()
+    for name, inputs in edges.items():
+        result.update_inputs(url(name), [url(aux) for aux in inputs])
+    return result
+
+
+def diamond() -> DependencyGraph:
+    """
+    Builds a diamond: left and right use base, and top uses both.
+    :return: The graph.
+    :rtype: pythoneda.shared.artifact.DependencyGraph
+    """
+    return graph(
+        {"base": [], "left": ["base"], "right": ["base"], "top": ["left", "right"]}
+    )
+
+
+def test_a_diamond_lists_its_top_once_after_both_sides():
+    result = diamond().dependents_of(url("base"))
+
+    assert result == [("o/left", 1), ("o/right", 1), ("o/top", 2)]
+
+
+def test_input_urls_of_any_version_map_to_the_same_node():
+    result = graph({"base": [], "app": ["base"]})
+
+    result.update_inputs(url("other"), ["github:o/base/0.0.7"])
+
+    assert result.direct_dependents_of(url("base")) == {"o/app", "o/other"}
+
+
+def test_adding_an_edge_invalidates_the_closures_it_extends(monkeypatch):
+    result = diamond()
+    computed = []
+    compute = result._compute_closure
+    monkeypatch.setattr(
+        result, "_compute_closure", lambda root: computed.append(root) or compute(root)
+    )
+    assert result.dependents_of(url("base"))[-1] == ("o/top", 2)
+    assert result.dependents_of(url("top")) == []
+    computed.clear()
+
+    result.update_inputs(url("app"), [url("top")])
+
+    assert result.dependents_of(url("base"))[-1] == ("o/app", 3)
+    assert result.dependents_of(url("top")) == [("o/app", 1)]
+    assert sorted(computed) == ["o/base", "o/top"]
+
+
+def test_removing_an_edge_invalidates_the_closures_it_shrinks():
+    result = diamond()
+    assert result.affected_count(url("base")) == 3
+    assert result.dependents_of(url("left")) == [("o/top", 1)]
+
+    result.update_inputs(url("top"), [url("right")])
+
+    assert result.dependents_of(url("base")) == [
+        ("o/left", 1),
+        ("o/right", 1),
+        ("o/top", 2),
+    ]
+    assert result.dependents_of(url("left")) == []
+    result.unregister(url("right"))
+    assert result.dependents_of(url("base")) == [("o/left", 1)]
+
+
+def test_closures_not_reaching_the_changed_edge_stay_cached(monkeypatch):
+    result = graph({"a": [], "b": ["a"], "x": [], "y": ["x"]})
+    assert result.dependents_of(url("x")) == [("o/y", 1)]
+    computed = []
+    compute = result._compute_closure
+    monkeypatch.setattr(
+        result, "_compute_closure", lambda root: computed.append(root) or compute(root)
+    )
+
+    result.update_inputs(url("c"), [url("b")])
+
+    assert result.dependents_of(url("x")) == [("o/y", 1)]
+    assert computed == []
+
+
+def test_cycles_reports_each_strongly_connected_component():
+    result = graph(
+        {
+            "a": ["c"],
+            "b": ["a"],
+            "c": ["b"],
+            "d": ["a"],
+            "e": ["f"],
+            "f": ["e"],
+            # self references are dropped, not reported.
+            "g": ["g"],
+        }
+    )
+
+    assert sorted(result.cycles()) == [["o/a", "o/b", "o/c"], ["o/e", "o/f"]]
+    assert result.in_same_cycle(url("a"), url("c"))
+    assert not result.in_same_cycle(url("a"), url("d"))
+    assert not result.in_same_cycle(url("a"), url("e"))
+
+
+def test_breaking_a_cycle_clears_it():
+    result = graph({"base": [], "a": ["base", "b"], "b": ["a"], "c": ["a"]})
+    assert result.cycles() == [["o/a", "o/b"]]
+    assert result.in_same_cycle(url("a"), url("b"))
+    # members of the cycle, and what uses them, cannot be ordered: they are left out.
+    assert result.dependents_of(url("base")) == []
+
+    result.update_inputs(url("b"), [])
+
+    assert result.cycles() == []
+    assert not result.in_same_cycle(url("a"), url("b"))
+    assert result.dependents_of(url("base")) == [("o/a", 1), ("o/c", 2)]
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,138 @@
+# vim: set fileencoding=utf-8
+"""
+tests/test_flake_lock_updater.py
+
+This file tests the FlakeLockUpdater class, against a stub nix.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+import os
+from pythoneda.shared.artifact import FlakeLockUpdater
+import stat
+import time
+
+
+def stub_nix(folder, body: str) -> str:
+    """
+    Writes a nix executable running given shell code.
+    :param folder: Where to write it.
+    :type folder: pathlib.Path
+    :param body: The shell code.
+    :type body: str
+    :return: The path of the stub.
+    :rtype: str
+    """
+    result = folder / "nix"
+    result.write_text(f"#!/bin/sh\n{body}\n")
+    result.chmod(result.stat().st_mode | stat.S_IXUSR)
+    return str(result)
+
+
+def flake_folders(folder, count: int):
+    """
+    Creates some flake folders.
+    :param folder: The parent folder.
+    :type folder: pathlib.Path
+    :param count: How many.
+    :type count: int
+    :return: The folders.
+    :rtype: List[str]
+    """
+    result = []
+    for index in range(count):
+        flake = folder / f"flake{index}"
+        flake.mkdir()
+        (flake / "flake.lock").write_text("{}")
+        result.append(str(flake))
+    return result
+
+
+def test_update_locks_tells_which_locks_changed(tmp_path):
+    nix = stub_nix(
+        tmp_path,
+        'case "$PWD" in *flake0) echo changed > flake.lock;; esac',
+    )
+    folders = flake_folders(tmp_path, 3)
+    updater = FlakeLockUpdater(workers=2, nix=nix)
+
+    result = asyncio.run(updater.update_locks(folders))
+
+    assert result == {folders[0]: True, folders[1]: False, folders[2]: False}
+
+
+def test_update_lock_reports_nix_failures(tmp_path):
+    nix = stub_nix(tmp_path, "echo broken >&2; exit 1")
+    folders = flake_folders(tmp_path, 1)
+
+    result = asyncio.run(FlakeLockUpdater(workers=1, nix=nix).update_lock(folders[0]))
+
+    assert result is None
+
+
+def test_updates_run_at_most_workers_at_once(tmp_path):
+    nix = stub_nix(
+        tmp_path,
+        f'touch "{tmp_path}/running.$$"; '
+        f'ls "{tmp_path}" | grep -c "^running" >> "{tmp_path}/counts"; '
+        f'sleep 0.2; rm "{tmp_path}/running.$$"',
+    )
+    folders = flake_folders(tmp_path, 4)
+
+    asyncio.run(FlakeLockUpdater(workers=2, nix=nix).update_locks(folders))
+
+    counts = [int(line) for line in (tmp_path / "counts").read_text().split()]
+    assert len(counts) == 4
+    assert max(counts) <= 2
+
+
+def test_timeout_kills_the_nix_process_group(tmp_path, monkeypatch):
+    monkeypatch.setenv("PYTHONEDA_TIMEOUT_NIX", "0.3")
+    nix = stub_nix(tmp_path, f'sleep 30 & echo $! > "{tmp_path}/child"; wait')
+    folders = flake_folders(tmp_path, 1)
+
+    started = time.monotonic()
+    result = asyncio.run(FlakeLockUpdater(workers=1, nix=nix).update_lock(folders[0]))
+
+    assert result is None
+    assert time.monotonic() - started < 10
+    child = int((tmp_path / "child").read_text())
+    time.sleep(0.1)
+    # the grandchild is gone too, not just the stub.
+    assert not os.path.exists(f"/proc/{child}") or "Z" in open(
+        f"/proc/{child}/stat"
+    ).read().split(")")[1].split()[0]
+
+
+def test_waiting_for_a_slot_does_not_eat_the_timeout(tmp_path, monkeypatch):
+    monkeypatch.setenv("PYTHONEDA_TIMEOUT_NIX", "0.6")
+    nix = stub_nix(tmp_path, "sleep 0.4")
+    folders = flake_folders(tmp_path, 2)
+
+    result = asyncio.run(FlakeLockUpdater(workers=1, nix=nix).update_locks(folders))
+
+    # the second update waits ~0.4s for the first, yet still gets its 0.6s.
+    assert result == {folders[0]: False, folders[1]: False}
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
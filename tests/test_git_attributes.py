@@ -0,0 +1,141 @@
+# vim: set fileencoding=utf-8
+"""
+tests/test_git_attributes.py
+
+This file tests the GitAttributes class, against git check-attr on the same fixtures.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from pythoneda.shared.artifact import GitAttributes
+import pytest
+import subprocess
+
+# attribute files of the fixture repository, by path.
+FIXTURE = {
+    ".gitattributes": "\n".join(
+        [
+            "# comment",
+            "[attr]generated linguist-generated -diff",
+            ".gitattributes def=https://github.com/owner/repo-def",
+            "*.py text eol=lf",
+            "/top.txt -text",
+            "*.png binary",
+            "**/gen/** generated",
+            "docs/**/*.rst kind=doc",
+            "[ab].c cls",
+            "?.q single",
+            '"with space.txt" spaced',
+            "build/ ignored-dir",
+            "*.txt text",
+            "late.txt !text",
+            "",
+        ]
+    ),
+    "sub/.gitattributes": "\n".join(
+        [
+            "[attr]local-macro whatever",
+            "*.md diff=markdown",
+            "*.py eol=crlf",
+            "/anchored.c anchored",
+            "deep/*.txt deep",
+            "macro.txt local-macro",
+            "",
+        ]
+    ),
+    ".git/info/attributes": "*.lock -diff merge=ours\n",
+}
+
+# path, and why it's in the table.
+PATHS = [
+    (".gitattributes", "attribute on the attributes file itself"),
+    ("a.py", "basename pattern"),
+    ("sub/b.py", "a subfolder overrides the top level"),
+    ("top.txt", "anchored pattern, overridden by a later basename one"),
+    ("sub/top.txt", "anchored patterns don't match in subfolders"),
+    ("image.png", "builtin binary macro"),
+    ("src/gen/x.c", "leading and trailing **, with a user macro"),
+    ("gen/x.c", "leading ** matching no folder"),
+    ("docs/a/b/c.rst", "** in the middle"),
+    ("docs/c.rst", "** in the middle matching no folder"),
+    ("a.c", "character class"),
+    ("c.c", "character class, no match"),
+    ("x.q", "single character wildcard"),
+    ("xy.q", "single character wildcard, no match"),
+    ("with space.txt", "quoted pattern"),
+    ("build/file", "patterns ending with a slash never match files"),
+    ("late.txt", "unspecified by a later line"),
+    ("sub/anchored.c", "pattern anchored to a subfolder"),
+    ("sub/x/anchored.c", "pattern anchored to a subfolder, deeper"),
+    ("sub/deep/a.txt", "pattern with a slash in a subfolder"),
+    ("sub/macro.txt", "macros defined in subfolders are ignored"),
+    ("sub/README.md", "value assignment"),
+    ("flake.lock", "info/attributes"),
+]
+
+
+def git_check_attr(folder, path: str):
+    """
+    Asks git for the attributes of given path.
+    :param folder: The repository folder.
+    :type folder: pathlib.Path
+    :param path: The path, relative to the folder.
+    :type path: str
+    :return: Each attribute, with "set", "unset" or its value.
+    :rtype: Dict[str, str]
+    """
+    output = subprocess.run(
+        ["git", "check-attr", "-z", "-a", "--", path],
+        cwd=folder,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    fields = output.split("\0")[:-1]
+    return {fields[i + 1]: fields[i + 2] for i in range(0, len(fields), 3)}
+
+
+@pytest.fixture(scope="module")
+def repository(tmp_path_factory):
+    """
+    Creates the fixture repository.
+    :param tmp_path_factory: The pytest factory of temporary folders.
+    :type tmp_path_factory: pytest.TempPathFactory
+    :return: The repository folder.
+    :rtype: pathlib.Path
+    """
+    result = tmp_path_factory.mktemp("attributes")
+    subprocess.run(["git", "init", "-q"], cwd=result, check=True)
+    for path, content in FIXTURE.items():
+        (result / path).parent.mkdir(parents=True, exist_ok=True)
+        (result / path).write_text(content)
+    return result
+
+
+@pytest.mark.parametrize("path, case", PATHS, ids=[path for path, _ in PATHS])
+def test_attributes_match_git_check_attr(repository, path, case):
+    assert GitAttributes(str(repository)).attributes(path) == git_check_attr(
+        repository, path
+    ), case
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,105 @@
+# vim: set fileencoding=utf-8
+"""
+tests/test_listener_profiler.py
+
+This file tests the ListenerProfiler class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+import os
+from pythoneda.shared.artifact import ListenerProfiler
+
+
+def listener_class(module: str):
+    """
+    Builds a listener class named StubListener, declared in given module.
+    :param module: The module.
+    :type module: str
+    :return: Such class.
+    :rtype: type
+    """
+
+    class StubListener:
+        def __init__(self, folder: str):
+            self.repository_folder = folder
+
+        async def listen(self, event):
+            return sum(range(20000))
+
+    StubListener.__module__ = module
+    StubListener.__qualname__ = "StubListener"
+    return StubListener
+
+
+def profile(profiler: ListenerProfiler, listeners):
+    """
+    Runs the listen method of given listeners under given profiler, and flushes it.
+    :param profiler: The profiler.
+    :type profiler: pythoneda.shared.artifact.ListenerProfiler
+    :param listeners: The listeners.
+    :type listeners: List
+    :return: The names of the files written.
+    :rtype: List[str]
+    """
+
+    async def scenario():
+        for listener in listeners:
+            await profiler.listen(listener, None)
+
+    asyncio.run(scenario())
+    profiler.flush()
+    return sorted(os.listdir(profiler._folder))
+
+
+def test_listeners_sharing_a_name_and_repository_name_get_their_own_files(tmp_path):
+    output = tmp_path / "profiles"
+    first = listener_class("org_a.listeners")
+    second = listener_class("org_b.listeners")
+    profiler = ListenerProfiler("cprofile", str(output))
+
+    names = profile(
+        profiler,
+        [
+            first(str(tmp_path / "org_a" / "shared")),
+            second(str(tmp_path / "org_a" / "shared")),
+            first(str(tmp_path / "org_b" / "shared")),
+        ],
+    )
+
+    assert len(names) == 3
+    assert all(f".{os.getpid()}-" in name for name in names)
+    assert sum(name.startswith("org_a.listeners.StubListener.") for name in names) == 2
+
+
+def test_successive_profilers_do_not_overwrite_each_other(tmp_path):
+    output = tmp_path / "profiles"
+    listener = listener_class("org_a.listeners")(str(tmp_path / "shared"))
+
+    profile(ListenerProfiler("cprofile", str(output)), [listener])
+    names = profile(ListenerProfiler("cprofile", str(output)), [listener])
+
+    assert len(names) == 2
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,97 @@
+# vim: set fileencoding=utf-8
+"""
+tests/test_registry_snapshot.py
+
+This file tests how ArtifactRepository loads a RegistrySnapshot.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from pythoneda.shared.artifact import RegistrySnapshot
+from pythoneda.shared.artifact.artifact_repository import ArtifactRepository
+from pythoneda.shared.artifact.registry_benchmark import RegistryBenchmark
+
+
+def scanner(count: int, scans: list):
+    """
+    Builds a scan of stand-in artifacts that counts how often it runs.
+    :param count: How many artifacts it finds.
+    :type count: int
+    :param scans: Gets one item per scan.
+    :type scans: list
+    :return: The scan.
+    :rtype: Callable
+    """
+
+    def scan():
+        scans.append(True)
+        return [
+            (artifact, None) for artifact in RegistryBenchmark.synthetic_artifacts(count)
+        ]
+
+    return scan
+
+
+def test_load_registry_scans_once_and_then_maps_the_snapshot(tmp_path):
+    path = str(tmp_path / "registry.snapshot")
+    scans = []
+
+    first = ArtifactRepository().load_registry(path, scanner(5, scans))
+    second = ArtifactRepository().load_registry(path, scanner(5, scans))
+
+    assert len(scans) == 1
+    assert isinstance(second, RegistrySnapshot)
+    assert [record.url for record in second.records()] == [
+        record.url for record in first.records()
+    ]
+    second.close()
+
+
+def test_load_registry_falls_back_to_a_scan_on_a_corrupt_snapshot(tmp_path):
+    path = tmp_path / "registry.snapshot"
+    scans = []
+    ArtifactRepository().load_registry(str(path), scanner(5, scans))
+    content = path.read_bytes()
+    # a torn write: the header and directory survive, the columns don't.
+    path.write_bytes(content[: len(content) // 2])
+
+    result = ArtifactRepository().load_registry(str(path), scanner(5, scans))
+
+    assert len(scans) == 2
+    assert len(result) == 5
+    reopened = RegistrySnapshot.open(str(path))
+    assert reopened is not None and len(reopened) == 5
+    reopened.close()
+
+
+def test_open_ignores_files_that_are_not_snapshots(tmp_path):
+    empty = tmp_path / "empty"
+    empty.write_bytes(b"")
+    garbage = tmp_path / "garbage"
+    garbage.write_bytes(b"PEDAREG\0" + bytes(range(256)) * 4)
+
+    assert RegistrySnapshot.open(str(empty)) is None
+    assert RegistrySnapshot.open(str(garbage)) is None
+    assert RegistrySnapshot.open(str(tmp_path)) is None
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,134 @@
+# vim: set fileencoding=utf-8
+"""
+tests/test_release_journal.py
+
+This file tests the ReleaseJournal class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import json
+import os
+from pythoneda.shared.artifact import ReleaseJournal
+
+
+def reopened(journal: ReleaseJournal) -> ReleaseJournal:
+    """
+    Opens given journal again from disk, as a restarted process would.
+    :param journal: The journal.
+    :type journal: pythoneda.shared.artifact.ReleaseJournal
+    :return: A new journal on the same file.
+    :rtype: pythoneda.shared.artifact.ReleaseJournal
+    """
+    return ReleaseJournal(journal.folder)
+
+
+def records(journal: ReleaseJournal):
+    """
+    Reads the records of given journal straight from its file.
+    :param journal: The journal.
+    :type journal: pythoneda.shared.artifact.ReleaseJournal
+    :return: The (op, step, key) of each record.
+    :rtype: List[Tuple[str, str, str]]
+    """
+    if not os.path.exists(journal.path):
+        return []
+    with open(journal.path, "r", encoding="utf-8") as file:
+        return [
+            (record["op"], record["step"], record["key"])
+            for record in map(json.loads, file)
+        ]
+
+
+def test_completed_steps_survive_a_restart(tmp_path):
+    journal = ReleaseJournal(str(tmp_path))
+    journal.begin("tag", "abc", {"branch": "main"})
+    journal.complete("tag", "abc", {"version": "0.0.1"})
+    journal.begin("push", "abc")
+
+    restarted = reopened(journal)
+
+    assert restarted.completed("tag", "abc") == {"version": "0.0.1"}
+    # begun, never finished.
+    assert restarted.completed("push", "abc") is None
+    assert restarted.completed("tag", "def") is None
+
+
+def test_abort_forgets_only_the_failed_step(tmp_path):
+    journal = ReleaseJournal(str(tmp_path))
+    journal.begin("tag", "abc")
+    journal.complete("tag", "abc", {"version": "0.0.1"})
+    journal.begin("push", "abc")
+
+    journal.abort("push", "abc")
+
+    assert records(journal) == [("begin", "tag", "abc"), ("complete", "tag", "abc")]
+    assert reopened(journal).completed("tag", "abc") == {"version": "0.0.1"}
+
+
+def test_supersede_discards_the_given_steps_of_other_releases(tmp_path):
+    journal = ReleaseJournal(str(tmp_path))
+    journal.begin("commit_version", "0.0.1")
+    journal.complete("commit_version", "0.0.1")
+    journal.begin("tag", "abc")
+    journal.begin("commit_version", "0.0.2")
+
+    journal.supersede("0.0.2", ["commit_version", "tag_version"])
+
+    assert records(journal) == [
+        ("begin", "tag", "abc"),
+        ("begin", "commit_version", "0.0.2"),
+    ]
+    assert reopened(journal).completed("commit_version", "0.0.1") is None
+
+
+def test_close_removes_the_file_once_nothing_is_left(tmp_path):
+    journal = ReleaseJournal(str(tmp_path))
+    journal.begin("tag", "abc")
+    journal.begin("tag", "def")
+
+    journal.close("abc")
+
+    assert records(journal) == [("begin", "tag", "def")]
+    journal.close("def")
+    assert not os.path.exists(journal.path)
+    assert not os.path.exists(f"{journal.path}.tmp")
+
+
+def test_a_torn_final_line_is_dropped_and_later_records_survive(tmp_path):
+    journal = ReleaseJournal(str(tmp_path))
+    journal.begin("tag", "abc")
+    journal.complete("tag", "abc", {"version": "0.0.1"})
+    with open(journal.path, "a", encoding="utf-8") as file:
+        file.write('{"op": "begin", "step": "pu')
+
+    restarted = reopened(journal)
+    restarted.begin("push", "abc")
+    restarted.complete("push", "abc")
+
+    again = reopened(journal)
+    assert again.completed("tag", "abc") == {"version": "0.0.1"}
+    assert again.completed("push", "abc") == {}
+    assert len(records(journal)) == 4
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,117 @@
+# vim: set fileencoding=utf-8
+"""
+tests/test_repository_folder_helper.py
+
+This file tests how the RepositoryFolderHelper class reads git references.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+from pythoneda.shared.artifact import ArtifactEventListener, RepositoryFolderHelper
+import subprocess
+
+
+def git(folder, *args: str) -> str:
+    """
+    Runs git in given folder.
+    :param folder: The folder.
+    :type folder: pathlib.Path
+    :param args: The git arguments.
+    :type args: List[str]
+    :return: Its output, stripped.
+    :rtype: str
+    """
+    return subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@t"] + list(args),
+        cwd=folder,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+def tagged_repository(folder) -> str:
+    """
+    Creates a repository with an annotated tag on its first commit, and a second commit.
+    :param folder: The folder.
+    :type folder: pathlib.Path
+    :return: The tagged commit.
+    :rtype: str
+    """
+    git(folder, "init", "-q")
+    (folder / "file").write_text("one")
+    git(folder, "add", ".")
+    git(folder, "commit", "-q", "-m", "one")
+    git(folder, "tag", "-a", "0.0.1", "-m", "0.0.1")
+    result = git(folder, "rev-parse", "HEAD")
+    (folder / "file").write_text("two")
+    git(folder, "commit", "-q", "-am", "two")
+    return result
+
+
+def test_resolve_ref_peels_loose_annotated_tags(tmp_path):
+    tagged = tagged_repository(tmp_path)
+
+    result = RepositoryFolderHelper.resolve_ref(str(tmp_path), "refs/tags/0.0.1")
+
+    assert result == tagged
+
+
+def test_resolve_ref_peels_annotated_tags_whose_object_is_packed(tmp_path):
+    tagged = tagged_repository(tmp_path)
+    # the ref stays loose, the tag object moves to a pack, like after a fetch.
+    git(tmp_path, "repack", "-a", "-d", "-q")
+    git(tmp_path, "prune-packed")
+    tag = git(tmp_path, "rev-parse", "refs/tags/0.0.1")
+    assert not os.path.exists(tmp_path / ".git" / "objects" / tag[:2] / tag[2:])
+
+    result = RepositoryFolderHelper.resolve_ref(str(tmp_path), "refs/tags/0.0.1")
+
+    assert result == tagged
+
+
+def test_resolve_ref_peels_packed_annotated_tags(tmp_path):
+    tagged = tagged_repository(tmp_path)
+    git(tmp_path, "pack-refs", "--all")
+    git(tmp_path, "repack", "-a", "-d", "-q")
+    git(tmp_path, "prune-packed")
+    assert not os.path.exists(tmp_path / ".git" / "refs" / "tags" / "0.0.1")
+
+    result = RepositoryFolderHelper.resolve_ref(str(tmp_path), "refs/tags/0.0.1")
+
+    assert result == tagged
+
+
+def test_revision_to_hash_falls_back_to_head_only_for_absent_tags(tmp_path):
+    tagged = tagged_repository(tmp_path)
+    git(tmp_path, "repack", "-a", "-d", "-q")
+    git(tmp_path, "prune-packed")
+    listener = ArtifactEventListener(str(tmp_path))
+
+    assert listener.revision_to_hash(str(tmp_path), "0.0.1") == tagged
+    assert listener.revision_to_hash(str(tmp_path), "0.0.2") == git(
+        tmp_path, "rev-parse", "HEAD"
+    )
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
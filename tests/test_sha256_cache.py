@@ -0,0 +1,85 @@
+# vim: set fileencoding=utf-8
+"""
+tests/test_sha256_cache.py
+
+This file tests the Sha256Cache class.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+from pythoneda.shared.artifact import Sha256Cache
+
+
+def entry_size(tmp_path) -> int:
+    """
+    Measures how much a cache entry takes.
+    :param tmp_path: A scratch folder.
+    :type tmp_path: pathlib.Path
+    :return: The size of an entry, in bytes.
+    :rtype: int
+    """
+    cache = Sha256Cache(str(tmp_path / "probe"), 1 << 20)
+    cache.put("https://github.com/o/r/0.0.1", "0" * 40, "sha256-x")
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(cache.folder)
+        for name in files
+    )
+
+
+def test_rewriting_an_entry_does_not_grow_the_cache(tmp_path, monkeypatch):
+    size = entry_size(tmp_path)
+    cache = Sha256Cache(str(tmp_path / "cache"), 3 * size)
+    cache.put("https://github.com/o/r/0.0.1", "0" * 40, "sha256-x")
+    cache.put("https://github.com/o/r/0.0.2", "1" * 40, "sha256-x")
+    evictions = []
+    monkeypatch.setattr(cache, "evict", lambda: evictions.append(True))
+
+    for _ in range(10):
+        cache.put("https://github.com/o/r/0.0.1", "0" * 40, "sha256-x")
+
+    assert evictions == []
+
+
+def test_evict_leaves_writes_in_progress_alone(tmp_path):
+    size = entry_size(tmp_path)
+    cache = Sha256Cache(str(tmp_path / "cache"), 2 * size)
+    os.makedirs(cache.folder, exist_ok=True)
+    in_progress = os.path.join(cache.folder, "entry.123.456.tmp")
+    with open(in_progress, "w", encoding="utf-8") as file:
+        file.write("x" * size)
+    os.utime(in_progress, (0, 0))
+
+    for index in range(3):
+        cache.put(f"https://github.com/o/r/0.0.{index}", str(index) * 40, "sha256-x")
+
+    assert os.path.exists(in_progress)
+    # the in-progress write does not count against the limit either.
+    hits = [
+        cache.get(f"https://github.com/o/r/0.0.{index}", str(index) * 40)
+        for index in range(3)
+    ]
+    assert hits.count("sha256-x") == 2
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
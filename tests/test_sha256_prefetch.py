@@ -0,0 +1,120 @@
+# vim: set fileencoding=utf-8
+"""
+tests/test_sha256_prefetch.py
+
+This file tests how CommitTag and StageInputUpdate share prefetched hashes.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+import os
+from pythoneda.shared.artifact import (
+    CommitTag,
+    RepositoryFolderHelper,
+    Sha256Cache,
+    Sha256Prefetcher,
+    StageInputUpdate,
+)
+import subprocess
+
+
+def git(folder, *args: str) -> str:
+    """
+    Runs git in given folder.
+    :param folder: The folder.
+    :type folder: pathlib.Path
+    :param args: The git arguments.
+    :type args: List[str]
+    :return: Its output, stripped.
+    :rtype: str
+    """
+    return subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@t"] + list(args),
+        cwd=folder,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+def repository(folder, files) -> str:
+    """
+    Creates a repository with one commit.
+    :param folder: The folder.
+    :type folder: pathlib.Path
+    :param files: The contents of the files, by name.
+    :type files: Dict[str, str]
+    :return: The folder.
+    :rtype: str
+    """
+    folder.mkdir()
+    git(folder, "init", "-q")
+    for name, content in files.items():
+        (folder / name).write_text(content)
+    git(folder, "add", ".")
+    git(folder, "commit", "-q", "-m", "initial")
+    return str(folder)
+
+
+def test_dependents_find_what_the_tagger_prefetched_in_the_def_repository(
+    tmp_path, monkeypatch
+):
+    source_url = "https://github.com/owner/source"
+    def_url = "https://github.com/owner/source-def"
+    source = repository(
+        tmp_path / "source", {".gitattributes": f".gitattributes def={def_url}\n"}
+    )
+    definition = repository(tmp_path / "source-def", {"flake.nix": "{ }\n"})
+    git(definition, "tag", "-a", "0.0.1", "-m", "0.0.1")
+    dependent = repository(tmp_path / "dependent", {"flake.nix": "{ }\n"})
+    clones = {source_url: source, def_url: definition}
+    monkeypatch.setattr(
+        RepositoryFolderHelper,
+        "find_out_repository_folder",
+        classmethod(lambda cls, folder, url: clones.get(url, None)),
+    )
+    hashed = []
+
+    def hash_path(self, path):
+        hashed.append(sorted(os.listdir(path)))
+        return "sha256-prefetched"
+
+    monkeypatch.setattr(Sha256Prefetcher, "_hash_path", hash_path)
+    monkeypatch.setattr(
+        Sha256Prefetcher,
+        "_instance",
+        Sha256Prefetcher(Sha256Cache(str(tmp_path / "cache")), 1),
+    )
+
+    CommitTag(source).prefetch_tagged_sha256(source_url, "0.0.1", source)
+    found = asyncio.run(
+        StageInputUpdate(dependent).prefetched_sha256(source_url, "0.0.1")
+    )
+
+    tagged = git(definition, "rev-parse", "0.0.1^{commit}")
+    # the sources of the def repository, not the source one.
+    assert hashed == [["flake.nix"]]
+    assert found == (tagged, "sha256-prefetched")
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End:
@@ -0,0 +1,116 @@
+# vim: set fileencoding=utf-8
+"""
+tests/test_stage_pipeline.py
+
+This file tests the StagePipeline class, against stub artifacts.
+
+Copyright (C) 2024-today rydnr's pythoneda-shared-artifact/shared
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+import json
+from pythoneda.shared.artifact import StageHistory, StagePipeline
+from pythoneda.shared.artifact.events import ChangeStaged, StagedChangesCommitted
+
+
+class StubArtifact:
+    """
+    Stands in for an artifact in the commit stage.
+    """
+
+    def __init__(self, url: str, commits: bool):
+        """
+        Creates a new StubArtifact instance.
+        :param url: The url of its repository.
+        :type url: str
+        :param commits: Whether it reacts to the changes, or ignores them.
+        :type commits: bool
+        """
+        self.url = url
+        self.commits = commits
+
+    async def commit_after_ChangeStaged(self, event):
+        """
+        Reacts to given ChangeStaged event.
+        :param event: The event.
+        :type event: pythoneda.shared.artifact.events.ChangeStaged
+        :return: A StagedChangesCommitted event if it commits, None otherwise.
+        :rtype: pythoneda.shared.artifact.events.StagedChangesCommitted
+        """
+        await asyncio.sleep(0.01)
+        if not self.commits:
+            return None
+        return StagedChangesCommitted(None, "rev", event.id)
+
+
+def run_pipeline(artifacts, history: StageHistory):
+    """
+    Feeds one ChangeStaged event to given artifacts, recording the durations.
+    :param artifacts: The artifacts.
+    :type artifacts: List[StubArtifact]
+    :param history: Where to record the durations.
+    :type history: pythoneda.shared.artifact.StageHistory
+    """
+
+    async def run():
+        pipeline = StagePipeline(
+            artifacts,
+            chain=False,
+            onTimed=lambda artifact, stage, seconds: history.record(
+                artifact.url, stage, seconds
+            ),
+        )
+        pipeline.start()
+        await pipeline.submit(ChangeStaged(None))
+        await pipeline.join()
+        await pipeline.stop()
+
+    asyncio.run(run())
+
+
+def test_jobs_that_emit_nothing_leave_the_history_alone(tmp_path):
+    history = StageHistory()
+
+    run_pipeline([StubArtifact("https://github.com/a/b", False)], history)
+
+    history.save(str(tmp_path / "history.json"))
+    assert json.loads((tmp_path / "history.json").read_text()) == {}
+
+
+def test_jobs_that_emit_an_event_are_recorded(tmp_path):
+    history = StageHistory()
+
+    run_pipeline(
+        [
+            StubArtifact("https://github.com/a/idle", False),
+            StubArtifact("https://github.com/a/busy", True),
+        ],
+        history,
+    )
+
+    history.save(str(tmp_path / "history.json"))
+    averages = json.loads((tmp_path / "history.json").read_text())
+    assert list(averages) == ["a/busy"]
+    assert list(averages["a/busy"]) == ["commit"]
+
+
+# vim: syntax=python ts=4 sw=4 sts=4 tw=79 sr et
+# Local Variables:
+# mode: python
+# python-indent-offset: 4
+# tab-width: 4
+# indent-tabs-mode: nil
+# fill-column: 79
+# End: